@@ -1,13 +1,19 @@
 
+import itertools
+import os
 import streamlit as st
-from src.retrieval.retrieval import retrieve_notes
-from src.generation.generator import AnswerGenerator
+from src.pipeline import get_pipeline
 from src.utils.logger import get_logger
+from src.utils.tracing import start_metrics_server, start_trace
 import time
+import uuid
 
 # 初始化日志
 logger = get_logger(__name__)
 
+# 设置了 METRICS_PORT 时在后台提供 Prometheus 指标接口（进程内只启动一次）
+start_metrics_server()
+
 # 页面配置
 st.set_page_config(
     page_title="Get笔记RAG问答系统",
@@ -86,6 +92,9 @@ with st.sidebar:
 # 初始化会话状态（存储聊天历史）
 if "messages" not in st.session_state:
     st.session_state.messages = []
+# 会话 ID 用于在服务端保存该会话的对话记忆（最近对话 + 更早对话的摘要）
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 st.title("健医融合・科学健康管理系统")
 st.markdown("-----")
 
@@ -117,96 +126,65 @@ with col2:
                 with st.chat_message("user"):
                     st.write(question)
 
-                # 2. 准备发送给 AI 的完整上下文（最近 5 轮对话）
-                history_text = ""
-                for msg in st.session_state.messages[-5:]: # 只取最近 5 轮，防止太长
-                    role = "用户" if msg["role"] == "user" else "助手"
-                    history_text += f"{role}: {msg['content']}\n"
-
-                # 显示加载动画
-                with st.spinner("正在结合历史记忆生成回答..."):
-                    generator = AnswerGenerator()
-                    # 先检索笔记 (保持原有逻辑)
-                    notes = retrieve_notes(question, top_k=3)
-                    
-                    # 调用后端，传入 history_text
-                    result = generator.generate(query=question, notes=notes, history=history_text) 
-                
+                # 整个问答过程使用同一个请求 ID，检索、API 请求和生成的各阶段耗时与 token 数导出到 logs/traces.jsonl
+                top_k = int(os.getenv("TOP_K", "3"))
+                with start_trace(name="qa", top_k=top_k) as trace:
+                    # 2. 交给问答流水线：检索进行的同时准备历史对话、提示模板并预热 LLM 连接
+                    # 当前问题已通过 query 单独传入，历史中只包含之前的对话
+                    stream = get_pipeline().run_stream(question, st.session_state.messages[:-1], top_k=top_k,
+                                                     session_id=st.session_state.session_id)
+
+                    # 3. 流式显示 AI 回答，最后一项为包含引用信息和各阶段耗时的结果字典
+                    result = {}
+
+                    def answer_tokens():
+                        for item in stream:
+                            if isinstance(item, dict):
+                                result.update(item)
+                            else:
+                                yield item
+
+                    tokens = answer_tokens()
+                    with st.spinner("正在检索相关笔记..."):
+                        # 检索完成、生成出首个片段后再结束加载动画
+                        first_token = next(tokens, "")
+
+                    with st.chat_message("assistant"):
+                        st.write_stream(itertools.chain([first_token], tokens))
+                        if result.get("degraded"):
+                            # 知识库服务熔断或请求失败：立即提示，而不是让用户等满超时
+                            st.warning("⚠️ 知识库服务暂时不可用，已切换为降级模式，请稍后重试。")
+                        if result.get("answered_by") == "getnote":
+                            st.caption("Get笔记 AI 综合回答已足够，本次未调用大模型生成")
+                        elif result.get("answered_by") == "cache":
+                            st.caption("相同问题和笔记内容的回答已缓存，本次未调用大模型生成")
+                        references = result.get("references", [])
+                        if references:
+                            with st.expander("📖 查看相关笔记"):
+                                st.write([dict(reference) for reference in references])
+                        timings = result.get("timings", {})
+                        if timings:
+                            st.caption(f"请求ID {trace.request_id}｜耗时：" +
+                                       "，".join(f"{name} {value:.2f}s" for name, value in timings.items()))
+
                 answer = result.get("answer", "")
-                references = result.get("references", [])
 
-                # 3. 将 AI 回答加入历史记录
+                # 4. 将 AI 回答加入历史记录
                 st.session_state.messages.append({"role": "assistant", "content": answer})
-
-                # 4. 显示 AI 回答
-                with st.chat_message("assistant"):
-                    st.write(answer)
-                    if references:
-                        with st.expander("📖 查看相关笔记"):
-                            st.write(references)
                     
                 # 更新右侧参考依据
-                notes_placeholder.info("已基于知识库及历史对话生成综合回答")
+                if result.get("degraded") and result.get("references"):
+                    notes_placeholder.warning("知识库服务暂时不可用，本次回答基于本地镜像中的笔记")
+                elif result.get("degraded"):
+                    notes_placeholder.warning("知识库服务暂时不可用，本次回答未引用知识库内容")
+                else:
+                    notes_placeholder.info("已基于知识库及历史对话生成综合回答")
 
             except Exception as e:
                 st.error(f"❌ 系统出错：{str(e)}")
                 # 如果出错，移除刚才添加的用户消息，避免脏数据
                 if st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
                     st.session_state.messages.pop() 
-                
-                # 3. 展示结果
-                st.subheader("💡 回答结果")
-                
-                if has_ai_answer:
-                    # 展示 AI 回答
-                    st.markdown('<div class="answer-box">', unsafe_allow_html=True)
-                    st.markdown("### 回答")
-                    # 处理换行符，让文本更易读
-                    formatted_answer = ai_answer_content.replace('\\n', '\n').replace('\n\n', '\n\n')
-                    st.write(formatted_answer)
-                    st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    # 如果有普通笔记片段，也显示在右侧
-                    if regular_notes:
-                        notes_placeholder.subheader("参考笔记片段")
-                        for i, note in enumerate(regular_notes):
-                            title = note.get("title", f"笔记片段 {i+1}")
-                            snippet = note.get("content", note.get("snippet", "无内容"))
-                            # 截断过长的片段
-                            if len(snippet) > 200:
-                                snippet = snippet[:200] + "..."
-                            
-                            notes_placeholder.markdown(f"""
-                            <div class="note-card">
-                                <div class="note-title">{title}</div>
-                                <div class="note-snippet">{snippet}</div>
-                            </div>
-                            """, unsafe_allow_html=True)
-                    else:
-                        notes_placeholder.success("AI 已基于知识库生成综合回答")
-                        
-                elif regular_notes:
-                    # 没有 AI 回答，但有普通笔记
-                    st.markdown('<div class="answer-box">', unsafe_allow_html=True)
-                    st.markdown("### 找到以下相关笔记：")
-                    for i, note in enumerate(regular_notes):
-                        title = note.get("title", f"笔记片段 {i+1}")
-                        snippet = note.get("content", note.get("snippet", "无内容"))
-                        st.markdown(f"**{title}**:")
-                        st.write(snippet)
-                        st.markdown("---")
-                    st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    notes_placeholder.subheader("相关笔记列表")
-                    for i, note in enumerate(regular_notes):
-                        title = note.get("title", f"笔记片段 {i+1}")
-                        notes_placeholder.markdown(f"- {title}")
-                        
-                else:
-                    # 完全没有结果
-                    st.warning("抱歉，未检索到与您的问题相关的笔记内容。请尝试调整问题表述或提供更多关键词。")
-                    notes_placeholder.warning("无相关笔记")
-                    
        
 # 页脚
 st.markdown("---")
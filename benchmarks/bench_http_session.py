@@ -0,0 +1,78 @@
+"""
+HTTP 连接复用基准测试
+
+对比每次调用 requests.post（每次新建连接）与共享连接池会话的 p50/p99 延迟。
+两种方式都经过 GetNoteAPI.search_notes，使用本地桩服务，不访问真实 API：
+
+    python -m benchmarks.bench_http_session --requests 500
+
+注意：本地桩服务使用明文 HTTP，真实环境下每次新建连接还需额外的 TLS 握手，差距会更大。
+"""
+import argparse
+import logging
+import os
+import statistics
+import time
+
+import requests
+
+from tests.stub_server import StubServer
+
+
+def percentile(samples, pct):
+    """
+    计算百分位数（最近秩法）
+    """
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def report(label, samples):
+    print(f"{label:<20} p50={percentile(samples, 50) * 1000:7.2f}ms  "
+          f"p99={percentile(samples, 99) * 1000:7.2f}ms  mean={statistics.mean(samples) * 1000:7.2f}ms")
+
+
+class PerCallSession:
+    """
+    模拟旧实现：每次请求都调用模块级 requests.post
+    """
+
+    def post(self, url, **kwargs):
+        return requests.post(url, **kwargs)
+
+
+def run(api, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        api.search_notes("如何通过饮食改善高血压？")
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    # 基准只关注网络开销，屏蔽日志输出
+    logging.disable(logging.CRITICAL)
+
+    with StubServer() as server:
+        os.environ.setdefault("API_KEY", "bench")
+        os.environ.setdefault("KB_ID", "bench")
+        os.environ["GETNOTE_BASE_URL"] = server.base_url
+
+        from src.api.get_api import GetNoteAPI, build_session
+
+        for label, session in (("requests.post (旧)", PerCallSession()), ("共享会话 (新)", build_session())):
+            api = GetNoteAPI(session=session)
+            run(api, 10)  # 预热
+            before = server.connections
+            report(label, run(api, args.requests))
+            print(f"{'':<20} 新建连接数={server.connections - before}")
+
+
+if __name__ == "__main__":
+    main()
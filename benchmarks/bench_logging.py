@@ -0,0 +1,122 @@
+"""
+请求路径上的日志开销基准测试
+
+模拟 search_notes 每次请求写出的日志：若干条普通日志 + 一条完整的 API 原始响应。
+对比三种方式在调用线程中的耗时（只统计请求线程，不含后台线程的写入时间）：
+
+- 旧实现：同步 FileHandler + StreamHandler，INFO 级别 f-string 格式化完整响应
+- 仅队列：QueueHandler/QueueListener 后台写入，仍以 INFO 级别格式化完整响应
+- 新实现：后台写入，完整响应通过 log_payload 惰性记录（INFO 级别下不格式化）
+
+日志写到临时目录，控制台输出写到 os.devnull：
+
+    python -m benchmarks.bench_logging --requests 2000 --refs 50
+"""
+import argparse
+import logging
+import os
+import queue
+import tempfile
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+
+
+def build_payload(refs: int):
+    from tests.stub_server import make_search_response
+    return make_search_response(
+        "这是一个测试回答。" * 20,
+        [{"title": f"测试笔记{i}", "content": "笔记内容片段，包含较长的正文。" * 20} for i in range(refs)],
+    )
+
+
+def make_handlers(directory: str, name: str, devnull):
+    from src.utils.logger import RequestIdFilter, log_format
+    file_handler = RotatingFileHandler(os.path.join(directory, f"{name}.log"), maxBytes=64 * 1024 * 1024,
+                                       backupCount=1, encoding="utf-8")
+    console_handler = logging.StreamHandler(devnull)
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(logging.Formatter(log_format))
+        handler.addFilter(RequestIdFilter())
+    return [file_handler, console_handler]
+
+
+def make_logger(name: str, handlers) -> logging.Logger:
+    logger = logging.getLogger(f"bench.{name}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    for handler in handlers:
+        logger.addHandler(handler)
+    return logger
+
+
+def measure(fn, requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        fn()
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--refs", type=int, default=50, help="模拟响应中的引用条数")
+    args = parser.parse_args()
+
+    from src.utils.logger import DeferredQueueHandler, RequestIdFilter, log_payload
+
+    result = build_payload(args.refs)
+    payload = {"question": "如何通过饮食改善高血压？", "kb_id": "bench"}
+    print(f"模拟响应大小：{len(str(result)) / 1024:.1f} KB")
+
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w", encoding="utf-8") as devnull:
+        # 旧实现：请求线程同步写文件和控制台
+        old_logger = make_logger("sync", make_handlers(directory, "sync", devnull))
+
+        def old_request():
+            old_logger.info(f"开始搜索笔记，查询：{payload['question']}")
+            old_logger.debug(f"请求参数：{payload}")
+            old_logger.info(f"API 返回原始结果：{result}")
+            old_logger.info("成功从 'c.answers' 提取到 AI 回答！")
+
+        # 后台线程写入
+        listeners = []
+
+        def queued_logger(name):
+            log_queue = queue.SimpleQueue()
+            queue_handler = DeferredQueueHandler(log_queue)
+            queue_handler.addFilter(RequestIdFilter())
+            listener = QueueListener(log_queue, *make_handlers(directory, name, devnull), respect_handler_level=True)
+            listener.start()
+            listeners.append(listener)
+            return make_logger(name, [queue_handler])
+
+        queue_logger = queued_logger("queue")
+
+        def queue_request():
+            queue_logger.info(f"开始搜索笔记，查询：{payload['question']}")
+            queue_logger.debug(f"请求参数：{payload}")
+            queue_logger.info(f"API 返回原始结果：{result}")
+            queue_logger.info("成功从 'c.answers' 提取到 AI 回答！")
+
+        lazy_logger = queued_logger("lazy")
+
+        def lazy_request():
+            lazy_logger.info(f"开始搜索笔记，查询：{payload['question']}")
+            lazy_logger.debug("请求参数：%s", payload)
+            log_payload(lazy_logger, "API 返回原始结果：", result)
+            lazy_logger.info("成功从 'c.answers' 提取到 AI 回答！")
+
+        old = measure(old_request, args.requests)
+        queued = measure(queue_request, args.requests)
+        lazy = measure(lazy_request, args.requests)
+        for listener in listeners:
+            listener.stop()
+
+    print(f"同步写入 + 完整响应 (旧)   {old * 1e6:9.1f} µs/请求")
+    print(f"队列写入 + 完整响应         {queued * 1e6:9.1f} µs/请求")
+    print(f"队列写入 + 惰性响应 (新)   {lazy * 1e6:9.1f} µs/请求")
+    print(f"加速比                      {old / lazy:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+检索结果数据模型基准测试
+
+构造包含大量引用片段的 knowledge/search 响应（多个片段来自同一篇笔记，带有接口返回的其他字段），
+对比旧实现（每条引用复制为新字典）与 normalize_search_result（Note，__slots__ + 标题驻留）：
+
+- 解析 + 规范化：json.loads 与转换为笔记列表的耗时
+- 内存：规范化结果常驻内存的大小（tracemalloc，不含共享的正文字符串）
+- 交给生成器：提取引用信息的耗时（旧实现逐条 .get()，新实现直接读取属性）
+
+    python -m benchmarks.bench_note_model --refs 20000 --repeat 5
+"""
+import argparse
+import gc
+import json
+import logging
+import random
+import time
+import tracemalloc
+
+
+def legacy_normalize(result):
+    """
+    改动前的 c.refs 解析逻辑
+    """
+    combined = []
+    answers = result["c"].get("answers", "")
+    if answers:
+        combined.append({"content": answers, "source": "Get 笔记 AI 生成", "title": "AI 综合回答"})
+    for ref in result["c"].get("refs", []):
+        combined.append({
+            "title": ref.get("title", "未知标题"),
+            "content": ref.get("content", ""),
+            "source": "原始笔记片段"
+        })
+    return combined
+
+
+def legacy_references(notes):
+    return [{"id": note.get('id'), "title": note.get('title'), "relevance_score": note.get('relevance_score'),
+             "reference_id": f"笔记{i}"} for i, note in enumerate(notes, 1)]
+
+
+def build_body(refs: int, titles: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    chars = [chr(code) for code in range(0x4E00, 0x4E00 + 3000)]
+    items = []
+    for i in range(refs):
+        t = rng.randrange(titles)
+        items.append({"title": f"笔记{t}：关于健康管理的记录",
+                      "content": "".join(rng.choices(chars, k=120)),
+                      "note_id": f"n{t}", "highlight": [], "created_at": "2026-01-01 00:00:00"})
+    return json.dumps({"c": {"answers": "综合回答。" * 50, "refs": items}}, ensure_ascii=False).encode("utf-8")
+
+
+def measure(label, body, normalize, references, repeat):
+    gc.collect()
+    parse_time = normalize_time = refs_time = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = json.loads(body)
+        parse_time += time.perf_counter() - start
+        start = time.perf_counter()
+        notes = normalize(result)
+        normalize_time += time.perf_counter() - start
+        start = time.perf_counter()
+        references(notes)
+        refs_time += time.perf_counter() - start
+
+    # 只统计规范化新分配的内存，正文字符串与解析结果共享
+    result = json.loads(body)
+    tracemalloc.start()
+    notes = normalize(result)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} 解析 {parse_time / repeat * 1000:8.1f} ms  规范化 {normalize_time / repeat * 1000:8.1f} ms  "
+          f"提取引用 {refs_time / repeat * 1000:7.1f} ms  结果内存 {retained / 1024 / 1024:7.2f} MiB "
+          f"({retained / len(notes):5.0f} B/条)")
+    return notes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--refs", type=int, default=20000)
+    parser.add_argument("--titles", type=int, default=200, help="引用片段来自的不同笔记数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    from src.api.get_api import normalize_search_result
+    from src.generation.generator import AnswerGenerator
+
+    body = build_body(args.refs, args.titles)
+    print(f"{args.refs} 条引用片段（来自 {args.titles} 篇笔记），响应 {len(body) / 1024 / 1024:.1f} MiB")
+    measure("旧实现", body, legacy_normalize, legacy_references, args.repeat)
+    measure("Note", body, normalize_search_result,
+            lambda notes: AnswerGenerator._extract_references(None, notes), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+提示前缀缓存基准测试
+
+在本地模拟的 OpenAI 兼容接口上进行多轮对话（每个话题连续追问几轮，追问检索到同一批笔记），
+对比旧布局（要求 → 历史对话 → 问题 → 笔记，单条用户消息）与 PromptLayout
+（系统消息中的静态要求 → 笔记 → 历史对话 → 问题）每轮发送的提示字节数，
+以及其中与之前某次请求逐字相同、可被服务端前缀缓存复用的前缀字节数：
+
+    python -m benchmarks.bench_prompt_prefix --topics 5 --turns 4
+"""
+import argparse
+import logging
+import os
+import random
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from tests.stub_server import FakeChatCompletions, StubServer
+
+# 改动前的提示模板
+LEGACY_TEMPLATE = """
+你是一个基于Get笔记内容的问答助手，需要严格基于提供的笔记内容回答用户问题。
+
+请按照以下要求回答：
+1. 严格基于提供的笔记内容，不要添加任何笔记中没有的信息
+2. 明确标注引用来源，格式为：[笔记X]，其中X是笔记的编号
+3. 对引用的内容进行高亮显示
+4. 当检索不到相关笔记时，明确提示并建议调整问题
+5. 如果用户提供了历史对话，请结合上下文理解当前问题。
+
+历史对话：
+{history}
+
+用户问题：{query}
+
+相关笔记：
+{context}
+
+请生成回答：
+"""
+
+
+def make_topics(topics, turns, notes_per_topic, seed=0):
+    """
+    生成若干话题，每个话题有一组笔记和 turns 个追问
+    """
+    rng = random.Random(seed)
+    chars = [chr(code) for code in range(0x4E00, 0x4E00 + 3000)]
+    result = []
+    for t in range(topics):
+        notes = [{"id": f"t{t}n{i}", "title": f"话题{t}的笔记{i}",
+                  "content": "。".join("".join(rng.sample(chars, 12)) for _ in range(8)) + "。",
+                  "relevance_score": 0.9}
+                 for i in range(notes_per_topic)]
+        questions = [f"关于话题{t}的第{q + 1}个问题：{''.join(rng.sample(chars, 10))}？" for q in range(turns)]
+        result.append((notes, questions))
+    return result
+
+
+def serialize(messages):
+    return "".join(f"{message['role']}\n{message['content']}\n" for message in messages)
+
+
+def common_prefix(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def run(generator, fake, topics):
+    """
+    进行多轮对话，返回 (每轮请求体字节数, 每轮提示字节数, 每轮可复用的前缀字节数)
+    """
+    from src.generation.memory import ConversationMemory
+
+    fake.requests.clear()
+    memory = ConversationMemory(window_tokens=100000)
+    messages = []
+    for notes, questions in topics:
+        for question in questions:
+            history = memory.update(messages)
+            answer = generator.generate(question, notes, history)["answer"]
+            messages += [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+    sent, prompts, reused = [], [], []
+    seen = []
+    for request in fake.requests:
+        prompt = serialize(request["messages"]).encode("utf-8")
+        sent.append(request["bytes"])
+        prompts.append(len(prompt))
+        # 服务端缓存的前缀：与之前任一请求的最长公共前缀
+        reused.append(max((common_prefix(prompt, previous) for previous in seen), default=0))
+        seen.append(prompt)
+    return sent, prompts, reused
+
+
+def report(label, sent, prompts, reused):
+    turns = len(sent)
+    uncached = sum(p - r for p, r in zip(prompts, reused))
+    print(f"{label:<12} 请求体 {sum(sent) / turns:8.0f} B/轮  提示 {sum(prompts) / turns:8.0f} B/轮  "
+          f"可复用前缀 {sum(reused) / turns:8.0f} B/轮 ({sum(reused) / sum(prompts):5.1%})  "
+          f"未命中 {uncached / turns:8.0f} B/轮")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--topics", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--notes", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    fake = FakeChatCompletions()
+    with StubServer() as server:
+        server.add_route("POST", "/v1/chat/completions", fake.handler)
+        os.environ["SILICONFLOW_API_KEY"] = "bench"
+        os.environ["SILICONFLOW_API_BASE"] = f"{server.root_url}/v1"
+        os.environ["SEMANTIC_CACHE_ENABLED"] = "false"
+
+        from src.generation.generator import AnswerGenerator
+
+        topics = make_topics(args.topics, args.turns, args.notes)
+        generator = AnswerGenerator()
+        new = run(generator, fake, topics)
+
+        # 旧布局：整段提示作为一条用户消息发送
+        generator.prompt_template = ChatPromptTemplate.from_messages([("human", LEGACY_TEMPLATE)])
+        generator.chain = generator.prompt_template | generator.llm | StrOutputParser()
+        old = run(generator, fake, topics)
+        generator.close()
+
+    print(f"{args.topics} 个话题 × {args.turns} 轮追问，每轮 {args.notes} 条笔记")
+    report("旧布局", *old)
+    report("PromptLayout", *new)
+
+
+if __name__ == "__main__":
+    main()
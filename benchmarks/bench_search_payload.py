@@ -0,0 +1,104 @@
+"""
+knowledge/search 大响应解析基准测试
+
+本地桩服务返回几 MB 的检索响应（大量带完整正文的引用片段），对比每次检索的耗时和客户端内存峰值：
+
+- 旧实现：response.json()（标准库）后再规范化
+- 完整解析：decode_json（安装了 orjson / msgspec 时使用）完整解析后规范化
+- 增量解析：SearchResponseParser 逐个解析 c.refs 元素并立即转换为 Note
+- 增量解析 + 截断：同上，正文在解析时截断到 GETNOTE_MAX_CONTENT_CHARS
+
+--gzip 时桩服务返回 gzip 压缩的响应，同时输出传输字节数：
+
+    python -m benchmarks.bench_search_payload --sizes 2 8 32 --repeat 3 --gzip
+"""
+import argparse
+import gc
+import gzip
+import json
+import logging
+import os
+import random
+import time
+import tracemalloc
+
+TEST_ENV = {"API_KEY": "bench", "KB_ID": "bench", "QUERY_CACHE_BACKEND": "none", "GETNOTE_BREAKER_ENABLED": "false"}
+
+
+def build_body(megabytes: float, seed: int = 0) -> bytes:
+    """
+    构造约 megabytes MB 的响应体，每个引用片段约 1000 个汉字
+    """
+    from tests.stub_server import make_search_response
+    rng = random.Random(seed)
+    chars = [chr(code) for code in range(0x4E00, 0x4E00 + 3000)]
+    refs = [{"title": f"笔记{i % 300}", "content": "".join(rng.choices(chars, k=1000)), "note_id": f"n{i % 300}"}
+            for i in range(int(megabytes * 1024 * 1024 / 3000))]
+    return json.dumps(make_search_response("综合回答。" * 200, refs), ensure_ascii=False).encode("utf-8")
+
+
+def legacy_search(session, url):
+    from src.api.get_api import normalize_search_result
+    response = session.post(url, json={"question": "问题"}, timeout=(5, 120))
+    response.raise_for_status()
+    return normalize_search_result(response.json())
+
+
+def measure(label, fn, repeat, transfer):
+    gc.collect()
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        notes = fn()
+        elapsed.append(time.perf_counter() - start)
+    del notes
+    gc.collect()
+    tracemalloc.start()
+    notes = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<14} {min(elapsed) * 1000:8.1f} ms  内存峰值 {peak / 1024 / 1024:7.1f} MiB  "
+          f"传输 {transfer / 1024 / 1024:6.2f} MiB  {len(notes)} 条")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[2, 8, 32], help="响应大小（MB）")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--gzip", action="store_true", help="返回 gzip 压缩的响应")
+    parser.add_argument("--max-content-chars", type=int, default=400)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    os.environ.update(TEST_ENV)
+    from src.api import payload
+    from src.api.get_api import GetNoteAPI, build_session
+    from tests.stub_server import StubServer
+
+    decoder = "orjson" if payload.orjson else "msgspec" if payload.msgspec else "json（标准库）"
+    print(f"JSON 解析器：{decoder}  Accept-Encoding：{payload.accept_encoding()}")
+    with StubServer() as server:
+        os.environ["GETNOTE_BASE_URL"] = server.base_url
+        url = f"{server.base_url}/knowledge/search"
+        for size in args.sizes:
+            body = build_body(size)
+            headers = {}
+            if args.gzip:
+                body = gzip.compress(body, 6)
+                headers = {"Content-Encoding": "gzip"}
+            server.add_route("POST", "/getnote/openapi/knowledge/search",
+                             lambda handler, request: (200, body, headers, 0.0))
+            print(f"响应 {size:g} MB")
+            session = build_session()
+            measure("旧实现", lambda: legacy_search(session, url), args.repeat, len(body))
+            for label, env in (("完整解析", {"GETNOTE_STREAM_PARSE_BYTES": "0", "GETNOTE_MAX_CONTENT_CHARS": "0"}),
+                               ("增量解析", {"GETNOTE_STREAM_PARSE_BYTES": "1", "GETNOTE_MAX_CONTENT_CHARS": "0"}),
+                               ("增量解析+截断", {"GETNOTE_STREAM_PARSE_BYTES": "1",
+                                            "GETNOTE_MAX_CONTENT_CHARS": str(args.max_content_chars)})):
+                os.environ.update(env)
+                api = GetNoteAPI(session=session)
+                measure(label, lambda: api.search_notes("问题"), args.repeat, len(body))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+每次请求的对象构建开销基准测试
+
+对比每次提问都新建 AnswerGenerator 与 GetNoteAPI（旧实现）
+和从进程级资源注册表获取共享对象（新实现）的耗时。不发送任何网络请求：
+
+    python -m benchmarks.bench_setup_cost --iterations 200
+"""
+import argparse
+import logging
+import os
+import time
+
+
+def measure(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    os.environ.setdefault("API_KEY", "bench")
+    os.environ.setdefault("KB_ID", "bench")
+    os.environ.setdefault("SILICONFLOW_API_KEY", "bench")
+
+    from src.api.get_api import GetNoteAPI, get_client
+    from src.generation.generator import AnswerGenerator, get_answer_generator
+
+    def per_request():
+        AnswerGenerator()
+        GetNoteAPI()
+
+    def shared():
+        get_answer_generator()
+        get_client()
+
+    shared()  # 首次获取时创建，之后每次请求都只是查表
+    old = measure(per_request, args.iterations)
+    new = measure(shared, args.iterations)
+    print(f"每次新建 (旧)   {old * 1000:8.3f} ms/请求")
+    print(f"共享资源 (新)   {new * 1000:8.3f} ms/请求")
+    print(f"加速比          {old / new:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
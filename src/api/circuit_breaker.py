@@ -0,0 +1,271 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from src.api.retry import is_service_failure
+from src.utils.logger import get_logger
+from src.utils.resources import get_resource
+from src.utils.tracing import metrics
+
+# 初始化日志
+logger = get_logger(__name__)
+
+# 影响熔断器配置的环境变量，变化时重新创建
+BREAKER_ENV_KEYS = (
+    "GETNOTE_BREAKER_ENABLED", "GETNOTE_BREAKER_WINDOW", "GETNOTE_BREAKER_MIN_CALLS",
+    "GETNOTE_BREAKER_FAILURE_RATE", "GETNOTE_BREAKER_SLOW_CALL_SECONDS", "GETNOTE_BREAKER_SLOW_CALL_RATE",
+    "GETNOTE_BREAKER_OPEN_SECONDS", "GETNOTE_BREAKER_HALF_OPEN_CALLS",
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    熔断器处于打开状态，请求被直接拒绝
+    """
+
+
+class CircuitBreaker:
+    """
+    熔断器
+    关闭（closed）：正常放行，在最近 window 次调用中统计失败率和慢调用比例，任一超过阈值即打开；
+    打开（open）：直接拒绝请求，open_duration 秒后进入半开；
+    半开（half_open）：放行少量探测请求，全部成功则关闭，任一失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str = "getnote", window: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_call_seconds: float = 30.0, slow_call_rate: float = 0.8, open_duration: float = 30.0,
+                 half_open_calls: int = 1, enabled: bool = True,
+                 is_failure: Optional[Callable[[BaseException], bool]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            name: 熔断器名称，用于日志和指标
+            window: 统计失败率的滑动窗口大小（调用次数）
+            min_calls: 窗口内至少有这么多次调用才计算失败率
+            failure_rate: 失败率阈值
+            slow_call_seconds: 超过该耗时（秒）的调用视为慢调用
+            slow_call_rate: 慢调用比例阈值
+            open_duration: 打开状态持续时间（秒），之后进入半开
+            half_open_calls: 半开状态下放行的探测请求数
+            enabled: 为 False 时不做任何拦截
+            is_failure: 判断异常是否计为失败，默认所有异常都计为失败
+            clock: 时钟函数，便于测试
+        """
+        self.name = name
+        self.window = window
+        self.min_calls = max(1, min_calls)
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_duration = open_duration
+        self.half_open_calls = max(1, half_open_calls)
+        self.enabled = enabled
+        self.is_failure = is_failure or (lambda exc: True)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        # 每次调用的结果：(是否失败, 是否慢调用)
+        self._outcomes: deque = deque(maxlen=window)
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls, name: str = "getnote", **kwargs) -> "CircuitBreaker":
+        """
+        从 GETNOTE_BREAKER_* 环境变量创建熔断器
+        """
+        return cls(
+            name=name,
+            window=int(os.getenv("GETNOTE_BREAKER_WINDOW", "20")),
+            min_calls=int(os.getenv("GETNOTE_BREAKER_MIN_CALLS", "5")),
+            failure_rate=float(os.getenv("GETNOTE_BREAKER_FAILURE_RATE", "0.5")),
+            slow_call_seconds=float(os.getenv("GETNOTE_BREAKER_SLOW_CALL_SECONDS", "30")),
+            slow_call_rate=float(os.getenv("GETNOTE_BREAKER_SLOW_CALL_RATE", "0.8")),
+            open_duration=float(os.getenv("GETNOTE_BREAKER_OPEN_SECONDS", "30")),
+            half_open_calls=int(os.getenv("GETNOTE_BREAKER_HALF_OPEN_CALLS", "1")),
+            enabled=os.getenv("GETNOTE_BREAKER_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on"),
+            **kwargs,
+        )
+
+    def add_listener(self, listener: Callable[[str, Dict[str, Any]], None]):
+        """
+        注册指标回调
+        回调参数为事件名（state_change / success / failure / rejected）和当前统计信息，
+        回调在持有锁之外调用，回调本身的异常会被忽略
+        """
+        self._listeners.append(listener)
+
+    @property
+    def state(self) -> str:
+        events: List[tuple] = []
+        with self._lock:
+            state = self._current_state(events)
+        self._emit(events)
+        return state
+
+    def _current_state(self, events: List[tuple]) -> str:
+        # 打开状态超时后自动进入半开（调用方需持有锁）
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.open_duration:
+            self._transition(self.HALF_OPEN, events)
+        return self._state
+
+    def _transition(self, state: str, events: List[tuple]):
+        previous, self._state = self._state, state
+        if state == self.OPEN:
+            self._opened_at = self._clock()
+        if state in (self.CLOSED, self.HALF_OPEN):
+            self._outcomes.clear()
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+        events.append(("state_change", {"from": previous, "to": state}))
+
+    def before_call(self):
+        """
+        请求前检查是否放行
+
+        Raises:
+            CircuitOpenError: 熔断器打开，或半开状态下探测名额已用完
+        """
+        if not self.enabled:
+            return
+        events: List[tuple] = []
+        with self._lock:
+            state = self._current_state(events)
+            allowed = state == self.CLOSED
+            if state == self.HALF_OPEN and self._half_open_in_flight < self.half_open_calls:
+                self._half_open_in_flight += 1
+                allowed = True
+            if not allowed:
+                self.rejected += 1
+                events.append(("rejected", {}))
+        self._emit(events)
+        if not allowed:
+            retry_in = max(0.0, self.open_duration - (self._clock() - self._opened_at))
+            raise CircuitOpenError(f"Get笔记服务熔断中（{self.name}），约 {retry_in:.0f} 秒后重试")
+
+    def record(self, duration: float, error: Optional[BaseException] = None):
+        """
+        记录一次已放行调用的结果
+
+        Args:
+            duration: 调用耗时（秒）
+            error: 调用抛出的异常，成功时为空
+        """
+        if not self.enabled:
+            return
+        failed = error is not None and self.is_failure(error)
+        slow = duration >= self.slow_call_seconds
+        events: List[tuple] = [("failure" if failed else "success", {"duration": duration})]
+        with self._lock:
+            state = self._current_state(events)
+            if state == self.HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                if failed or slow:
+                    self._transition(self.OPEN, events)
+                else:
+                    self._half_open_successes += 1
+                    if self._half_open_successes >= self.half_open_calls:
+                        self._transition(self.CLOSED, events)
+            elif state == self.CLOSED:
+                self._outcomes.append((failed, slow))
+                if len(self._outcomes) >= self.min_calls:
+                    total = len(self._outcomes)
+                    failures = sum(1 for f, _ in self._outcomes if f)
+                    slow_calls = sum(1 for _, s in self._outcomes if s)
+                    if failures / total >= self.failure_rate or slow_calls / total >= self.slow_call_rate:
+                        self._transition(self.OPEN, events)
+        self._emit(events)
+
+    def release(self):
+        """
+        调用被取消、没有结果时归还半开状态的探测名额
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        通过熔断器调用 fn
+        """
+        self.before_call()
+        start = self._clock()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record(self._clock() - start, e)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record(self._clock() - start)
+        return result
+
+    async def acall(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        call 的异步版本
+        """
+        self.before_call()
+        start = self._clock()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            self.record(self._clock() - start, e)
+            raise
+        except BaseException:
+            # 调用方取消不代表服务异常
+            self.release()
+            raise
+        self.record(self._clock() - start)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        返回当前状态和滑动窗口内的统计信息
+        """
+        with self._lock:
+            total = len(self._outcomes)
+            failures = sum(1 for f, _ in self._outcomes if f)
+            slow_calls = sum(1 for _, s in self._outcomes if s)
+            return {
+                "name": self.name,
+                "state": self._state,
+                "calls": total,
+                "failure_rate": failures / total if total else 0.0,
+                "slow_call_rate": slow_calls / total if total else 0.0,
+                "rejected": self.rejected,
+            }
+
+    def _emit(self, events: List[tuple]):
+        for event, data in events:
+            if event == "state_change":
+                logger.warning(f"熔断器 {self.name} 状态变化：{data['from']} -> {data['to']}")
+            if not self._listeners:
+                continue
+            payload = dict(self.stats(), **data)
+            for listener in self._listeners:
+                try:
+                    listener(event, payload)
+                except Exception as e:
+                    logger.warning(f"熔断器指标回调出错：{e}")
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """
+    获取进程级共享的 Get笔记 API 熔断器，同步和异步客户端共用
+    只有服务本身的异常（is_service_failure）计为失败；熔断器事件计入 getnote_breaker_events_total 指标
+    """
+    def create() -> CircuitBreaker:
+        breaker = CircuitBreaker.from_env(is_failure=is_service_failure)
+        breaker.add_listener(lambda event, data: metrics.inc(
+            "getnote_breaker_events_total", breaker=data["name"], event=event, state=data["state"]))
+        return breaker
+    return get_resource("getnote_breaker", create, BREAKER_ENV_KEYS)
@@ -1,7 +1,25 @@
 import os
+import sys
+import asyncio
+import threading
+import weakref
+import httpx
 import requests
-from typing import Dict, List, Any
-from src.utils.logger import get_logger
+from requests.adapters import HTTPAdapter
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
+from src.api.models import Note, as_notes
+from src.api.payload import (
+    PAYLOAD_ENV_KEYS, PayloadLimits, accept_encoding, aread_search_response, read_search_response
+)
+from src.api.circuit_breaker import BREAKER_ENV_KEYS, CircuitBreaker, CircuitOpenError, get_circuit_breaker
+from src.api.rate_limiter import RateLimiter, RateLimitError, get_rate_limiter, priority_lane
+from src.api.retry import (
+    DeadlineExceeded, LatencyTracker, RetryPolicy, async_call_with_retry, call_with_retry, is_service_failure
+)
+from src.cache.query_cache import QueryCache, get_query_cache
+from src.utils.logger import get_logger, log_payload
+from src.utils.resources import get_resource
+from src.utils.tracing import get_request_id, span
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -10,133 +28,700 @@ load_dotenv()
 # 初始化日志
 logger = get_logger(__name__)
 
+# 默认的官方基础 URL，可通过 GETNOTE_BASE_URL 覆盖（例如指向本地桩服务）
+DEFAULT_BASE_URL = "https://open-api.biji.com/getnote/openapi"
+
+# Get 笔记 AI 综合回答在结果列表中的来源标记，它不是笔记，检索筛选时单独处理
+AI_ANSWER_SOURCE = "Get 笔记 AI 生成"
+# 引用片段的来源标记
+REF_SOURCE = "原始笔记片段"
+
+# 检索模式对应的请求参数：fast 关闭深度思考，响应快；deep 开启深度思考，最慢但回答最充分。
+# balanced（先 fast、结果不足时再 deep）不是接口参数，由检索层路由，见 src/retrieval/router.py
+SEARCH_MODES = {
+    "fast": {"deep_seek": False, "refs": True},
+    "deep": {"deep_seek": True, "refs": True},
+}
+
+# 笔记列表接口的默认路径（相对 GETNOTE_BASE_URL），可通过 GETNOTE_NOTES_PATH 覆盖。
+# Get 笔记开放平台文档只公开了知识库检索接口，这个路径是本地镜像同步所需的假设，部署前需要确认
+DEFAULT_NOTES_PATH = "/knowledge/notes"
+
+
+class NotesEndpointNotFoundError(RuntimeError):
+    """
+    笔记列表接口不存在（返回 404），通常是 GETNOTE_NOTES_PATH 配置错误或服务端没有提供该接口
+    """
+
+
+# normalize_note 单独处理的字段，其余字段在 keep_extra 时保存到 Note.extra
+_NOTE_ITEM_KEYS = frozenset(("id", "note_id", "title", "note_title", "content", "text", "source", "relevance_score"))
+
+# 影响共享 HTTP 会话与客户端的环境变量，变化时重新创建
+SESSION_ENV_KEYS = ("GETNOTE_POOL_SIZE", "GETNOTE_KEEP_ALIVE")
+CLIENT_ENV_KEYS = SESSION_ENV_KEYS + (
+    "API_KEY", "KB_ID", "GETNOTE_BASE_URL", "GETNOTE_CONNECT_TIMEOUT", "GETNOTE_READ_TIMEOUT",
+    "GETNOTE_REQUEST_DEADLINE", "GETNOTE_RETRY_MAX_ATTEMPTS", "GETNOTE_RETRY_BASE_DELAY", "GETNOTE_RETRY_MAX_DELAY",
+    "GETNOTE_HEDGE_ENABLED", "GETNOTE_HEDGE_DELAY", "GETNOTE_HEDGE_QUANTILE",
+) + BREAKER_ENV_KEYS + PAYLOAD_ENV_KEYS
+ASYNC_CLIENT_ENV_KEYS = CLIENT_ENV_KEYS + ("GETNOTE_MAX_CONCURRENCY",)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """
+    读取布尔类型的环境变量
+    """
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def get_timeouts() -> tuple:
+    """
+    获取 (连接超时, 读取超时)，单位秒
+    深度思考的回答较慢，因此读取超时默认较长，而连接超时保持较短以便快速发现网络故障
+    """
+    connect_timeout = float(os.getenv("GETNOTE_CONNECT_TIMEOUT", "5"))
+    read_timeout = float(os.getenv("GETNOTE_READ_TIMEOUT", "120"))
+    return connect_timeout, read_timeout
+
+
+def build_session() -> requests.Session:
+    """
+    创建带连接池的 requests.Session
+
+    连接池大小由 GETNOTE_POOL_SIZE 控制；GETNOTE_KEEP_ALIVE=false 时每次请求后关闭连接。
+    重试策略不在适配器层处理，避免与上层逻辑重复重试。
+    """
+    pool_size = int(os.getenv("GETNOTE_POOL_SIZE", "10"))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not _env_bool("GETNOTE_KEEP_ALIVE", True):
+        session.headers["Connection"] = "close"
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    获取进程级共享的 HTTP 会话（线程安全，懒加载）
+    Streamlit 重跑脚本时模块不会重新导入，因此会话及其连接池可跨重跑和会话复用
+    """
+    return get_resource("getnote_session", build_session, SESSION_ENV_KEYS)
+
+
+def get_stream_threshold() -> int:
+    """
+    响应体超过该字节数（或长度未知）时增量解析，0 表示总是完整读取后解析
+    """
+    return int(os.getenv("GETNOTE_STREAM_PARSE_BYTES", str(1024 * 1024)))
+
+
+def get_request_deadline() -> float:
+    """
+    获取单次检索请求的总截止时间（秒），包括排队等待并发名额的时间
+    """
+    connect_timeout, read_timeout = get_timeouts()
+    return float(os.getenv("GETNOTE_REQUEST_DEADLINE", str(connect_timeout + read_timeout)))
+
+
+def build_search_payload(query: str, kb_id: str, mode: str = "deep") -> Dict[str, Any]:
+    """
+    构造符合官方文档的 knowledge/search 请求体 (JSON Payload)
+    deep_seek 由检索模式决定（见 SEARCH_MODES），refs=True 获取引用来源
+
+    Raises:
+        ValueError: 未知的检索模式
+    """
+    options = SEARCH_MODES.get(mode)
+    if options is None:
+        raise ValueError(f"未知的检索模式：{mode}，可选 {', '.join(SEARCH_MODES)}")
+    return {
+        "question": query,                  # 参数名必须是 question
+        "topic_ids": [kb_id],               # 必须是列表格式 ["kb_id"]
+        "deep_seek": options["deep_seek"],  # 是否开启深度思考，进行更深入的分析（明显更慢）
+        "refs": options["refs"],            # 开启引用来源，返回具体的笔记片段
+        "history": []                       # 暂不传递历史记录
+    }
+
+
+def normalize_note(item: Dict[str, Any], source: Optional[str] = None, keep_extra: bool = False) -> Note:
+    """
+    将一条笔记或引用片段转换为 Note
+    兼容 id/note_id、title/note_title、content/text 等字段名；标题和来源驻留为共享字符串，
+    大量引用片段来自同一篇笔记时不重复占用内存
+
+    Args:
+        item: 响应中的一条记录
+        source: 来源标记，为空时使用记录中的 source 字段
+        keep_extra: 是否保留其他字段（形状未知的 data 列表保留，引用片段只取需要的字段）
+    """
+    get = item.get
+    note_id = get("id")
+    if note_id is None:
+        note_id = get("note_id")
+    title = get("title") or get("note_title") or "未知标题"
+    extra = {key: value for key, value in item.items() if key not in _NOTE_ITEM_KEYS} if keep_extra else None
+    # 逐条处理大量引用片段，按位置传参以减少调用开销
+    return Note(sys.intern(title) if type(title) is str else title, get("content") or get("text") or "",
+                source or get("source"), None if note_id is None else str(note_id), get("relevance_score"), None, extra)
+
+
+def _ref_to_note(ref: Any) -> Any:
+    return normalize_note(ref, REF_SOURCE) if isinstance(ref, dict) else ref
+
+
+def normalize_search_result(result: Any) -> List[Note]:
+    """
+    将 knowledge/search 的原始响应统一转换为笔记列表
+    同步客户端与异步客户端共用此逻辑，保证两者返回格式一致
+
+    Args:
+        result: 已解析的 JSON 响应
+    Returns:
+        Note 列表：Get 笔记 AI 综合回答（如果有）在最前，之后是引用片段
+    """
+    # ==========================================
+    # ✅ 核心修复：专门处理 Get 笔记 API 的特殊返回格式
+    # ==========================================
+    # 正常格式可能是 {'data': [...]}
+    # 但 Get 笔记 AI 回答通常在 {'c': {'answers': '...'}} 中
+
+    # 1. 优先尝试提取 AI 生成的答案 (c.answers)
+    if isinstance(result, dict):
+        if 'c' in result and isinstance(result['c'], dict):
+            answers = result['c'].get('answers', '')
+            refs = result['c'].get('refs', [])
+
+            combined_result = []
+
+            # 如果有 AI 回答，加入结果列表
+            if answers:
+                logger.info("成功从 'c.answers' 提取到 AI 回答！")
+                combined_result.append(Note(title="AI 综合回答", content=answers, source=AI_ANSWER_SOURCE))
+
+            # 如果有引用片段，也加入结果列表
+            if refs:
+                logger.info(f"成功从 'c.refs' 提取到 {len(refs)} 条引用笔记")
+                # 增量解析时引用片段已经转换为 Note
+                combined_result.extend(_ref_to_note(ref) for ref in refs if isinstance(ref, (dict, Note)))
+
+            if combined_result:
+                return combined_result
+
+        # 2. 如果没找到 c.answers/c.refs，尝试提取原始笔记片段 (data/items)
+        data = result.get("data", [])
+        if isinstance(data, dict):
+            data = data.get("items", []) or data.get("list", []) or data.get("notes", []) or [data]
+        elif not data and result:
+            data = result.get("items", []) or result.get("list", []) or [result]
+
+        if data:
+            logger.info(f"成功从 'data' 提取到 {len(data)} 条笔记片段")
+            return [normalize_note(item, keep_extra=True) for item in data if isinstance(item, dict)]
+
+    # 3. 如果都没找到，返回空列表
+    logger.warning("未在 API 响应中找到有效数据字段")
+    return []
+
+
+def with_request_id(headers: Dict[str, str]) -> Dict[str, str]:
+    """
+    附加当前请求 ID（X-Request-ID），便于与服务端日志对应
+    """
+    request_id = get_request_id()
+    return dict(headers, **{"X-Request-ID": request_id}) if request_id else headers
+
+
+def normalize_notes_page(result: Any) -> Dict[str, Any]:
+    """
+    将笔记列表接口的一页响应统一转换为 {"notes": [...], "next_cursor": ..., "has_more": ...}
+    每条笔记包含 id、title、content、updated_at 和 deleted
+
+    Args:
+        result: 已解析的 JSON 响应
+    Returns:
+        一页笔记
+    """
+    body = (result.get("c") or result.get("data") or {}) if isinstance(result, dict) else {}
+    items = body.get("notes") or body.get("items") or body.get("list") or []
+    notes = []
+    for item in items:
+        note_id = item.get("id") or item.get("note_id")
+        if note_id is None:
+            continue
+        notes.append({
+            "id": str(note_id),
+            "title": item.get("title") or "",
+            "content": item.get("content") or "",
+            "updated_at": float(item.get("updated_at") or 0),
+            "deleted": bool(item.get("deleted", False)),
+        })
+    next_cursor = body.get("next_cursor")
+    return {
+        "notes": notes,
+        "next_cursor": str(next_cursor) if next_cursor not in (None, "") else None,
+        "has_more": bool(body.get("has_more")) and next_cursor not in (None, ""),
+    }
+
+
+def get_client() -> "GetNoteAPI":
+    """
+    获取进程级共享的 GetNoteAPI 客户端（线程安全，懒加载）
+    """
+    return get_resource("getnote_client", lambda: GetNoteAPI(breaker=get_circuit_breaker()), CLIENT_ENV_KEYS)
+
+
+def get_async_client() -> "AsyncGetNoteAPI":
+    """
+    获取进程级共享的 AsyncGetNoteAPI 客户端（线程安全，懒加载）
+    """
+    return get_resource("getnote_async_client", lambda: AsyncGetNoteAPI(breaker=get_circuit_breaker()),
+                        ASYNC_CLIENT_ENV_KEYS)
+
+
+def note_rate_limited(limiter: RateLimiter, response: Any):
+    """
+    服务端返回 429 时按 Retry-After 暂停共享限流器，让同一进程内的其他请求一起退让
+    没有 Retry-After 时只清空已积累的令牌，退避由重试策略负责
+    """
+    if response is None or response.status_code != 429:
+        return
+    try:
+        retry_after = float(response.headers.get("Retry-After", "0"))
+    except ValueError:
+        retry_after = 0.0
+    limiter.pause(max(retry_after, 0.0))
+
+
 class GetNoteAPI:
     """
     Get 笔记 API 连接模块
     用于与 Get 笔记 API 进行交互，包括检索笔记内容等操作
     """
 
-    def __init__(self):
+    def __init__(self, session: Optional[requests.Session] = None, cache: Optional[QueryCache] = None,
+                 retry_policy: Optional[RetryPolicy] = None, breaker: Optional[CircuitBreaker] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
         """
         初始化 Get 笔记 API 连接
         从环境变量加载 API_KEY 和 KB_ID
+
+        Args:
+            session: 可选的 HTTP 会话，默认使用进程级共享会话
+            cache: 可选的检索结果缓存，默认使用按 QUERY_CACHE_* 配置的进程级缓存
+            retry_policy: 可选的重试策略，默认按 GETNOTE_RETRY_* / GETNOTE_HEDGE_* 配置
+            breaker: 可选的熔断器，默认按 GETNOTE_BREAKER_* 配置新建
+            rate_limiter: 可选的限流器，默认使用按 GETNOTE_RATE_* 配置的进程级限流器
         """
         self.api_key = os.getenv('API_KEY')
         self.kb_id = os.getenv('KB_ID')
         
         # 使用正确的官方基础 URL
-        self.base_url = "https://open-api.biji.com/getnote/openapi"
+        self.base_url = os.getenv("GETNOTE_BASE_URL", DEFAULT_BASE_URL).rstrip("/")
+        self.timeout = get_timeouts()
         
         # 添加完整的 Headers (包含 X-OAuth-Version)
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
-            "X-OAuth-Version": "1" 
+            "X-OAuth-Version": "1",
+            "Accept-Encoding": accept_encoding(),
         }
+        # 响应体较大时增量解析 c.refs，并在解析时截断超长字段
+        self.payload_limits = PayloadLimits.from_env()
+        self.stream_threshold = get_stream_threshold()
 
         # 验证必要的环境变量
         if not self.api_key:
             raise ValueError("API_KEY 环境变量未设置")
         if not self.kb_id:
             raise ValueError("KB_ID 环境变量未设置")
+
+        # 复用连接池中的长连接，避免每次查询都重新进行 TCP/TLS 握手
+        self.session = session if session is not None else get_session()
+        self.cache = cache
+        self.retry_policy = retry_policy or RetryPolicy.from_env(get_request_deadline())
+        self.latency = LatencyTracker()
+        # 传入的熔断器（包括进程级共享的熔断器）可能被多个客户端共用，不修改其失败判断
+        self.breaker = breaker or CircuitBreaker.from_env(
+            is_failure=lambda exc: is_service_failure(exc, self.retry_policy))
+        self.rate_limiter = rate_limiter
             
         logger.info("GetNoteAPI 初始化成功")
 
-    def search_notes(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+    def search_notes(self, query: str, top_k: Optional[int] = 3, mode: str = "deep") -> List[Note]:
         """
         根据查询语句搜索相关笔记
         Args:
             query: 用户查询语句
-            top_k: 返回的最大结果数
+            top_k: 最多保留的引用片段数（Get 笔记 AI 综合回答不计入），为空时不限制
+            mode: 检索模式，fast 或 deep（见 SEARCH_MODES）
         Returns:
             包含相关笔记信息的列表
         """
-        logger.info(f"开始搜索笔记，查询：{query}")
+        logger.info(f"开始搜索笔记，查询：{query}，模式：{mode}")
         
         # 使用正确的接口路径
         url = f"{self.base_url}/knowledge/search"
-        
-        # 构造符合官方文档的请求体 (JSON Payload)
-        # 关键修改：deep_seek=True (开启深度思考), refs=True (获取引用来源)
-        payload = {
-            "question": query,              # 参数名必须是 question
-            "topic_ids": [self.kb_id],      # 必须是列表格式 ["kb_id"]
-            "deep_seek": True,              # 开启深度思考，进行更深入的分析
-            "refs": True,                   # 开启引用来源，返回具体的笔记片段
-            "history": []                   # 暂不传递历史记录
-        }
+        payload = build_search_payload(query, self.kb_id, mode)
+
+        # 先查检索缓存，相同问题无需再次进行耗时的深度检索
+        cache = self.cache if self.cache is not None else get_query_cache()
+        cache_key = None
+        if cache is not None:
+            with span("getnote.cache") as attrs:
+                cache_key = cache.make_key(query, self.kb_id, payload["deep_seek"], payload["refs"], top_k)
+                cached = cache.get(cache_key)
+                attrs["hit"] = cached is not None
+            if cached is not None:
+                logger.info(f"命中检索缓存，查询：{query}")
+                return as_notes(cached)
         
         try:
             logger.info(f"发送 POST 请求到：{url}")
-            logger.debug(f"请求参数：{payload}")
-            
-            # 发送 POST 请求，并设置较长的超时时间以应对深度思考
-            response = requests.post(url, headers=self.headers, json=payload, timeout=120)
-            
-            # 检查 HTTP 状态码
-            response.raise_for_status()
-            
-            result = response.json()
-            logger.info(f"API 返回原始结果：{result}")
+            logger.debug("请求参数：%s", payload)
             
-            # ==========================================
-            # ✅ 核心修复：专门处理 Get 笔记 API 的特殊返回格式
-            # ==========================================
-            # 正常格式可能是 {'data': [...]}
-            # 但 Get 笔记 AI 回答通常在 {'c': {'answers': '...'}} 中
+            connect_timeout, read_timeout = self.timeout
+            headers = with_request_id(self.headers)
+            limiter = self.rate_limiter or get_rate_limiter("getnote")
+
+            def attempt(remaining: float) -> Any:
+                # 每次尝试（包括重试）都占用一次请求配额，排队时间计入截止时间
+                remaining -= limiter.acquire(timeout=remaining)
+                # 通过共享会话发送 POST 请求，连接超时与读取超时分开设置（读取超时较长以应对深度思考），
+                # 且不超过总截止时间的剩余部分
+                with span("getnote.request", deep_seek=payload["deep_seek"]) as attrs:
+                    response = self.session.post(url, headers=headers, json=payload, stream=True,
+                                                 timeout=(min(connect_timeout, remaining), min(read_timeout, remaining)))
+                    attrs["status"] = response.status_code
+                    note_rate_limited(limiter, response)
+                    if not response.ok:
+                        # 以 stream=True 发送，错误响应读取完整内容后连接才会回到连接池
+                        response.content
+                    # 检查 HTTP 状态码
+                    response.raise_for_status()
+                with span("getnote.parse") as attrs:
+                    return self._parse(response, attrs, top_k)
+
+            # 可重试的错误（429/5xx/网络错误）按指数退避重试，必要时发送对冲请求；
+            # 服务持续异常时熔断器打开，后续请求立即失败，不再等满超时
+            result = self.breaker.call(call_with_retry, attempt, self.retry_policy, self.latency)
+            # 原始响应可能有几十 KB，只在 DEBUG 级别（或被抽样时）截断输出，且格式化在后台日志线程完成
+            log_payload(logger, "API 返回原始结果：", result)
             
-            # 1. 优先尝试提取 AI 生成的答案 (c.answers)
-            if isinstance(result, dict):
-                if 'c' in result and isinstance(result['c'], dict):
-                    answers = result['c'].get('answers', '')
-                    refs = result['c'].get('refs', [])
-                    
-                    combined_result = []
-                    
-                    # 如果有 AI 回答，加入结果列表
-                    if answers:
-                        logger.info("成功从 'c.answers' 提取到 AI 回答！")
-                        combined_result.append({
-                            "content": answers, 
-                            "source": "Get 笔记 AI 生成",
-                            "title": "AI 综合回答"
-                        })
-                    
-                    # 如果有引用片段，也加入结果列表
-                    if refs:
-                        logger.info(f"成功从 'c.refs' 提取到 {len(refs)} 条引用笔记")
-                        for ref in refs:
-                            combined_result.append({
-                                "title": ref.get("title", "未知标题"),
-                                "content": ref.get("content", ""),
-                                "source": "原始笔记片段"
-                            })
-                    
-                    if combined_result:
-                        return combined_result
-                
-                # 2. 如果没找到 c.answers/c.refs，尝试提取原始笔记片段 (data/items)
-                data = result.get("data", [])
-                if isinstance(data, dict):
-                    data = data.get("items", []) or data.get("list", []) or data.get("notes", []) or [data]
-                elif not data and result:
-                    data = result.get("items", []) or result.get("list", []) or [result]
-                
-                if data:
-                    logger.info(f"成功从 'data' 提取到 {len(data)} 条笔记片段")
-                    return data
-
-            # 3. 如果都没找到，返回空列表
-            logger.warning("未在 API 响应中找到有效数据字段")
-            return []
+            with span("getnote.normalize"):
+                notes = normalize_search_result(result)
+            # 空结果可能是暂时性的，不写入缓存
+            if cache_key is not None and notes:
+                cache.set(cache_key, notes)
+            return notes
             
+        except CircuitOpenError as e:
+            logger.warning(f"熔断器打开，跳过检索：{e}")
+            raise
+        except RateLimitError as e:
+            logger.warning(f"检索笔记被限流：{e}")
+            raise
         except requests.exceptions.RequestException as e:
             logger.error(f"网络请求错误：{e}")
             error_detail = ""
             if hasattr(e, 'response') and e.response is not None:
                 error_detail = f"服务器响应：{e.response.text}"
                 logger.error(error_detail)
+                if e.response.status_code == 429:
+                    raise RateLimitError(f"检索笔记时被限流（429）：{str(e)}") from e
             raise RuntimeError(f"检索笔记时发生错误：{str(e)} {error_detail}")
+        except DeadlineExceeded as e:
+            logger.error(f"检索笔记超时：{e}")
+            raise RuntimeError(f"检索笔记时发生错误：{str(e)}")
         except Exception as e:
             logger.error(f"未知错误：{e}")
-            raise RuntimeError(f"检索笔记时发生错误：{str(e)}")
\ No newline at end of file
+            raise RuntimeError(f"检索笔记时发生错误：{str(e)}")
+
+    def _parse(self, response: Any, attrs: Dict[str, Any], top_k: Optional[int] = None) -> Any:
+        """
+        解析检索响应，引用片段在解析时截断并转换为 Note，超过 top_k 的片段直接丢弃
+        """
+        limits = self.payload_limits.copy(top_k)
+        if isinstance(response, requests.Response):
+            result = read_search_response(response, limits, self.stream_threshold, on_ref=_ref_to_note)
+        else:
+            # 注入的会话返回的不是 requests.Response（如测试替身）时按普通 JSON 解析
+            result = limits.apply(response.json())
+        attrs["truncated"] = limits.truncated
+        return result
+
+    def list_notes(self, updated_after: Optional[float] = None, cursor: Optional[str] = None,
+                   limit: int = 500) -> Dict[str, Any]:
+        """
+        分页列出知识库中的笔记，供本地镜像增量同步使用
+        接口路径可通过 GETNOTE_NOTES_PATH 配置，默认 DEFAULT_NOTES_PATH
+
+        Args:
+            updated_after: 只返回该时间戳（含）之后更新或删除的笔记，为空时返回全部
+            cursor: 上一页返回的游标
+            limit: 每页条数
+        Returns:
+            {"notes": [...], "next_cursor": ..., "has_more": ...}
+        Raises:
+            NotesEndpointNotFoundError: 接口返回 404
+            RuntimeError: 其他请求错误
+        """
+        url = f"{self.base_url}{os.getenv('GETNOTE_NOTES_PATH') or DEFAULT_NOTES_PATH}"
+        params: Dict[str, Any] = {"topic_id": self.kb_id, "limit": limit}
+        if updated_after is not None:
+            params["updated_after"] = updated_after
+        if cursor is not None:
+            params["cursor"] = cursor
+        connect_timeout, read_timeout = self.timeout
+        headers = with_request_id(self.headers)
+        limiter = self.rate_limiter or get_rate_limiter("getnote")
+
+        def attempt(remaining: float) -> Any:
+            remaining -= limiter.acquire(timeout=remaining)
+            with span("getnote.list_notes"):
+                response = self.session.get(url, headers=headers, params=params,
+                                            timeout=(min(connect_timeout, remaining), min(read_timeout, remaining)))
+                note_rate_limited(limiter, response)
+                response.raise_for_status()
+                return response.json()
+
+        try:
+            # 后台同步不经过熔断器，也不计入检索请求的延迟统计；与批量任务一样让交互式检索优先使用配额
+            with priority_lane("batch"):
+                return normalize_notes_page(call_with_retry(attempt, self.retry_policy))
+        except requests.HTTPError as e:
+            if getattr(e.response, "status_code", None) == 404:
+                raise NotesEndpointNotFoundError(f"笔记列表接口不存在（404）：{url}，请检查 GETNOTE_NOTES_PATH") from e
+            logger.error(f"列出笔记时发生错误：{e}")
+            raise RuntimeError(f"列出笔记时发生错误：{str(e)}") from e
+        except Exception as e:
+            logger.error(f"列出笔记时发生错误：{e}")
+            raise RuntimeError(f"列出笔记时发生错误：{str(e)}") from e
+
+
+class AsyncGetNoteAPI:
+    """
+    Get 笔记 API 异步连接模块
+    与 GetNoteAPI 使用相同的请求体和响应解析逻辑，基于 asyncio 实现，
+    通过信号量限制同时在途的请求数，使单个进程可以并发处理大量知识库检索
+    """
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, max_concurrency: Optional[int] = None,
+                 cache: Optional[QueryCache] = None, retry_policy: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None, rate_limiter: Optional[RateLimiter] = None):
+        """
+        初始化异步 Get 笔记 API 连接
+        从环境变量加载 API_KEY 和 KB_ID
+
+        Args:
+            client: 可选的 httpx 异步客户端，默认按需创建带连接池的客户端
+            max_concurrency: 最大并发请求数，默认读取 GETNOTE_MAX_CONCURRENCY
+            cache: 可选的检索结果缓存，默认使用按 QUERY_CACHE_* 配置的进程级缓存
+            retry_policy: 可选的重试策略，默认按 GETNOTE_RETRY_* / GETNOTE_HEDGE_* 配置
+            breaker: 可选的熔断器，默认按 GETNOTE_BREAKER_* 配置新建
+            rate_limiter: 可选的限流器，默认使用按 GETNOTE_RATE_* 配置的进程级限流器（与同步客户端共用配额）
+        """
+        self.api_key = os.getenv('API_KEY')
+        self.kb_id = os.getenv('KB_ID')
+        self.base_url = os.getenv("GETNOTE_BASE_URL", DEFAULT_BASE_URL).rstrip("/")
+        self.timeout = get_timeouts()
+        self.retry_policy = retry_policy or RetryPolicy.from_env(get_request_deadline())
+        self.latency = LatencyTracker()
+        # 传入的熔断器（包括进程级共享的熔断器）可能被多个客户端共用，不修改其失败判断
+        self.breaker = breaker or CircuitBreaker.from_env(
+            is_failure=lambda exc: is_service_failure(exc, self.retry_policy))
+        self.rate_limiter = rate_limiter
+        self.headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "X-OAuth-Version": "1",
+            "Accept-Encoding": accept_encoding(),
+        }
+        self.payload_limits = PayloadLimits.from_env()
+        self.stream_threshold = get_stream_threshold()
+
+        # 验证必要的环境变量
+        if not self.api_key:
+            raise ValueError("API_KEY 环境变量未设置")
+        if not self.kb_id:
+            raise ValueError("KB_ID 环境变量未设置")
+
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("GETNOTE_MAX_CONCURRENCY", "100"))
+        self.max_concurrency = max_concurrency
+        self.cache = cache
+
+        # httpx 客户端和信号量都绑定事件循环，因此按事件循环分别懒加载：{事件循环: (客户端, 信号量, 关闭守卫)}
+        self._client = client
+        self._owns_client = client is None
+        self._loop_resources: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, tuple]" = \
+            weakref.WeakKeyDictionary()
+        self._resources_lock = threading.Lock()
+
+        logger.info("AsyncGetNoteAPI 初始化成功")
+
+    async def _loop_resources_for_current(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        """
+        获取当前事件循环的 httpx 客户端和信号量
+        同一事件循环内的请求复用同一个客户端（保持连接复用）；自行创建的客户端在事件循环结束时关闭
+        """
+        loop = asyncio.get_running_loop()
+        guard = None
+        with self._resources_lock:
+            resources = self._loop_resources.get(loop)
+            if resources is None:
+                semaphore = asyncio.Semaphore(self.max_concurrency)
+                if self._owns_client:
+                    client = self._create_client()
+                    guard = self._close_with_loop(loop, client)
+                else:
+                    client = self._client
+                resources = self._loop_resources[loop] = (client, semaphore, guard)
+        if guard is not None:
+            # 启动守卫，使其登记为事件循环的异步生成器
+            await guard.__anext__()
+        return resources[0], resources[1]
+
+    def _create_client(self) -> httpx.AsyncClient:
+        connect_timeout, read_timeout = get_timeouts()
+        pool_size = int(os.getenv("GETNOTE_POOL_SIZE", "10"))
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max(pool_size, self.max_concurrency),
+                                max_keepalive_connections=pool_size),
+        )
+
+    async def _close_with_loop(self, loop: asyncio.AbstractEventLoop,
+                               client: httpx.AsyncClient) -> AsyncIterator[None]:
+        """
+        事件循环关闭前会结束所有未完成的异步生成器（asyncio.run 调用 shutdown_asyncgens），
+        此时在该事件循环中关闭对应的 httpx 客户端并移除记录
+        """
+        try:
+            yield
+        finally:
+            with self._resources_lock:
+                if self._loop_resources.get(loop, (None,))[0] is client:
+                    del self._loop_resources[loop]
+            await client.aclose()
+
+    async def search_notes(self, query: str, top_k: Optional[int] = 3, deadline: Optional[float] = None,
+                           mode: str = "deep") -> List[Note]:
+        """
+        异步搜索相关笔记
+
+        Args:
+            query: 用户查询语句
+            top_k: 最多保留的引用片段数（Get 笔记 AI 综合回答不计入），为空时不限制
+            deadline: 本次请求的总截止时间（秒），包括排队时间，默认读取 GETNOTE_REQUEST_DEADLINE
+            mode: 检索模式，fast 或 deep（见 SEARCH_MODES）
+        Returns:
+            包含相关笔记信息的列表
+        Raises:
+            RuntimeError: 请求失败或超过截止时间
+            CircuitOpenError: 熔断器打开，请求被直接拒绝
+            asyncio.CancelledError: 调用方取消了请求
+        """
+        payload = build_search_payload(query, self.kb_id, mode)
+        client, semaphore = await self._loop_resources_for_current()
+        if deadline is None:
+            deadline = get_request_deadline()
+
+        # 缓存命中时不占用并发名额
+        cache = self.cache if self.cache is not None else get_query_cache()
+        cache_key = None
+        if cache is not None:
+            with span("getnote.cache") as attrs:
+                cache_key = cache.make_key(query, self.kb_id, payload["deep_seek"], payload["refs"], top_k)
+                cached = cache.get(cache_key)
+                attrs["hit"] = cached is not None
+            if cached is not None:
+                logger.info(f"命中检索缓存，查询：{query}")
+                return as_notes(cached)
+
+        async def search_within_deadline() -> List[Note]:
+            try:
+                return await asyncio.wait_for(self._search(query, payload, top_k, client, semaphore),
+                                              timeout=deadline)
+            except asyncio.TimeoutError as e:
+                logger.error(f"检索笔记超过截止时间 {deadline} 秒，查询：{query}")
+                raise RuntimeError(f"检索笔记时发生错误：超过截止时间 {deadline} 秒") from e
+
+        # 截止时间放在熔断器内部，超时计入失败率；熔断器打开时不排队，立即失败
+        notes = await self.breaker.acall(search_within_deadline)
+
+        if cache_key is not None and notes:
+            cache.set(cache_key, notes)
+        return notes
+
+    async def _search(self, query: str, payload: Dict[str, Any], top_k: Optional[int],
+                      client: httpx.AsyncClient, semaphore: asyncio.Semaphore) -> List[Note]:
+        """
+        在并发名额内发送请求并解析响应
+        """
+        async with semaphore:
+            logger.info(f"开始异步搜索笔记，查询：{query}")
+            url = f"{self.base_url}/knowledge/search"
+            connect_timeout, read_timeout = self.timeout
+            headers = with_request_id(self.headers)
+            limiter = self.rate_limiter or get_rate_limiter("getnote")
+
+            async def attempt(remaining: float) -> Any:
+                remaining -= await limiter.acquire_async(timeout=remaining)
+                timeout = httpx.Timeout(min(read_timeout, remaining), connect=min(connect_timeout, remaining))
+                async with client.stream("POST", url, headers=headers, json=payload,
+                                               timeout=timeout) as response:
+                    with span("getnote.request", deep_seek=payload["deep_seek"]) as attrs:
+                        attrs["status"] = response.status_code
+                        note_rate_limited(limiter, response)
+                        if response.is_error:
+                            # 错误响应较小，读取完整内容供日志使用
+                            await response.aread()
+                        response.raise_for_status()
+                    with span("getnote.parse") as attrs:
+                        limits = self.payload_limits.copy(top_k)
+                        result = await aread_search_response(response, limits, self.stream_threshold,
+                                                             on_ref=_ref_to_note)
+                        attrs["truncated"] = limits.truncated
+                        return result
+
+            try:
+                # 可重试的错误按指数退避重试，对冲请求中落后的一方会被取消
+                result = await async_call_with_retry(attempt, self.retry_policy, self.latency)
+                log_payload(logger, "API 返回原始结果：", result)
+                with span("getnote.normalize"):
+                    return normalize_search_result(result)
+            except RateLimitError:
+                raise
+            except httpx.HTTPError as e:
+                logger.error(f"网络请求错误：{e}")
+                error_detail = ""
+                if isinstance(e, httpx.HTTPStatusError):
+                    error_detail = f"服务器响应：{e.response.text}"
+                    logger.error(error_detail)
+                    if e.response.status_code == 429:
+                        raise RateLimitError(f"检索笔记时被限流（429）：{str(e)}") from e
+                raise RuntimeError(f"检索笔记时发生错误：{str(e)} {error_detail}") from e
+            except Exception as e:
+                logger.error(f"未知错误：{e}")
+                raise RuntimeError(f"检索笔记时发生错误：{str(e)}") from e
+
+    async def aclose(self):
+        """
+        关闭当前事件循环中自行创建的 httpx 客户端（其他事件循环的客户端在各自的循环结束时关闭）
+        """
+        with self._resources_lock:
+            resources = self._loop_resources.get(asyncio.get_running_loop())
+        if resources is not None and resources[2] is not None:
+            await resources[2].aclose()
+
+    async def __aenter__(self) -> "AsyncGetNoteAPI":
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
@@ -0,0 +1,154 @@
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class _Record(MutableMapping):
+    """
+    使用 __slots__ 存储固定字段的记录
+    同时实现映射接口（note["title"]、note.get("id")、dict(note)），与之前以字典表示的笔记用法兼容；
+    _fields 之外的字段存放在 extra 中（没有时为 None，不额外占用字典）。
+    _keep_none 为 False 时值为 None 的字段视为不存在
+    """
+
+    __slots__ = ("extra",)
+    _fields: Tuple[str, ...] = ()
+    _keep_none = False
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._fields:
+            value = getattr(self, key)
+            if value is not None or self._keep_none:
+                return value
+        elif self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self._fields:
+            value = getattr(self, key)
+            return default if value is None and not self._keep_none else value
+        if self.extra is not None:
+            return self.extra.get(key, default)
+        return default
+
+    def __contains__(self, key: Any) -> bool:
+        if key in self._fields:
+            return self._keep_none or getattr(self, key) is not None
+        return self.extra is not None and key in self.extra
+
+    def __setitem__(self, key: str, value: Any):
+        if key in self._fields:
+            setattr(self, key, value)
+        elif self.extra is None:
+            self.extra = {key: value}
+        else:
+            self.extra[key] = value
+
+    def __delitem__(self, key: str):
+        if key not in self:
+            raise KeyError(key)
+        if key in self._fields:
+            if self._keep_none:
+                raise KeyError(f"不能删除字段 {key}")
+            setattr(self, key, None)
+        else:
+            del self.extra[key]
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self._fields:
+            if self._keep_none or getattr(self, key) is not None:
+                yield key
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def copy(self):
+        clone = self.__class__.__new__(self.__class__)
+        for key in self._fields:
+            setattr(clone, key, getattr(self, key))
+        clone.extra = dict(self.extra) if self.extra is not None else None
+        return clone
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.to_dict()!r})"
+
+
+class Note(_Record):
+    """
+    一条检索结果：笔记、引用片段，或 Get 笔记 AI 综合回答（source 为 AI_ANSWER_SOURCE）
+    """
+
+    __slots__ = ("id", "title", "content", "source", "relevance_score", "fusion_score")
+    _fields = __slots__
+
+    def __init__(self, title: str = "", content: str = "", source: Optional[str] = None, id: Optional[str] = None,
+                 relevance_score: Optional[float] = None, fusion_score: Optional[float] = None,
+                 extra: Optional[Dict[str, Any]] = None):
+        self.id = id
+        self.title = title
+        self.content = content
+        self.source = source
+        self.relevance_score = relevance_score
+        self.fusion_score = fusion_score
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, item: Dict[str, Any]) -> "Note":
+        """
+        由字典（缓存中的笔记、本地镜像的记录、测试数据等）创建，未知字段保存在 extra 中
+        """
+        extra = {key: value for key, value in item.items() if key not in cls._fields}
+        note_id = item.get("id")
+        return cls(title=item.get("title") or "", content=item.get("content") or "", source=item.get("source"),
+                   id=str(note_id) if note_id is not None else None, relevance_score=item.get("relevance_score"),
+                   fusion_score=item.get("fusion_score"), extra=extra)
+
+
+class Reference(_Record):
+    """
+    回答中引用的一条笔记，reference_id 与回答中的 [笔记X] 标注对应
+    """
+
+    __slots__ = ("reference_id", "id", "title", "relevance_score")
+    _fields = __slots__
+    # 引用的字段总是全部输出（值可以为 None），与之前的结果格式一致
+    _keep_none = True
+
+    def __init__(self, reference_id: str, id: Optional[str] = None, title: Optional[str] = None,
+                 relevance_score: Optional[float] = None):
+        self.reference_id = reference_id
+        self.id = id
+        self.title = title
+        self.relevance_score = relevance_score
+        self.extra = None
+
+    @classmethod
+    def from_note(cls, note: Note, index: int) -> "Reference":
+        return cls(f"笔记{index}", note.id, note.title, note.relevance_score)
+
+
+def as_note(item: Any) -> Note:
+    return item if isinstance(item, Note) else Note.from_dict(item)
+
+
+def as_notes(items: Iterable[Any]) -> List[Note]:
+    """
+    转换为 Note 列表；已经全部是 Note 的列表原样返回（不复制，保留 RetrievedNotes 的 degraded 等属性）
+    """
+    if isinstance(items, list) and all(isinstance(item, Note) for item in items):
+        return items
+    return [as_note(item) for item in items]
+
+
+def json_default(value: Any) -> Any:
+    """
+    json.dumps 的 default 参数，将 Note/Reference 序列化为字典
+    """
+    if isinstance(value, _Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,314 @@
+import codecs
+import importlib.util
+import json
+import os
+import re
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Union
+from src.utils.logger import get_logger
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # 可选依赖
+    msgspec = None
+
+# 初始化日志
+logger = get_logger(__name__)
+
+# 影响响应解析的环境变量，变化时重新创建客户端
+PAYLOAD_ENV_KEYS = ("GETNOTE_ACCEPT_ENCODING", "GETNOTE_STREAM_PARSE_BYTES", "GETNOTE_MAX_REFS",
+                    "GETNOTE_MAX_CONTENT_CHARS", "GETNOTE_MAX_ANSWER_CHARS")
+
+# 截断的字段末尾加上省略号
+ELLIPSIS = "……"
+
+# 增量读取响应时每次读取的字节数
+CHUNK_SIZE = 64 * 1024
+
+# 扫描 JSON 结构的记号：字符串（没有结束引号时 group(1) 为空，即尚未接收完整）以及结构字符，
+# 数字、true/false/null 和空白不关心
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(")?|[{}\[\]:,]')
+_SKIP = re.compile(r"[\s,]*")
+
+
+def decode_json(data: Union[bytes, str]) -> Any:
+    """
+    解析 JSON（bytes 或 str），优先使用 orjson / msgspec（安装时），否则使用标准库
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if msgspec is not None:
+        return msgspec.json.decode(data)
+    return json.loads(data)
+
+
+def accept_encoding() -> str:
+    """
+    请求头 Accept-Encoding：GETNOTE_ACCEPT_ENCODING 优先，否则为 gzip、deflate，
+    安装了 brotli / zstandard 时再加上 br / zstd（requests 和 httpx 都能自动解压这些格式）
+    """
+    configured = os.getenv("GETNOTE_ACCEPT_ENCODING", "").strip()
+    if configured:
+        return configured
+    encodings = ["gzip", "deflate"]
+    if importlib.util.find_spec("brotli") or importlib.util.find_spec("brotlicffi"):
+        encodings.append("br")
+    if importlib.util.find_spec("zstandard"):
+        encodings.append("zstd")
+    return ", ".join(encodings)
+
+
+class PayloadLimits:
+    """
+    解析时对响应字段的截断限制，值为 0 表示不限制
+    超长的笔记正文在进入缓存、上下文打包之前就被截断，避免为用不上的内容占用内存
+    """
+
+    def __init__(self, max_refs: int = 0, max_content_chars: int = 0, max_answer_chars: int = 0):
+        """
+        Args:
+            max_refs: 最多保留的引用片段数（c.refs），之后的片段解析后直接丢弃
+            max_content_chars: 引用片段中每个字符串字段（正文等）的最大字符数
+            max_answer_chars: AI 综合回答（c.answers）的最大字符数
+        """
+        self.max_refs = max_refs
+        self.max_content_chars = max_content_chars
+        self.max_answer_chars = max_answer_chars
+        self.truncated = 0
+
+    @classmethod
+    def from_env(cls) -> "PayloadLimits":
+        return cls(
+            max_refs=int(os.getenv("GETNOTE_MAX_REFS", "0")),
+            max_content_chars=int(os.getenv("GETNOTE_MAX_CONTENT_CHARS", "20000")),
+            max_answer_chars=int(os.getenv("GETNOTE_MAX_ANSWER_CHARS", "0")),
+        )
+
+    def copy(self, max_refs: Optional[int] = None) -> "PayloadLimits":
+        """
+        每次解析使用一个副本，truncated 计数互不影响
+        max_refs 不为空（且不为 0）时与配置的上限取较小值，如 search_notes 的 top_k
+        """
+        limit = self.max_refs
+        if max_refs:
+            limit = min(limit, max_refs) if limit else max_refs
+        return PayloadLimits(limit, self.max_content_chars, self.max_answer_chars)
+
+    def _truncate(self, text: Any, limit: int) -> Any:
+        if not limit or not isinstance(text, str) or len(text) <= limit:
+            return text
+        self.truncated += 1
+        return text[:limit] + ELLIPSIS
+
+    def apply_ref(self, ref: Any) -> Any:
+        if self.max_content_chars and isinstance(ref, dict):
+            for key, value in ref.items():
+                if isinstance(value, str) and len(value) > self.max_content_chars:
+                    ref[key] = self._truncate(value, self.max_content_chars)
+        return ref
+
+    def apply_answer(self, body: Dict[str, Any]):
+        if "answers" in body:
+            body["answers"] = self._truncate(body["answers"], self.max_answer_chars)
+
+    def apply(self, result: Any) -> Any:
+        """
+        对已完整解析的响应应用限制（原地修改 c.answers 和 c.refs）
+        """
+        body = result.get("c") if isinstance(result, dict) else None
+        if not isinstance(body, dict):
+            return result
+        self.apply_answer(body)
+        refs = body.get("refs")
+        if isinstance(refs, list):
+            if self.max_refs and len(refs) > self.max_refs:
+                del refs[self.max_refs:]
+            for ref in refs:
+                self.apply_ref(ref)
+        return result
+
+
+class SearchResponseParser:
+    """
+    knowledge/search 响应的增量解析器
+    响应按块送入 feed：c.refs 数组之前和之后的部分保留为文本，最后一起解析；数组中的每个引用片段
+    一旦完整就解析、截断并交给 on_ref 转换（如转换为 Note），原始文本随即丢弃。
+    内存占用约为“响应中除引用片段以外的部分 + 单个片段 + 转换后的结果”，而不是整个响应的解析树
+    """
+
+    def __init__(self, limits: Optional[PayloadLimits] = None, on_ref: Optional[Callable[[Any], Any]] = None):
+        self.limits = limits or PayloadLimits()
+        self.on_ref = on_ref
+        self.refs: List[Any] = []
+        self.bytes = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._head: List[str] = []
+        self._buffer = ""
+        self._state = "scan"
+        self._found = False
+        # 扫描状态：容器栈（每层为 (括号, 所属的键)）、上一个记号、待使用的键
+        self._stack: List[tuple] = []
+        self._previous: Optional[str] = None
+        self._key: Optional[str] = None
+
+    def feed(self, chunk: bytes):
+        self.bytes += len(chunk)
+        self._buffer += self._decoder.decode(chunk)
+        if self._state == "scan":
+            self._scan()
+        if self._state == "refs":
+            self._read_refs(final=False)
+
+    def close(self) -> Any:
+        """
+        结束输入并返回解析结果，c.refs 为截断、转换后的引用片段
+        """
+        self._buffer += self._decoder.decode(b"", final=True)
+        if self._state == "refs":
+            self._read_refs(final=True)
+        result = decode_json("".join(self._head + [self._buffer]))
+        self._head, self._buffer = [], ""
+        if not self._found:
+            # 没有 c.refs（其他形状的响应）时按完整解析处理
+            return _finish(result, self.limits, self.on_ref)
+        result["c"]["refs"] = self.refs
+        self.limits.apply_answer(result["c"])
+        return result
+
+    def _scan(self):
+        """
+        扫描 JSON 结构直到遇到 c.refs 数组的开头
+        """
+        text = self._buffer
+        position = 0
+        for match in _TOKEN.finditer(text):
+            token = match.group()
+            if token[0] == '"':
+                if match.group(1) is None:
+                    # 字符串尚未结束，等待更多数据
+                    position = match.start()
+                    break
+                self._previous = token
+                position = match.end()
+                continue
+            position = match.end()
+            if token == ":":
+                self._key = self._previous
+            elif token in "{[":
+                if (token == "[" and self._key == '"refs"' and len(self._stack) == 2
+                        and self._stack[0][0] == "{" and self._stack[1] == ("{", '"c"')):
+                    self._found = True
+                    self._state = "refs"
+                    break
+                self._stack.append((token, self._key))
+                self._key = None
+            elif token in "}]":
+                if self._stack:
+                    self._stack.pop()
+                self._key = None
+            else:
+                self._key = None
+            self._previous = token
+        else:
+            position = len(text)
+        self._head.append(text[:position])
+        self._buffer = text[position:]
+
+    def _read_refs(self, final: bool):
+        """
+        逐个解析 c.refs 数组中已经完整的元素
+        """
+        text = self._buffer
+        position = 0
+        while True:
+            position = _SKIP.match(text, position).end()
+            if position >= len(text):
+                break
+            if text[position] == "]":
+                self._state = "tail"
+                break
+            try:
+                ref, end = self._json.raw_decode(text, position)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                # 元素尚未完整，等待更多数据
+                break
+            position = end
+            if self.limits.max_refs and len(self.refs) >= self.limits.max_refs:
+                continue
+            ref = self.limits.apply_ref(ref)
+            self.refs.append(self.on_ref(ref) if self.on_ref is not None else ref)
+        self._buffer = text[position:]
+
+
+def read_search_response(response: Any, limits: PayloadLimits, stream_threshold: int,
+                         on_ref: Optional[Callable[[Any], Any]] = None) -> Any:
+    """
+    读取并解析 knowledge/search 响应（requests 以 stream=True 发出的请求）
+    响应体超过 stream_threshold 字节（或长度未知）时增量解析，否则完整读取后用 decode_json 解析
+
+    Args:
+        response: requests.Response
+        limits: 字段截断限制
+        stream_threshold: 增量解析的阈值（字节，按传输大小），0 表示总是完整解析
+        on_ref: 对每个引用片段的转换
+    Returns:
+        解析结果
+    """
+    try:
+        length = _content_length(response.headers)
+        if not stream_threshold or length is not None and length <= stream_threshold:
+            return _finish(decode_json(response.content), limits, on_ref)
+        parser = SearchResponseParser(limits, on_ref)
+        for chunk in response.iter_content(CHUNK_SIZE):
+            parser.feed(chunk)
+        return parser.close()
+    finally:
+        response.close()
+
+
+async def aread_search_response(response: Any, limits: PayloadLimits, stream_threshold: int,
+                                on_ref: Optional[Callable[[Any], Any]] = None) -> Any:
+    """
+    read_search_response 的异步版本（httpx 的流式响应）
+    """
+    length = _content_length(response.headers)
+    if not stream_threshold or length is not None and length <= stream_threshold:
+        return _finish(decode_json(await response.aread()), limits, on_ref)
+    parser = SearchResponseParser(limits, on_ref)
+    chunks: AsyncIterator[bytes] = response.aiter_bytes(CHUNK_SIZE)
+    async for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+def parse_search_body(chunks: Iterable[bytes], limits: PayloadLimits,
+                      on_ref: Optional[Callable[[Any], Any]] = None) -> Any:
+    """
+    增量解析已分块的响应体
+    """
+    parser = SearchResponseParser(limits, on_ref)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+def _finish(result: Any, limits: PayloadLimits, on_ref: Optional[Callable[[Any], Any]]) -> Any:
+    limits.apply(result)
+    body = result.get("c") if isinstance(result, dict) else None
+    if on_ref is not None and isinstance(body, dict) and isinstance(body.get("refs"), list):
+        body["refs"] = [on_ref(ref) for ref in body["refs"]]
+    return result
+
+
+def _content_length(headers: Dict[str, str]) -> Optional[int]:
+    try:
+        return int(headers.get("Content-Length"))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,283 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from src.utils.logger import get_logger
+from src.utils.resources import get_resource
+from src.utils.tracing import metrics, record_span
+
+# 初始化日志
+logger = get_logger(__name__)
+
+# 影响各限流器配置的环境变量，变化时重新创建
+RATE_LIMIT_ENV_KEYS = {
+    "getnote": ("GETNOTE_RATE_LIMIT", "GETNOTE_RATE_BURST"),
+    "llm": ("LLM_RATE_LIMIT", "LLM_RATE_BURST", "LLM_TOKENS_PER_MINUTE"),
+}
+
+# 优先级通道：数值越小越优先，同一通道内先到先得
+LANES = {"interactive": 0, "batch": 1}
+
+# 当前调用所属的通道，批量任务和后台同步在 priority_lane("batch") 中执行
+_lane: ContextVar[str] = ContextVar("rate_limit_lane", default="interactive")
+
+
+class RateLimitError(RuntimeError):
+    """
+    超出调用配额：本地排队超过等待时限，或服务端持续返回 429
+    """
+
+
+@contextmanager
+def priority_lane(lane: str) -> Iterator[str]:
+    """
+    在指定的优先级通道中执行范围内的调用（包括通过 bind_context 提交到线程池的任务）
+    """
+    if lane not in LANES:
+        raise ValueError(f"未知的优先级通道：{lane}")
+    token = _lane.set(lane)
+    try:
+        yield lane
+    finally:
+        _lane.reset(token)
+
+
+def current_lane() -> str:
+    return _lane.get()
+
+
+class TokenBucket:
+    """
+    令牌桶：以 rate 个/秒的速度补充令牌，最多积累 capacity 个
+    令牌数可以为负（事后补扣的实际用量），欠下的部分需要先补回来才能放行后续调用
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 桶容量，即允许的突发量，默认为 1 秒的令牌数（至少 1 个）
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._clock = clock
+        self.tokens = self.capacity
+        self._updated = clock()
+
+    def refill(self) -> float:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return self.tokens
+
+    def wait_time(self, cost: float) -> float:
+        """
+        取得 cost 个令牌还需等待的秒数（调用方持有锁）；超过容量的请求等桶满即可放行
+        """
+        need = min(cost, self.capacity)
+        tokens = self.refill()
+        return 0.0 if tokens >= need else (need - tokens) / self.rate
+
+    def take(self, cost: float):
+        self.refill()
+        self.tokens -= cost
+
+
+class RateLimiter:
+    """
+    多预算、分优先级的请求调度器
+    每个预算是一个令牌桶（如每秒请求数、每分钟 LLM token 数），一次调用需要同时从所有相关的桶中取得令牌。
+    等待中的调用按（通道优先级, 到达顺序）排队，只有队首可以取令牌：交互式请求总是排在批量任务之前，
+    配额被批量任务占满时交互式请求也只需等待下一批令牌。没有配置任何预算且未被 429 暂停时 acquire 直接返回
+    """
+
+    def __init__(self, name: str, buckets: Optional[Dict[str, TokenBucket]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            name: 限流器名称，用于日志和指标
+            buckets: 预算名 -> 令牌桶，如 {"requests": ..., "tokens": ...}
+        """
+        self.name = name
+        self.buckets = buckets or {}
+        self._clock = clock
+        self._paused_until = 0.0
+        self._queue: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_env(cls, name: str) -> "RateLimiter":
+        """
+        按 GETNOTE_RATE_* 或 LLM_RATE_* / LLM_TOKENS_PER_MINUTE 环境变量创建限流器，值为 0 表示不限制
+        """
+        buckets: Dict[str, TokenBucket] = {}
+        prefix = "GETNOTE" if name == "getnote" else "LLM"
+        rate = float(os.getenv(f"{prefix}_RATE_LIMIT", "0"))
+        if rate > 0:
+            burst = os.getenv(f"{prefix}_RATE_BURST")
+            buckets["requests"] = TokenBucket(rate, float(burst) if burst else None)
+        if name == "llm":
+            tokens_per_minute = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+            if tokens_per_minute > 0:
+                buckets["tokens"] = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        return cls(name, buckets)
+
+    @property
+    def enabled(self) -> bool:
+        """
+        配置了预算，或正处于 429 之后的暂停期（未配置预算时也遵守服务端的 Retry-After）
+        """
+        return bool(self.buckets) or self._clock() < self._paused_until
+
+    def _poll(self, ticket: Tuple[int, int], costs: Dict[str, float]) -> float:
+        """
+        尝试为排队中的调用取得令牌（调用方持有锁）
+
+        Returns:
+            0 表示已取得令牌并出队，否则为建议的等待秒数
+        """
+        now = self._clock()
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._queue[0] != ticket:
+            # 不在队首时等待队首被放行后的通知
+            return 0.05
+        wait = max((self.buckets[name].wait_time(cost) for name, cost in costs.items() if name in self.buckets),
+                   default=0.0)
+        if wait > 0:
+            return wait
+        for name, cost in costs.items():
+            if name in self.buckets:
+                self.buckets[name].take(cost)
+        heapq.heappop(self._queue)
+        self._cond.notify_all()
+        return 0.0
+
+    def _enqueue(self, lane: str) -> Tuple[int, int]:
+        ticket = (LANES[lane], next(self._seq))
+        heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _leave(self, ticket: Tuple[int, int]):
+        self._queue.remove(ticket)
+        heapq.heapify(self._queue)
+        self._cond.notify_all()
+
+    def _record(self, lane: str, waited: float, start: float):
+        metrics.observe("rag_rate_limit_wait_seconds", waited, limiter=self.name, lane=lane)
+        if waited > 0.001:
+            record_span("ratelimit.wait", waited, start, limiter=self.name, lane=lane)
+
+    def _timeout(self, lane: str, timeout: float) -> RateLimitError:
+        metrics.inc("rag_rate_limited_total", limiter=self.name, reason="queue_timeout")
+        logger.warning(f"{self.name} 限流排队超过 {timeout:.1f} 秒（通道：{lane}）")
+        return RateLimitError(f"{self.name} 调用配额不足，排队超过 {timeout:.1f} 秒")
+
+    def acquire(self, timeout: Optional[float] = None, lane: Optional[str] = None, **costs: float) -> float:
+        """
+        阻塞直到取得令牌
+
+        Args:
+            timeout: 最长等待时间（秒），为空时一直等待
+            lane: 优先级通道，默认为当前上下文的通道
+            costs: 各预算的消耗，默认 requests=1
+        Returns:
+            排队等待的秒数
+        Raises:
+            RateLimitError: 超过 timeout 仍未取得令牌
+        """
+        if not self.enabled:
+            return 0.0
+        lane = lane or current_lane()
+        costs = costs or {"requests": 1}
+        start = time.perf_counter()
+        with self._cond:
+            ticket = self._enqueue(lane)
+            while True:
+                wait = self._poll(ticket, costs)
+                if not wait:
+                    break
+                if timeout is not None:
+                    remaining = timeout - (time.perf_counter() - start)
+                    if remaining <= 0:
+                        self._leave(ticket)
+                        raise self._timeout(lane, timeout)
+                    wait = min(wait, remaining)
+                self._cond.wait(wait)
+        waited = time.perf_counter() - start
+        self._record(lane, waited, start)
+        return waited
+
+    async def acquire_async(self, timeout: Optional[float] = None, lane: Optional[str] = None,
+                            **costs: float) -> float:
+        """
+        acquire 的异步版本，等待期间不阻塞事件循环
+        """
+        if not self.enabled:
+            return 0.0
+        lane = lane or current_lane()
+        costs = costs or {"requests": 1}
+        start = time.perf_counter()
+        with self._cond:
+            ticket = self._enqueue(lane)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._poll(ticket, costs)
+                if not wait:
+                    break
+                if timeout is not None:
+                    remaining = timeout - (time.perf_counter() - start)
+                    if remaining <= 0:
+                        raise self._timeout(lane, timeout)
+                    wait = min(wait, remaining)
+                # 异步等待无法被条件变量唤醒，按较短的间隔轮询
+                await asyncio.sleep(min(wait, 0.05))
+        except BaseException:
+            with self._cond:
+                if ticket in self._queue:
+                    self._leave(ticket)
+            raise
+        waited = time.perf_counter() - start
+        self._record(lane, waited, start)
+        return waited
+
+    def charge(self, **costs: float):
+        """
+        事后补扣实际用量（如生成完成后的回答 token 数），不等待，令牌可以扣成负数
+        """
+        if not self.buckets:
+            return
+        with self._cond:
+            for name, cost in costs.items():
+                if name in self.buckets:
+                    self.buckets[name].take(cost)
+
+    def pause(self, seconds: float):
+        """
+        服务端返回 429 时暂停放行 seconds 秒（如 Retry-After），避免其他调用继续触发限流
+        """
+        metrics.inc("rag_rate_limited_total", limiter=self.name, reason="upstream_429")
+        with self._cond:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+            for bucket in self.buckets.values():
+                bucket.refill()
+                bucket.tokens = min(bucket.tokens, 0.0)
+        if seconds > 0:
+            logger.warning(f"{self.name} 返回 429，暂停放行 {seconds:.1f} 秒")
+
+
+def get_rate_limiter(name: str) -> RateLimiter:
+    """
+    获取进程级共享的限流器，同一进程内的交互式请求和批量任务共用同一份配额
+
+    Args:
+        name: getnote（Get笔记 API）或 llm（LLM 接口）
+    """
+    return get_resource(f"rate_limiter:{name}", lambda: RateLimiter.from_env(name), RATE_LIMIT_ENV_KEYS[name])
@@ -0,0 +1,305 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Optional
+import httpx
+import requests
+from src.utils.logger import get_logger
+from src.utils.tracing import bind_context
+
+# 初始化日志
+logger = get_logger(__name__)
+
+# 限流、请求超时和服务端错误可以重试；其余 4xx 是请求本身的问题，重试也不会成功
+RETRYABLE_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class DeadlineExceeded(Exception):
+    """
+    超过请求总截止时间
+    """
+
+
+class RetryPolicy:
+    """
+    重试策略
+    指数退避 + 全抖动，按状态码区分可重试错误，并限制整个请求（含所有重试）的总截止时间；
+    可选对冲请求：首个请求超过 p95 延迟仍未返回时再发一个相同请求，取先返回的结果
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 deadline: float = 125.0, hedge_enabled: bool = False, hedge_delay: Optional[float] = None,
+                 hedge_quantile: float = 0.95, retry_statuses: frozenset = RETRYABLE_STATUS):
+        """
+        Args:
+            max_attempts: 最大尝试次数（含首次）
+            base_delay: 退避基准时间（秒）
+            max_delay: 单次退避的最长时间（秒）
+            deadline: 整个请求的截止时间（秒）
+            hedge_enabled: 是否启用对冲请求
+            hedge_delay: 延迟样本不足时使用的固定对冲等待时间（秒），为空时样本不足则不对冲
+            hedge_quantile: 以该分位数的历史延迟作为对冲等待时间
+            retry_statuses: 可重试的 HTTP 状态码
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.hedge_enabled = hedge_enabled
+        self.hedge_delay = hedge_delay
+        self.hedge_quantile = hedge_quantile
+        self.retry_statuses = retry_statuses
+
+    @classmethod
+    def from_env(cls, deadline: float) -> "RetryPolicy":
+        """
+        从 GETNOTE_RETRY_* / GETNOTE_HEDGE_* 环境变量创建重试策略
+
+        Args:
+            deadline: 请求总截止时间（秒）
+        """
+        hedge_delay = os.getenv("GETNOTE_HEDGE_DELAY")
+        return cls(
+            max_attempts=int(os.getenv("GETNOTE_RETRY_MAX_ATTEMPTS", "3")),
+            base_delay=float(os.getenv("GETNOTE_RETRY_BASE_DELAY", "0.5")),
+            max_delay=float(os.getenv("GETNOTE_RETRY_MAX_DELAY", "8")),
+            deadline=deadline,
+            hedge_enabled=os.getenv("GETNOTE_HEDGE_ENABLED", "false").strip().lower() in ("1", "true", "yes", "on"),
+            hedge_delay=float(hedge_delay) if hedge_delay else None,
+            hedge_quantile=float(os.getenv("GETNOTE_HEDGE_QUANTILE", "0.95")),
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """
+        第 attempt 次失败后的等待时间（全抖动）
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def status_of(self, exc: BaseException) -> Optional[int]:
+        response = getattr(exc, "response", None)
+        return getattr(response, "status_code", None) if response is not None else None
+
+    def is_retryable(self, exc: BaseException) -> bool:
+        """
+        判断错误是否值得重试
+        """
+        status = self.status_of(exc)
+        if status is not None:
+            return status in self.retry_statuses
+        # 连接失败、超时等网络错误可以重试；响应解析失败等其他错误不重试
+        return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                                httpx.TransportError))
+
+    def retry_after(self, exc: BaseException) -> Optional[float]:
+        """
+        读取 429/503 响应中的 Retry-After（秒）
+        """
+        response = getattr(exc, "response", None)
+        if response is None:
+            return None
+        value = response.headers.get("Retry-After")
+        try:
+            return max(0.0, float(value)) if value is not None else None
+        except ValueError:
+            return None
+
+    def delay_for(self, exc: BaseException, attempt: int) -> float:
+        retry_after = self.retry_after(exc)
+        return min(retry_after, self.max_delay) if retry_after is not None else self.backoff(attempt)
+
+
+def is_service_failure(exc: BaseException, policy: Optional[RetryPolicy] = None) -> bool:
+    """
+    判断异常是否说明 Get笔记服务本身异常（计入熔断器失败率）
+    超时、网络错误、429 和 5xx 计为失败；400/401 等请求本身的问题不计入
+
+    Args:
+        policy: 按其可重试状态码判断，默认使用 RetryPolicy 的默认状态码
+    """
+    cause = exc.__cause__ if exc.__cause__ is not None else exc
+    if isinstance(cause, (DeadlineExceeded, asyncio.TimeoutError)):
+        return True
+    return (policy or RetryPolicy()).is_retryable(cause)
+
+
+class LatencyTracker:
+    """
+    记录最近的请求延迟，用于计算对冲等待时间
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        返回延迟分位数，样本不足时返回 None
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# 对冲请求使用的共享线程池
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="getnote-hedge")
+
+
+def _hedge_wait(policy: RetryPolicy, tracker: Optional[LatencyTracker]) -> Optional[float]:
+    if not policy.hedge_enabled:
+        return None
+    observed = tracker.quantile(policy.hedge_quantile) if tracker is not None else None
+    return observed if observed is not None else policy.hedge_delay
+
+
+def _call_hedged(fn: Callable[[float], Any], remaining: float, hedge_after: float) -> Any:
+    """
+    发送请求，超过 hedge_after 秒仍未返回时再发一个相同请求，返回先成功的结果
+    同步请求无法中途中止，落后的请求结果会被丢弃，其连接在完成后回到连接池
+    """
+    start = time.monotonic()
+    fn = bind_context(fn)
+    first = _hedge_executor.submit(fn, remaining)
+    done, _ = wait([first], timeout=min(hedge_after, remaining))
+    if done:
+        return first.result()
+
+    logger.info(f"请求超过 {hedge_after:.2f} 秒未返回，发送对冲请求")
+    second = _hedge_executor.submit(fn, remaining - (time.monotonic() - start))
+    pending = {first, second}
+    error: Optional[BaseException] = None
+    while pending:
+        timeout = remaining - (time.monotonic() - start)
+        if timeout <= 0:
+            break
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for loser in pending:
+                    loser.cancel()
+                return future.result()
+            error = future.exception()
+    if error is not None:
+        raise error
+    raise DeadlineExceeded(f"超过截止时间 {remaining:.1f} 秒")
+
+
+def call_with_retry(fn: Callable[[float], Any], policy: RetryPolicy, tracker: Optional[LatencyTracker] = None) -> Any:
+    """
+    按重试策略调用 fn
+
+    Args:
+        fn: 单次尝试，参数为本次尝试可用的剩余时间（秒），应据此设置请求超时
+        policy: 重试策略
+        tracker: 延迟记录器，成功的尝试会记录延迟并用于计算对冲等待时间
+    Returns:
+        fn 的返回值
+    Raises:
+        DeadlineExceeded: 超过总截止时间
+        Exception: 不可重试的错误或重试次数用尽时的最后一个错误
+    """
+    deadline_at = time.monotonic() + policy.deadline
+    for attempt in range(policy.max_attempts):
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"超过截止时间 {policy.deadline:.1f} 秒")
+        start = time.monotonic()
+        try:
+            hedge_after = _hedge_wait(policy, tracker)
+            if hedge_after is not None:
+                result = _call_hedged(fn, remaining, hedge_after)
+            else:
+                result = fn(remaining)
+            if tracker is not None:
+                tracker.record(time.monotonic() - start)
+            return result
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if not policy.is_retryable(e) or attempt == policy.max_attempts - 1:
+                raise
+            delay = policy.delay_for(e, attempt)
+            if time.monotonic() + delay >= deadline_at:
+                raise
+            logger.warning(f"第 {attempt + 1} 次请求失败（{e}），{delay:.2f} 秒后重试")
+            time.sleep(delay)
+    raise DeadlineExceeded(f"超过截止时间 {policy.deadline:.1f} 秒")
+
+
+async def _async_call_hedged(fn: Callable[[float], Awaitable[Any]], remaining: float, hedge_after: float) -> Any:
+    """
+    call_hedged 的异步版本，落后的请求会被真正取消
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    first = asyncio.ensure_future(fn(remaining))
+    done, _ = await asyncio.wait({first}, timeout=min(hedge_after, remaining))
+    if done:
+        return first.result()
+
+    logger.info(f"请求超过 {hedge_after:.2f} 秒未返回，发送对冲请求")
+    second = asyncio.ensure_future(fn(remaining - (loop.time() - start)))
+    pending = {first, second}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            timeout = remaining - (loop.time() - start)
+            if timeout <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+    if error is not None:
+        raise error
+    raise DeadlineExceeded(f"超过截止时间 {remaining:.1f} 秒")
+
+
+async def async_call_with_retry(fn: Callable[[float], Awaitable[Any]], policy: RetryPolicy,
+                                tracker: Optional[LatencyTracker] = None) -> Any:
+    """
+    call_with_retry 的异步版本
+    """
+    loop = asyncio.get_running_loop()
+    deadline_at = loop.time() + policy.deadline
+    for attempt in range(policy.max_attempts):
+        remaining = deadline_at - loop.time()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"超过截止时间 {policy.deadline:.1f} 秒")
+        start = loop.time()
+        try:
+            hedge_after = _hedge_wait(policy, tracker)
+            if hedge_after is not None:
+                result = await _async_call_hedged(fn, remaining, hedge_after)
+            else:
+                result = await asyncio.wait_for(fn(remaining), timeout=remaining)
+            if tracker is not None:
+                tracker.record(loop.time() - start)
+            return result
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"超过截止时间 {policy.deadline:.1f} 秒")
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if not policy.is_retryable(e) or attempt == policy.max_attempts - 1:
+                raise
+            delay = policy.delay_for(e, attempt)
+            if loop.time() + delay >= deadline_at:
+                raise
+            logger.warning(f"第 {attempt + 1} 次请求失败（{e}），{delay:.2f} 秒后重试")
+            await asyncio.sleep(delay)
+    raise DeadlineExceeded(f"超过截止时间 {policy.deadline:.1f} 秒")
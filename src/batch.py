@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import threading
+import time
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+from src.api.models import json_default
+from src.api.rate_limiter import RateLimiter, TokenBucket, priority_lane
+from src.generation.generator import AnswerGenerator, get_answer_generator
+from src.retrieval.retrieval import retrieve_notes
+from src.retrieval.router import RETRIEVAL_MODES, get_mode_router
+from src.utils.logger import get_logger
+from src.utils.tracing import start_trace
+
+# 初始化日志
+logger = get_logger(__name__)
+
+# 统计延迟分位数的阶段
+STAGES = ("retrieval", "generation", "total")
+
+
+def read_questions(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    流式读取问题文件，跳过空行和格式错误的行
+
+    Args:
+        path: JSONL 文件路径，每行形如 {"id": "q1", "question": "..."}，也接受 query 字段
+    Yields:
+        {"id": 问题 ID（缺省为行号）, "question": 问题, ...原有的其他字段}
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"问题文件第 {line_number} 行不是有效的 JSON，已跳过：{e}")
+                continue
+            question = (item.get("question") or item.get("query")) if isinstance(item, dict) else None
+            if not question:
+                logger.warning(f"问题文件第 {line_number} 行缺少 question 字段，已跳过")
+                continue
+            item = dict(item, question=question)
+            item["id"] = str(item.get("id", line_number))
+            yield item
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """
+    从已有的输出文件中读取已经成功回答的问题 ID（同一 ID 以最后一行为准）
+    """
+    done: Dict[str, bool] = {}
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 上次运行中断时可能留下不完整的最后一行
+                continue
+            if isinstance(record, dict) and "id" in record:
+                done[str(record["id"])] = "error" not in record
+    return {question_id for question_id, ok in done.items() if ok}
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """
+    计算百分位数（最近秩法）
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class BatchReport:
+    """
+    批量问答的统计：完成数、失败数、吞吐量和各阶段延迟
+    """
+
+    def __init__(self, skipped: int = 0):
+        self.skipped = skipped
+        self.succeeded = 0
+        self.failed = 0
+        self.latencies: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self._start = time.perf_counter()
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]):
+        with self._lock:
+            if "error" in record:
+                self.failed += 1
+            else:
+                self.succeeded += 1
+            for stage, value in record.get("timings", {}).items():
+                if stage in self.latencies:
+                    self.latencies[stage].append(value)
+            self.elapsed = time.perf_counter() - self._start
+
+    @property
+    def completed(self) -> int:
+        return self.succeeded + self.failed
+
+    @property
+    def questions_per_minute(self) -> float:
+        return self.completed / self.elapsed * 60 if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        with self._lock:
+            lines = [f"完成 {self.completed} 个问题（成功 {self.succeeded}，失败 {self.failed}，"
+                     f"跳过已完成 {self.skipped}），耗时 {self.elapsed:.1f} 秒，"
+                     f"吞吐量 {self.questions_per_minute:.1f} 问题/分钟"]
+            for stage, samples in self.latencies.items():
+                if samples:
+                    lines.append(f"{stage:<10} p50={percentile(samples, 50):7.3f}s  "
+                                 f"p95={percentile(samples, 95):7.3f}s  max={max(samples):7.3f}s")
+            return "\n".join(lines)
+
+
+def answer_question(item: Dict[str, Any], top_k: int, generator: AnswerGenerator,
+                    retrieve: Callable[[str, int], List[Dict[str, Any]]] = retrieve_notes) -> Dict[str, Any]:
+    """
+    回答一个问题，返回输出文件中的一行记录；出错时记录 error 字段而不是抛出异常
+    """
+    question = item["question"]
+    record: Dict[str, Any] = {"id": item["id"], "question": question}
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    with start_trace(name="batch", question_id=item["id"], top_k=top_k) as trace:
+        record["request_id"] = trace.request_id
+        try:
+            notes = retrieve(question, top_k)
+            timings["retrieval"] = time.perf_counter() - start
+            generation_start = time.perf_counter()
+            result = generator.generate(question, notes)
+            timings["generation"] = time.perf_counter() - generation_start
+            record.update(result)
+        except Exception as e:
+            logger.warning(f"问题 {item['id']} 处理失败：{e}")
+            record["error"] = str(e)
+    timings["total"] = time.perf_counter() - start
+    record["timings"] = {stage: round(value, 6) for stage, value in timings.items()}
+    return record
+
+
+def run_batch(questions: Iterable[Dict[str, Any]], output_path: str, concurrency: Optional[int] = None,
+              rate: Optional[float] = None, top_k: Optional[int] = None, generator: Optional[AnswerGenerator] = None,
+              retrieve: Callable[[str, int], List[Dict[str, Any]]] = retrieve_notes,
+              progress_interval: float = 30.0) -> BatchReport:
+    """
+    批量回答问题，结果逐行追加到 output_path，已成功回答的问题（按 id）跳过
+    输出文件同时是检查点：中断后重新运行，只处理剩余的和失败的问题
+
+    Args:
+        questions: 问题迭代器（如 read_questions 的返回值），按需读取，不会一次性载入
+        output_path: 输出 JSONL 文件路径，同时作为检查点
+        concurrency: 并发处理的问题数，默认读取 BATCH_CONCURRENCY
+        rate: 每秒最多开始的问题数，默认读取 BATCH_RATE_LIMIT，0 表示不限制
+        top_k: 每个问题检索的最大笔记数，默认读取 TOP_K
+        generator: 回答生成器，默认使用进程级共享的实例
+        retrieve: 检索函数
+        progress_interval: 输出进度日志的间隔（秒）
+    Returns:
+        BatchReport
+    """
+    concurrency = concurrency or int(os.getenv("BATCH_CONCURRENCY", "4"))
+    rate = rate if rate is not None else float(os.getenv("BATCH_RATE_LIMIT", "0"))
+    top_k = top_k or int(os.getenv("TOP_K", "3"))
+    generator = generator or get_answer_generator()
+    # 批量任务自身的启动速率；API 和 LLM 的共享配额在 batch 通道中排队，让交互式请求优先
+    limiter = RateLimiter("batch", {"requests": TokenBucket(rate, 1.0)} if rate > 0 else {})
+
+    done = load_checkpoint(output_path)
+    report = BatchReport()
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if os.path.exists(output_path) and os.path.getsize(output_path):
+        # 上次中断时最后一行可能没有写完，另起一行继续追加
+        with open(output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            incomplete = f.read(1) != b"\n"
+    else:
+        incomplete = False
+
+    def process(item: Dict[str, Any]) -> Dict[str, Any]:
+        with priority_lane("batch"):
+            limiter.acquire()
+            return answer_question(item, top_k, generator, retrieve)
+
+    last_progress = time.monotonic()
+    with open(output_path, "a", encoding="utf-8") as output, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+        if incomplete:
+            output.write("\n")
+        pending: Set[Future] = set()
+
+        def drain(block_until: int):
+            # 等待在途问题数降到 block_until 以下，写出已完成的结果
+            nonlocal pending, last_progress
+            while len(pending) > block_until:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record = future.result()
+                    output.write(json.dumps(record, ensure_ascii=False, default=json_default) + "\n")
+                    output.flush()
+                    report.add(record)
+                if time.monotonic() - last_progress >= progress_interval:
+                    last_progress = time.monotonic()
+                    logger.info(f"批量问答进度：已完成 {report.completed}，"
+                                f"{report.questions_per_minute:.1f} 问题/分钟")
+
+        try:
+            for item in questions:
+                if item["id"] in done:
+                    report.skipped += 1
+                    continue
+                # 只预读少量问题，输入文件再大也不会全部进入内存
+                drain(concurrency * 2 - 1)
+                pending.add(executor.submit(process, item))
+            drain(0)
+        except KeyboardInterrupt:
+            # 已完成的结果都已写出，下次运行从检查点继续
+            logger.warning("批量问答被中断，等待进行中的问题完成")
+            for future in pending:
+                future.cancel()
+            drain(0)
+            raise
+    logger.info("批量问答完成：" + report.summary().replace("\n", "；"))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Get笔记批量问答")
+    parser.add_argument("input", help="问题文件（JSONL，每行包含 question 字段，可选 id 字段）")
+    parser.add_argument("-o", "--output", help="输出文件（JSONL），默认为 <输入文件名>.answers.jsonl")
+    parser.add_argument("--concurrency", type=int, help="并发处理的问题数，默认读取 BATCH_CONCURRENCY")
+    parser.add_argument("--rate", type=float, help="每秒最多开始的问题数，默认读取 BATCH_RATE_LIMIT")
+    parser.add_argument("--top-k", type=int, help="每个问题检索的最大笔记数，默认读取 TOP_K")
+    parser.add_argument("--mode", choices=RETRIEVAL_MODES, help="检索模式，默认读取 RETRIEVAL_MODE")
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.input)[0] + ".answers.jsonl"
+    retrieve = partial(retrieve_notes, mode=args.mode) if args.mode else retrieve_notes
+    report = run_batch(read_questions(args.input), output, args.concurrency, args.rate, args.top_k,
+                       retrieve=retrieve)
+    print(report.summary())
+    # 各检索模式的耗时和升级次数，用于调整 RETRIEVAL_MODE / RETRIEVAL_ESCALATE_MIN_HITS
+    modes = get_mode_router().summary()
+    if modes:
+        print(modes)
+    gate = get_answer_generator().gate.snapshot()
+    if gate["direct"]:
+        print(f"直接使用Get笔记 AI 综合回答 {gate['direct']} 次（跳过比例 {gate['skip_rate']:.0%}），"
+              f"预计节省 LLM 生成时间 {gate['saved_seconds']:.1f} 秒")
+    print(f"结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import hashlib
+import json
+import os
+from typing import Optional
+from src.cache.query_cache import QueryCache, cache_env_keys, create_cache_from_env, normalize_query
+from src.utils.resources import get_resource
+
+# 影响回答缓存配置的环境变量
+ANSWER_CACHE_ENV_KEYS = cache_env_keys("ANSWER_CACHE")
+
+
+def make_answer_key(query: str, context: str, history: str, model: str, prompt_version: str) -> str:
+    """
+    生成回答缓存键：归一化问题、打包后的笔记上下文哈希、历史对话、模型名和提示模板版本
+    上下文相同说明检索到的内容（按 token 预算挑选后）一致；模型或提示模板变化后旧条目不再命中，
+    随后按 LRU / 过期时间淘汰
+    """
+    context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+    raw = json.dumps([normalize_query(query), context_hash, history, model, prompt_version], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _create_from_env() -> Optional[QueryCache]:
+    # 回答缓存默认关闭，与语义缓存一样按需开启
+    return create_cache_from_env("ANSWER_CACHE", "回答缓存", "getnote:answer:", default_backend="none",
+                                 default_ttl=86400, default_path=os.path.join("cache", "answer_cache.sqlite3"))
+
+
+def get_answer_cache() -> Optional[QueryCache]:
+    """
+    获取进程级共享的回答缓存，环境变量配置变化时重新创建
+    """
+    return get_resource("answer_cache", _create_from_env, ANSWER_CACHE_ENV_KEYS)
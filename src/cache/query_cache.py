@@ -0,0 +1,347 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from src.api.models import json_default
+from src.utils.logger import get_logger
+from src.utils.resources import get_resource
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 初始化日志
+logger = get_logger(__name__)
+
+# 句末标点在语义上不影响检索结果，归一化时去掉
+_TRAILING_PUNCTUATION = "?？!！。.,，;；:：~～…"
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    归一化查询文本，使仅有全半角、大小写、空白或句末标点差异的问题命中同一缓存
+
+    Args:
+        text: 原始问题
+    Returns:
+        归一化后的问题
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    text = _WHITESPACE.sub(" ", text).strip().lower()
+    return text.rstrip(_TRAILING_PUNCTUATION + " ")
+
+
+class MemoryBackend:
+    """
+    进程内缓存后端
+    基于 OrderedDict 实现 LRU，按键和值的字节数统计内存占用，超过上限时淘汰最久未使用的条目
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            # 单个条目超过上限时不缓存，避免清空整个缓存
+            return
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+            expires_at = time.time() + ttl if ttl else None
+            self._items[key] = (expires_at, value)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._items))
+                self._remove(oldest)
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _remove(self, key: str):
+        _, value = self._items.pop(key)
+        self.current_bytes -= len(key) + len(value)
+
+
+class SQLiteBackend:
+    """
+    磁盘 SQLite 缓存后端
+    进程重启后缓存仍然有效；按最近访问时间淘汰，使总字节数不超过上限
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache(last_access)")
+
+    @property
+    def current_bytes(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()
+        return row[0]
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+            return bytes(value)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), size, expires_at, now),
+            )
+            self._evict(now)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self, now: float):
+        """
+        先清理过期条目，再按最近访问时间淘汰直到低于字节上限
+        """
+        self._conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM cache ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            total -= size
+
+
+class RedisBackend:
+    """
+    Redis 缓存后端
+    只依赖 get / set(px=) / delete 三个方法，任何兼容 redis-py 接口的客户端（包括本地假实现）都可以使用。
+    内存上限和淘汰策略由 Redis 服务端的 maxmemory 配置负责。
+    """
+
+    def __init__(self, client: Any, prefix: str = "getnote:query:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str = "getnote:query:") -> "RedisBackend":
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("使用 Redis 缓存后端需要安装 redis 包：pip install redis")
+        return cls(redis.Redis.from_url(url), prefix)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self.client.set(self.prefix + key, value, px=max(1, int(ttl * 1000)) if ttl else None)
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        # 按前缀清理需要 scan，Redis 客户端不一定支持，交由过期时间回收
+        scan_iter = getattr(self.client, "scan_iter", None)
+        if scan_iter is not None:
+            for key in scan_iter(match=self.prefix + "*"):
+                self.client.delete(key)
+
+
+class QueryCache:
+    """
+    知识库检索结果缓存
+    以归一化问题 + kb_id + deep_seek/refs 开关 + top_k 为键，值为 search_notes 返回的笔记列表；
+    回答缓存也使用该类（键由 answer_cache.make_answer_key 生成），label 用于区分日志
+    """
+
+    def __init__(self, backend: Any, ttl: Optional[float] = 3600, label: str = "检索缓存"):
+        self.backend = backend
+        self.ttl = ttl
+        self.label = label
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(question: str, kb_id: str, deep_seek: bool, refs: bool, top_k: Optional[int] = None) -> str:
+        """
+        生成缓存键
+        """
+        raw = json.dumps([normalize_query(question), kb_id, bool(deep_seek), bool(refs), top_k or 0],
+                         ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            # 缓存故障不应影响正常检索
+            logger.warning(f"读取{self.label}失败：{e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, value: Any):
+        try:
+            self.backend.set(key, json.dumps(value, ensure_ascii=False, default=json_default).encode("utf-8"), self.ttl)
+        except Exception as e:
+            logger.warning(f"写入{self.label}失败：{e}")
+
+    def clear(self):
+        self.backend.clear()
+
+    def close(self):
+        """
+        释放后端资源（如 SQLite 连接）
+        """
+        close = getattr(self.backend, "close", None)
+        if close is not None:
+            close()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        返回命中统计
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def cache_env_keys(env_prefix: str) -> tuple:
+    """
+    按前缀配置的缓存（QUERY_CACHE、ANSWER_CACHE）对应的环境变量
+    """
+    return tuple(f"{env_prefix}_{name}" for name in ("BACKEND", "TTL", "MAX_BYTES", "PATH", "REDIS_URL"))
+
+
+# 影响检索缓存配置的环境变量
+QUERY_CACHE_ENV_KEYS = cache_env_keys("QUERY_CACHE")
+
+
+def create_cache_from_env(env_prefix: str, label: str, redis_prefix: str, default_backend: str = "memory",
+                          default_ttl: float = 3600, default_path: str = "") -> Optional[QueryCache]:
+    """
+    按 <env_prefix>_BACKEND / _TTL / _MAX_BYTES / _PATH / _REDIS_URL 环境变量创建缓存
+
+    Args:
+        env_prefix: 环境变量前缀
+        label: 缓存名称，用于日志
+        redis_prefix: Redis 键前缀，不同缓存共用一个 Redis 时互不冲突
+        default_backend: 默认后端
+        default_ttl: 默认有效期（秒）
+        default_path: 默认 SQLite 文件路径
+    """
+    backend = os.getenv(f"{env_prefix}_BACKEND", default_backend).strip().lower()
+    logger.info(f"{label}后端：{backend}")
+    return create_query_cache(
+        backend,
+        float(os.getenv(f"{env_prefix}_TTL", str(default_ttl))),
+        int(os.getenv(f"{env_prefix}_MAX_BYTES", str(64 * 1024 * 1024))),
+        os.getenv(f"{env_prefix}_PATH", default_path),
+        os.getenv(f"{env_prefix}_REDIS_URL", "redis://localhost:6379/0"),
+        redis_prefix=redis_prefix,
+        label=label,
+    )
+
+
+def create_query_cache(backend: str, ttl: float, max_bytes: int, path: str, redis_url: str,
+                       redis_prefix: str = "getnote:query:", label: str = "检索缓存") -> Optional[QueryCache]:
+    """
+    按配置创建缓存，backend 为 none 时返回 None
+    """
+    if backend in ("", "none", "off", "false"):
+        return None
+    if backend == "memory":
+        return QueryCache(MemoryBackend(max_bytes), ttl, label)
+    if backend == "sqlite":
+        return QueryCache(SQLiteBackend(path, max_bytes), ttl, label)
+    if backend == "redis":
+        return QueryCache(RedisBackend.from_url(redis_url, prefix=redis_prefix), ttl, label)
+    raise ValueError(f"不支持的{label}后端：{backend}")
+
+
+def _create_from_env() -> Optional[QueryCache]:
+    return create_cache_from_env("QUERY_CACHE", "检索缓存", "getnote:query:",
+                                 default_path=os.path.join("cache", "query_cache.sqlite3"))
+
+
+def get_query_cache() -> Optional[QueryCache]:
+    """
+    获取进程级共享的检索缓存，环境变量配置变化时重新创建
+    """
+    return get_resource("query_cache", _create_from_env, QUERY_CACHE_ENV_KEYS)
@@ -0,0 +1,162 @@
+import os
+import threading
+from typing import Any, Dict, Optional
+import numpy as np
+from src.utils.embedding import FUNCTION_CHARS, HashingVectorizer, tokenize
+from src.utils.logger import get_logger
+from src.utils.resources import get_resource
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 初始化日志
+logger = get_logger(__name__)
+
+
+def content_chars(text: str) -> frozenset:
+    """
+    提取问题中的实词字符集合
+    """
+    return frozenset(token for token in tokenize(text) if token not in FUNCTION_CHARS)
+
+
+def content_overlap(a: frozenset, b: frozenset) -> float:
+    """
+    计算两个实词字符集合的重合比例（交集大小 / 并集大小），都为空时视为完全重合
+    """
+    union = len(a | b)
+    return len(a & b) / union if union else 1.0
+
+
+class SemanticCache:
+    """
+    语义缓存
+    对问题进行向量化，在 NumPy 矩阵中查找余弦相似度超过阈值的历史问题并复用其结果。
+
+    字符哈希向量无法区分“高血压”和“高血糖”这类只差一个关键字的问题，
+    因此命中时还要求两个问题的实词字符集合足够重合（交集 / 并集不低于 min_overlap）：
+    改写时增删一两个实词（如“用饮食来控制”）仍可命中，短问题中替换关键字则会被拒绝。
+    条目可以附带指纹（如生成回答时的笔记、模型和提示模板版本），指纹不同的条目不会命中。
+    """
+
+    def __init__(self, vectorizer: Optional[HashingVectorizer] = None, threshold: float = 0.7, max_entries: int = 1000,
+                 min_overlap: float = 0.8):
+        self.vectorizer = vectorizer or HashingVectorizer()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.min_overlap = min_overlap
+        # 环形缓冲区：写满后覆盖最早的条目
+        self._matrix = np.zeros((max_entries, self.vectorizer.dim), dtype=np.float32)
+        self._questions = [None] * max_entries
+        self._content = [None] * max_entries
+        self._values = [None] * max_entries
+        self._fingerprints: list = [None] * max_entries
+        self._latencies = [0.0] * max_entries
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def lookup(self, question: str, fingerprint: Optional[str] = None) -> Optional[Any]:
+        """
+        查找语义相近的历史问题
+
+        Args:
+            question: 用户问题
+            fingerprint: 结果依赖的其他条件，只命中写入时指纹相同的条目
+        Returns:
+            命中时返回缓存的结果，否则返回 None
+        """
+        vector = self.vectorizer.embed(question)
+        content = content_chars(question)
+        with self._lock:
+            if self._size:
+                similarities = self._matrix[:self._size] @ vector
+                # 按相似度从高到低检查少量候选，跳过实词或指纹不一致的问题
+                candidates = np.flatnonzero(similarities >= self.threshold)
+                for index in candidates[np.argsort(-similarities[candidates])][:5]:
+                    if (self._fingerprints[index] == fingerprint
+                            and content_overlap(self._content[index], content) >= self.min_overlap):
+                        self.hits += 1
+                        self.saved_seconds += self._latencies[index]
+                        logger.info(
+                            f"命中语义缓存（相似度 {similarities[index]:.3f}，原问题：{self._questions[index]}），"
+                            f"节省约 {self._latencies[index]:.2f} 秒，累计命中率 {self.hit_rate:.1%}"
+                        )
+                        return self._values[index]
+            self.misses += 1
+            return None
+
+    def store(self, question: str, value: Any, latency: float = 0.0, fingerprint: Optional[str] = None):
+        """
+        写入缓存
+
+        Args:
+            question: 用户问题
+            value: 需要缓存的结果
+            latency: 得到该结果所花费的时间（秒），用于统计命中后节省的时间
+            fingerprint: 结果依赖的其他条件，见 lookup
+        """
+        vector = self.vectorizer.embed(question)
+        with self._lock:
+            index = self._next
+            self._matrix[index] = vector
+            self._questions[index] = question
+            self._content[index] = content_chars(question)
+            self._values[index] = value
+            self._fingerprints[index] = fingerprint
+            self._latencies[index] = latency
+            self._next = (self._next + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._next = 0
+            self._values = [None] * self.max_entries
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        返回命中率和节省的时间
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "saved_seconds": self.saved_seconds,
+            "size": self._size,
+        }
+
+
+# 影响语义缓存配置的环境变量
+SEMANTIC_CACHE_ENV_KEYS = ("SEMANTIC_CACHE_ENABLED", "SIMILARITY_THRESHOLD", "SEMANTIC_CACHE_MAX_ENTRIES",
+                           "SEMANTIC_CACHE_MIN_OVERLAP")
+
+
+def get_semantic_cache(namespace: str) -> Optional[SemanticCache]:
+    """
+    获取指定命名空间的进程级语义缓存，未启用时返回 None
+    检索结果和生成的回答使用不同的命名空间；环境变量配置变化时重新创建
+
+    Args:
+        namespace: 缓存命名空间，例如 "notes" 或 "answers"
+    """
+    if os.getenv("SEMANTIC_CACHE_ENABLED", "false").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    return get_resource(
+        f"semantic_cache:{namespace}",
+        lambda: SemanticCache(
+            threshold=float(os.getenv("SIMILARITY_THRESHOLD", "0.7")),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")),
+            min_overlap=float(os.getenv("SEMANTIC_CACHE_MIN_OVERLAP", "0.8")),
+        ),
+        SEMANTIC_CACHE_ENV_KEYS,
+    )
@@ -0,0 +1,323 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from src.api.models import json_default
+from src.cache.query_cache import normalize_query
+from src.utils.logger import get_logger
+from src.utils.resources import get_resource
+from src.utils.tracing import bind_context, metrics, record_span
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 初始化日志
+logger = get_logger(__name__)
+
+# 影响请求合并配置的环境变量，变化时重新创建
+SINGLE_FLIGHT_ENV_KEYS = ("SINGLE_FLIGHT_ENABLED", "SINGLE_FLIGHT_LOCK_DIR", "SINGLE_FLIGHT_WAIT_TIMEOUT")
+
+# 跨进程结果文件的清理间隔（次）与保留时间（秒）
+_SWEEP_EVERY = 100
+_RESULT_MAX_AGE = 600.0
+
+
+def make_key(query: str, *parts: Any) -> str:
+    """
+    由归一化问题和其他参数（top_k、上下文哈希等）生成合并键
+    """
+    raw = json.dumps([normalize_query(query)] + [str(part) for part in parts], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def notes_hash(notes: List[Dict[str, Any]]) -> str:
+    """
+    笔记列表的内容哈希，检索结果相同的问题才会合并生成
+    """
+    raw = json.dumps([[note.get("id"), note.get("title"), note.get("content")] for note in notes],
+                     ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class _Call:
+    """
+    一次在途调用，等待者在 done 上阻塞
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _Broadcast:
+    """
+    一次在途的流式调用：后台线程产出的片段追加到 items，订阅者从头读取并等待新片段
+    """
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.cond = threading.Condition()
+
+    def subscribe(self, copy_items: bool) -> Iterator[Any]:
+        index = 0
+        while True:
+            with self.cond:
+                while index >= len(self.items) and not self.finished:
+                    self.cond.wait()
+                items = self.items[index:]
+                finished, error = self.finished, self.error
+            for item in items:
+                yield copy.copy(item) if copy_items else item
+            index += len(items)
+            if finished and index >= len(self.items):
+                if error is not None:
+                    raise error
+                return
+
+
+class _FileLock:
+    """
+    基于文件的跨进程互斥锁（POSIX 使用 flock，Windows 使用 msvcrt.locking）
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def acquire(self, timeout: float) -> bool:
+        """
+        Returns:
+            是否在 timeout 秒内取得锁
+        """
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                self._fd = fd
+                return True
+            except OSError:
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    return False
+                time.sleep(0.01)
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class SingleFlight:
+    """
+    合并相同的在途请求（single-flight）
+    同一进程内，相同键的并发调用只有第一个（领头者）真正执行，其余调用等待并得到同一结果（或同一异常）；
+    流式调用由后台线程执行，所有调用方作为订阅者收到完整的片段序列。
+    配置 lock_dir 后还会跨进程合并：各进程的领头者在文件锁上排队，后拿到锁的进程如果发现
+    在它开始等待之后写入的结果文件，就直接使用该结果，不再重复执行。
+    只合并同时在途的请求，调用结束后不保留结果（复用已完成的结果由检索缓存和语义缓存负责）
+    """
+
+    def __init__(self, name: str, lock_dir: Optional[str] = None, wait_timeout: float = 130.0,
+                 encode: Optional[Callable[[Any], Any]] = None, decode: Optional[Callable[[Any], Any]] = None):
+        """
+        Args:
+            name: 名称，用于日志、指标和锁文件名
+            lock_dir: 跨进程锁和结果文件所在目录，为空时只在进程内合并
+            wait_timeout: 跨进程等待文件锁的最长时间（秒），超时后自行执行
+            encode: 结果写入结果文件前的转换（需转换为可 JSON 序列化的值）
+            decode: 从结果文件读出后的转换
+        """
+        self.name = name
+        self.lock_dir = lock_dir
+        self.wait_timeout = wait_timeout
+        self.encode = encode or (lambda value: value)
+        self.decode = decode or (lambda value: value)
+        self.coalesced = 0
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self._lock = threading.Lock()
+        self._runs = 0
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    def _joined(self, source: str):
+        self.coalesced += 1
+        metrics.inc("rag_coalesced_total", flight=self.name, source=source)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        执行 fn，相同键的在途调用共享同一次执行
+
+        Args:
+            key: 合并键（如 make_key 的返回值）
+            fn: 无参函数
+        Returns:
+            fn 的返回值；等待者得到其浅拷贝，修改返回值不会互相影响
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            start = time.perf_counter()
+            call.done.wait()
+            self._joined("thread")
+            record_span("singleflight.wait", time.perf_counter() - start, start, flight=self.name)
+            if call.error is not None:
+                raise call.error
+            return copy.copy(call.result)
+
+        try:
+            call.result = self._run(key, fn) if self.lock_dir else fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stream(self, key: str, fn: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+        """
+        流式版本：fn 返回的迭代器在后台线程中消费，相同键的在途调用都从头收到相同的片段
+        只在进程内合并
+
+        Args:
+            key: 合并键
+            fn: 返回迭代器的无参函数
+        Yields:
+            fn 产出的片段（字典等可变对象对等待者为浅拷贝）
+        """
+        with self._lock:
+            broadcast = self._streams.get(key)
+            leader = broadcast is None
+            if leader:
+                broadcast = self._streams[key] = _Broadcast()
+        if not leader:
+            self._joined("thread")
+        else:
+            def produce():
+                try:
+                    for item in fn():
+                        with broadcast.cond:
+                            broadcast.items.append(item)
+                            broadcast.cond.notify_all()
+                except BaseException as e:
+                    broadcast.error = e
+                finally:
+                    with self._lock:
+                        del self._streams[key]
+                    with broadcast.cond:
+                        broadcast.finished = True
+                        broadcast.cond.notify_all()
+
+            # 后台线程沿用领头者的上下文（请求 ID、追踪），领头的调用方中途放弃也不影响其他订阅者
+            threading.Thread(target=bind_context(produce), name=f"singleflight-{self.name}", daemon=True).start()
+        return broadcast.subscribe(copy_items=not leader)
+
+    def _run(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        在跨进程文件锁内执行 fn，并把结果写入结果文件供其他进程中等待的调用使用
+        """
+        path = os.path.join(self.lock_dir, f"{self.name}-{key[:32]}")
+        start = time.time()
+        lock = _FileLock(path + ".lock")
+        if not lock.acquire(self.wait_timeout):
+            logger.warning(f"等待 {self.name} 跨进程锁超过 {self.wait_timeout:.0f} 秒，自行执行")
+            return fn()
+        try:
+            shared = self._read_result(path + ".json", start)
+            if shared is not None:
+                self._joined("process")
+                return self.decode(shared["value"])
+            result = fn()
+            self._write_result(path + ".json", result)
+            return result
+        finally:
+            lock.release()
+
+    def _read_result(self, path: str, since: float) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                shared = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # 只使用在本次调用开始之后完成的结果，即与本次调用同时在途的那次执行
+        return shared if shared.get("written_at", 0) >= since else None
+
+    def _write_result(self, path: str, result: Any):
+        try:
+            payload = json.dumps({"written_at": time.time(), "value": self.encode(result)}, ensure_ascii=False,
+                                 default=json_default)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"写入 {self.name} 合并结果失败：{e}")
+        self._runs += 1
+        if self._runs % _SWEEP_EVERY == 0:
+            self._sweep()
+
+    def _sweep(self):
+        """
+        清理长时间未使用的锁文件和结果文件
+        """
+        cutoff = time.time() - _RESULT_MAX_AGE
+        try:
+            for entry in os.scandir(self.lock_dir):
+                if entry.name.startswith(self.name + "-") and entry.stat().st_mtime < cutoff:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+        except OSError as e:
+            logger.warning(f"清理 {self.name} 合并文件失败：{e}")
+
+
+def get_single_flight(name: str, encode: Optional[Callable[[Any], Any]] = None,
+                      decode: Optional[Callable[[Any], Any]] = None) -> Optional[SingleFlight]:
+    """
+    获取进程级共享的请求合并器，SINGLE_FLIGHT_ENABLED 关闭时返回 None
+
+    Args:
+        name: 名称，不同用途（检索、生成）使用不同的合并器
+        encode: 首次创建时使用的结果编码函数（跨进程合并时写入结果文件）
+        decode: 首次创建时使用的结果解码函数
+    """
+    if os.getenv("SINGLE_FLIGHT_ENABLED", "true").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    return get_resource(
+        f"single_flight:{name}",
+        lambda: SingleFlight(
+            name,
+            lock_dir=os.getenv("SINGLE_FLIGHT_LOCK_DIR") or None,
+            wait_timeout=float(os.getenv("SINGLE_FLIGHT_WAIT_TIMEOUT", "130")),
+            encode=encode,
+            decode=decode,
+        ),
+        SINGLE_FLIGHT_ENV_KEYS,
+    )
@@ -0,0 +1,162 @@
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+from src.api.get_api import AI_ANSWER_SOURCE
+from src.api.models import Note, as_notes
+from src.api.retry import LatencyTracker
+from src.retrieval.fusion import query_coverage
+from src.utils.logger import get_logger
+from src.utils.tracing import metrics
+
+# 初始化日志
+logger = get_logger(__name__)
+
+# 影响回答判定的环境变量，变化时重新创建 AnswerGenerator
+ANSWER_GATE_ENV_KEYS = ("DIRECT_ANSWER_ENABLED", "DIRECT_ANSWER_MIN_CHARS", "DIRECT_ANSWER_MIN_COVERAGE",
+                        "DIRECT_ANSWER_MIN_GROUNDING", "DIRECT_ANSWER_MIN_REFS")
+
+# Get 笔记 AI 没有找到答案时的常见说法，出现时交给 LLM 结合笔记重新回答
+_REFUSAL = re.compile(r"抱歉|无法回答|无法确定|没有找到|未找到|找不到|没有相关|无相关|未检索到|没有提到|未提及")
+
+
+class GateDecision:
+    """
+    判定结果：serve 为 True 时直接使用 Get 笔记 AI 综合回答，reason 为判定原因，scores 为各项得分
+    """
+
+    def __init__(self, serve: bool, reason: str, scores: Optional[Dict[str, float]] = None):
+        self.serve = serve
+        self.reason = reason
+        self.scores = scores or {}
+
+    def __repr__(self) -> str:
+        return f"GateDecision(serve={self.serve}, reason={self.reason!r}, scores={self.scores})"
+
+
+class AnswerGate:
+    """
+    判断 Get 笔记 AI 综合回答（c.answers）是否足以直接作为最终回答
+    规则依次为：没有历史对话（综合回答不了解上下文）、不是“没有找到”一类的回答、回答足够长、
+    覆盖问题中的实词、有足够的引用片段且回答内容能在这些片段中找到依据。
+    都满足时跳过 LLM，直接返回综合回答和引用；否则仍由 LLM 结合笔记改写或合并。
+    跳过的次数和按最近 LLM 生成耗时估算的节省时间记录在统计和指标中
+    """
+
+    def __init__(self, enabled: bool = True, min_chars: int = 40, min_coverage: float = 0.5,
+                 min_grounding: float = 0.3, min_refs: int = 1):
+        """
+        Args:
+            enabled: 是否启用，关闭时总是调用 LLM
+            min_chars: 综合回答的最少字符数
+            min_coverage: 问题实词在综合回答中出现的最低比例
+            min_grounding: 综合回答的实词在引用片段中出现的最低比例
+            min_refs: 最少的引用片段数（综合回答之外的检索结果）
+        """
+        self.enabled = enabled
+        self.min_chars = min_chars
+        self.min_coverage = min_coverage
+        self.min_grounding = min_grounding
+        self.min_refs = min_refs
+        self.direct = 0
+        self.llm = 0
+        self.saved_seconds = 0.0
+        self.llm_latency = LatencyTracker(window=200, min_samples=1)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "AnswerGate":
+        return cls(
+            enabled=os.getenv("DIRECT_ANSWER_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on"),
+            min_chars=int(os.getenv("DIRECT_ANSWER_MIN_CHARS", "40")),
+            min_coverage=float(os.getenv("DIRECT_ANSWER_MIN_COVERAGE", "0.5")),
+            min_grounding=float(os.getenv("DIRECT_ANSWER_MIN_GROUNDING", "0.3")),
+            min_refs=int(os.getenv("DIRECT_ANSWER_MIN_REFS", "1")),
+        )
+
+    def decide(self, query: str, notes: List[Note], history: str = "") -> GateDecision:
+        """
+        判定是否直接使用综合回答
+
+        Args:
+            query: 用户查询语句
+            notes: 检索结果
+            history: 历史对话字符串
+        Returns:
+            GateDecision
+        """
+        if not self.enabled:
+            return GateDecision(False, "disabled")
+        if history.strip():
+            return GateDecision(False, "history")
+        notes = as_notes(notes)
+        answer = next((note for note in notes if note.source == AI_ANSWER_SOURCE), None)
+        text = (answer.content or "").strip() if answer is not None else ""
+        if not text:
+            return GateDecision(False, "no_answer")
+        if _REFUSAL.search(text):
+            return GateDecision(False, "refusal")
+        if len(text) < self.min_chars:
+            return GateDecision(False, "too_short")
+
+        # 引用片段的相关度按查询实词覆盖比例计算，对综合回答依据的片段偏低，因此不按相似度阈值筛选，
+        # 而是检查回答内容能否在片段中找到依据
+        refs = [note for note in notes if note.source != AI_ANSWER_SOURCE]
+        scores = {"refs": len(refs), "coverage": round(query_coverage(query, text), 4)}
+        if len(refs) < self.min_refs:
+            return GateDecision(False, "few_refs", scores)
+        if scores["coverage"] < self.min_coverage:
+            return GateDecision(False, "off_topic", scores)
+        if refs:
+            evidence = "\n".join(f"{note.title or ''}\n{note.content or ''}" for note in refs)
+            scores["grounding"] = round(query_coverage(text, evidence), 4)
+            if scores["grounding"] < self.min_grounding:
+                return GateDecision(False, "ungrounded", scores)
+        return GateDecision(True, "sufficient", scores)
+
+    def record_direct(self, decision: GateDecision) -> float:
+        """
+        记录一次跳过 LLM 的回答
+
+        Returns:
+            估算节省的时间（秒，最近 LLM 生成耗时的中位数），还没有 LLM 耗时样本时为 0
+        """
+        saved = self.llm_latency.quantile(0.5) or 0.0
+        with self._lock:
+            self.direct += 1
+            self.saved_seconds += saved
+        metrics.inc("rag_answer_gate_total", decision="direct", reason=decision.reason)
+        metrics.inc("rag_llm_saved_seconds_total", saved)
+        return saved
+
+    def record_llm(self, decision: GateDecision, seconds: float):
+        """
+        记录一次调用 LLM 的回答及其耗时
+        """
+        self.llm_latency.record(seconds)
+        with self._lock:
+            self.llm += 1
+        metrics.inc("rag_answer_gate_total", decision="llm", reason=decision.reason)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        直接回答次数、调用 LLM 次数、跳过比例和累计节省的时间（秒）
+        """
+        with self._lock:
+            total = self.direct + self.llm
+            return {
+                "direct": self.direct,
+                "llm": self.llm,
+                "skip_rate": round(self.direct / total, 4) if total else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
+
+
+def format_direct_answer(answer: str, notes: List[Note]) -> str:
+    """
+    在综合回答末尾注明来源和参考的笔记，编号与引用列表（_extract_references）一致
+    """
+    cited = [f"[笔记{i}]{note.title or ''}" for i, note in enumerate(as_notes(notes), 1)
+             if note.source != AI_ANSWER_SOURCE]
+    source = f"（以上回答来自Get笔记 AI 综合回答，参考：{'、'.join(cited)}）" if cited else "（以上回答来自Get笔记 AI 综合回答）"
+    return f"{answer.strip()}\n\n{source}"
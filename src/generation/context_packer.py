@@ -0,0 +1,164 @@
+import os
+import re
+from typing import Any, List, Optional
+import numpy as np
+from src.api.models import Note, as_notes
+from src.utils.embedding import HashingVectorizer
+from src.utils.tokens import count_tokens
+
+# 句子切分：在句末标点和换行之后断开，标点保留在句子末尾
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;\n])")
+
+# Get 笔记 AI 综合回答等没有相关度得分的笔记按该相关度参与排序
+DEFAULT_RELEVANCE = 1.0
+
+# 省略的句子用“……”代替
+ELLIPSIS = "……"
+ELLIPSIS_TOKENS = count_tokens(ELLIPSIS)
+
+
+class PackedContext:
+    """
+    打包后的上下文
+    """
+
+    def __init__(self, text: str, tokens: int, original_tokens: int, notes_used: int):
+        """
+        Args:
+            text: 上下文文本
+            tokens: 上下文的 token 数
+            original_tokens: 不做裁剪时的 token 数
+            notes_used: 放入上下文的笔记数（超出预算时可能整条舍弃）
+        """
+        self.text = text
+        self.tokens = tokens
+        self.original_tokens = original_tokens
+        self.notes_used = notes_used
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(self.original_tokens - self.tokens, 0)
+
+
+def _format_note(index: int, title: Any, content: str) -> str:
+    return f"""
+【笔记{index}】
+标题：{title}
+内容：{content}
+"""
+
+
+def split_sentences(text: str, max_tokens: int = 200) -> List[str]:
+    """
+    将正文切分为句子，超过 max_tokens 的长句按字符再切开，保证每个单元都能单独放入预算
+
+    Args:
+        text: 笔记正文
+        max_tokens: 单个句子的最大 token 数
+    Returns:
+        句子列表（保留原有标点和空白，拼接后等于原文）
+    """
+    sentences = []
+    for sentence in _SENTENCE_END.split(text or ""):
+        if not sentence:
+            continue
+        tokens = count_tokens(sentence)
+        if tokens <= max_tokens:
+            sentences.append(sentence)
+            continue
+        # 按 token 占比估算字符数切分
+        step = max(len(sentence) * max_tokens // tokens, 1)
+        sentences.extend(sentence[i:i + step] for i in range(0, len(sentence), step))
+    return sentences
+
+
+class ContextPacker:
+    """
+    按 token 预算构建提示中的笔记上下文
+    所有笔记原样放得下时不做改动；超出预算时把笔记切成句子，按“笔记相关度 × 句子与问题的相关度”
+    从高到低挑选句子放入预算，每条笔记按原文顺序输出被选中的句子（省略处用“……”连接）。
+    笔记编号始终与检索结果的顺序一致，保证回答中的 [笔记X] 与引用列表对应
+    """
+
+    def __init__(self, budget: Optional[int] = None, vectorizer: Optional[HashingVectorizer] = None):
+        """
+        Args:
+            budget: 上下文的 token 预算，默认读取 CONTEXT_TOKEN_BUDGET，0 表示不限制
+        """
+        self.budget = budget if budget is not None else int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+        self.vectorizer = vectorizer or HashingVectorizer()
+
+    def _sentence_scores(self, query: str, sentences: List[str]) -> np.ndarray:
+        """
+        句子与问题的相关度：问题实词特征在句子中出现的比例
+        """
+        query_vector = self.vectorizer.presence(query).astype(np.float32)
+        norm = float(query_vector @ query_vector)
+        if not norm or not sentences:
+            return np.zeros(len(sentences), dtype=np.float32)
+        matrix = np.stack([self.vectorizer.presence(sentence) for sentence in sentences]).astype(np.float32)
+        return np.clip(matrix @ query_vector / norm, 0.0, 1.0)
+
+    def pack(self, query: str, notes: List[Note]) -> PackedContext:
+        """
+        构建上下文
+
+        Args:
+            query: 用户问题
+            notes: 检索到的笔记（按相关度排序）
+        Returns:
+            PackedContext
+        """
+        notes = as_notes(notes)
+        full_parts = [_format_note(i, note.title, note.content) for i, note in enumerate(notes, 1)]
+        full_text = '\n'.join(full_parts)
+        original_tokens = count_tokens(full_text)
+        if not self.budget or original_tokens <= self.budget:
+            return PackedContext(full_text, original_tokens, original_tokens, len(notes))
+
+        # 候选单元：(得分, 笔记序号, 句子序号)
+        note_sentences = [split_sentences(str(note.content or '')) for note in notes]
+        costs = [[count_tokens(sentence) for sentence in sentences] for sentences in note_sentences]
+        headers = [count_tokens(_format_note(i, note.title, '')) for i, note in enumerate(notes, 1)]
+        flat = [sentence for sentences in note_sentences for sentence in sentences]
+        scores = self._sentence_scores(query, flat)
+        units = []
+        position = 0
+        for note_index, (note, sentences) in enumerate(zip(notes, note_sentences)):
+            relevance = note.relevance_score
+            relevance = DEFAULT_RELEVANCE if relevance is None else float(relevance)
+            for sentence_index in range(len(sentences)):
+                # 与问题无关的句子仍有少量基础分，相关度高的笔记中靠前的句子优先
+                score = relevance * (0.2 + float(scores[position]))
+                units.append((-score, note_index, sentence_index))
+                position += 1
+        units.sort()
+
+        chosen: List[set] = [set() for _ in notes]
+        used = 0
+        for _, note_index, sentence_index in units:
+            # 预留省略号和笔记之间分隔符的 token
+            cost = costs[note_index][sentence_index] + ELLIPSIS_TOKENS
+            if not chosen[note_index]:
+                cost += headers[note_index] + 1
+            if used + cost > self.budget:
+                continue
+            chosen[note_index].add(sentence_index)
+            used += cost
+
+        parts = []
+        for note_index, note in enumerate(notes):
+            if not chosen[note_index]:
+                continue
+            pieces = []
+            previous = -1
+            for sentence_index in sorted(chosen[note_index]):
+                if sentence_index != previous + 1:
+                    pieces.append(ELLIPSIS)
+                pieces.append(note_sentences[note_index][sentence_index].strip())
+                previous = sentence_index
+            if previous != len(note_sentences[note_index]) - 1:
+                pieces.append(ELLIPSIS)
+            parts.append(_format_note(note_index + 1, note.title, "".join(pieces)))
+        text = '\n'.join(parts)
+        return PackedContext(text, count_tokens(text), original_tokens, len(parts))
@@ -1,13 +1,41 @@
 from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
 from langchain_openai import ChatOpenAI 
-from typing import Dict, List, Any
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Any, Optional, Union
+from src.api.get_api import AI_ANSWER_SOURCE
+from src.api.models import Note, Reference, as_notes
+from src.api.rate_limiter import RateLimitError, get_rate_limiter, priority_lane
+from src.cache.answer_cache import get_answer_cache, make_answer_key
+from src.cache.query_cache import QueryCache
+from src.cache.semantic_cache import SemanticCache, get_semantic_cache
+from src.cache.single_flight import get_single_flight, make_key, notes_hash
+from src.generation.answer_gate import ANSWER_GATE_ENV_KEYS, AnswerGate, GateDecision, format_direct_answer
+from src.generation.context_packer import ContextPacker
+from src.generation.prompt import PromptLayout
 from src.utils.logger import get_logger
+from src.utils.resources import get_resource
+from src.utils.tokens import count_tokens
+from src.utils.tracing import metrics, record_span, record_tokens, span
+import httpx
+import openai
 import os
+import time
 
 # 初始化日志
 logger = get_logger(__name__)
 
+# 影响 AnswerGenerator 的环境变量，变化时重新创建
+GENERATOR_ENV_KEYS = ("SILICONFLOW_API_KEY", "SILICONFLOW_MODEL", "SILICONFLOW_API_BASE", "CONTEXT_TOKEN_BUDGET",
+                      "LLM_RATE_LIMIT_TIMEOUT") + ANSWER_GATE_ENV_KEYS
+
+# 未检索到相关笔记时的固定回答
+NO_NOTES_ANSWER = "抱歉，未检索到与您的问题相关的笔记内容。请尝试调整问题表述或提供更多关键词。"
+
+# 知识库服务不可用（熔断或请求失败）时的固定回答
+DEGRADED_ANSWER = "抱歉，知识库服务暂时不可用，本次未能检索笔记内容，请稍后再试。"
+
 class AnswerGenerator:
     """
     增强生成模块
@@ -23,50 +51,45 @@ class AnswerGenerator:
         # 获取环境变量
         api_key = os.getenv("SILICONFLOW_API_KEY")
         model_name = os.getenv("SILICONFLOW_MODEL", "Qwen/Qwen3-8B")
+        self.api_base = os.getenv("SILICONFLOW_API_BASE", "https://api.siliconflow.cn/v1").rstrip("/")
+        self._api_key = api_key
+        self.model_name = model_name
+        self._last_warm_up = 0.0
+        # 等待 LLM 调用配额的最长时间（秒）
+        self.rate_limit_timeout = float(os.getenv("LLM_RATE_LIMIT_TIMEOUT", "60"))
+
+        # 自行持有 HTTP 客户端，预热与正式调用共用同一个连接池
+        self.http_client = httpx.Client()
         
         # 使用硅基流动的兼容接口
         self.llm = ChatOpenAI(
             openai_api_key=api_key,
-            openai_api_base="https://api.siliconflow.cn/v1",
+            openai_api_base=self.api_base,
             model_name=model_name,
-            temperature=0.3
+            temperature=0.3,
+            streaming=True,
+            http_client=self.http_client
         )
         self.prompt_template = self._create_prompt_template()
-        self.chain = LLMChain(llm=self.llm, prompt=self.prompt_template)
+        # 按 token 预算挑选笔记内容，避免提示长度随引用数量和长度无限增长
+        self.context_packer = ContextPacker()
+        # 提示模板 -> LLM -> 文本，invoke 与 stream 共用同一条链
+        self.chain = self.prompt_template | self.llm | StrOutputParser()
+        # Get 笔记 AI 综合回答已经足够时跳过 LLM
+        self.gate = AnswerGate.from_env()
 
-    def _create_prompt_template(self) -> PromptTemplate:
+    def _create_prompt_template(self) -> ChatPromptTemplate:
         """
         创建提示模板
+        静态回答要求在前、问题在后，便于 LLM 服务复用相同的提示前缀（见 PromptLayout）
         
         Returns:
             提示模板对象
         """
-        template = """
-你是一个基于Get笔记内容的问答助手，需要严格基于提供的笔记内容回答用户问题。
-
-请按照以下要求回答：
-1. 严格基于提供的笔记内容，不要添加任何笔记中没有的信息
-2. 明确标注引用来源，格式为：[笔记X]，其中X是笔记的编号
-3. 对引用的内容进行高亮显示
-4. 当检索不到相关笔记时，明确提示并建议调整问题
-5. 如果用户提供了历史对话，请结合上下文理解当前问题。
-
-历史对话：
-{history}
-
-用户问题：{query}
-
-相关笔记：
-{context}
+        self.layout = PromptLayout()
+        return self.layout.template
 
-请生成回答：
-"""
-        return PromptTemplate(
-            input_variables=["query", "context", "history"],
-            template=template
-        )
-
-    def generate(self, query: str, notes: List[Dict[str, Any]], history: str = "") -> Dict[str, Any]:
+    def generate(self, query: str, notes: List[Note], history: str = "") -> Dict[str, Any]:
         """
         生成回答
         
@@ -80,56 +103,389 @@ class AnswerGenerator:
         """
         logger.info(f"开始生成回答，查询：{query}，相关笔记数：{len(notes)}")
         try:
-            # 检查是否有相关笔记
+            # 检查是否有相关笔记；检索降级时直接说明服务不可用，而不是“没有相关笔记”
             if not notes:
                 logger.info("未检索到相关笔记")
-                return {
-                    "answer": "抱歉，未检索到与您的问题相关的笔记内容。请尝试调整问题表述或提供更多关键词。",
-                    "references": [],
-                    "has_relevant_notes": False
-                }
+                return self._no_notes_result(getattr(notes, "degraded", False))
 
-            # 构建上下文
-            context = self._build_context(notes)
+            # 没有历史对话的独立问题才能复用语义相近问题的回答，追问依赖上下文，不能复用
+            semantic_cache = get_semantic_cache("answers") if not history.strip() else None
+            if semantic_cache is not None:
+                cached = semantic_cache.lookup(query, self._answer_fingerprint(notes))
+                if cached is not None:
+                    return dict(cached)
 
-            # 生成回答
-            result = self.chain.run(query=query, context=context, history=history)
+            # Get 笔记 AI 综合回答已经足够时直接返回，不再调用 LLM
+            decision = self._decide(query, notes, history)
+            if decision.serve:
+                return self._direct_result(notes)
 
-            # 提取引用信息
-            references = self._extract_references(notes)
+            # 同一问题、同一批笔记和历史对话的并发请求只调用一次 LLM
+            answer = partial(self._answer, query, notes, history, semantic_cache, decision)
+            flight = get_single_flight("generate")
+            if flight is None:
+                return answer()
+            return flight.do(make_key(query, "answer", notes_hash(notes), history), answer)
 
-            logger.info("回答生成完成")
-            return {
-                "answer": result,
-                "references": references,
-                "has_relevant_notes": True
-            }
+        except RateLimitError:
+            raise
+        except Exception as e:
+            logger.error(f"生成回答时发生错误：{e}")
+            raise Exception(f"生成回答时发生错误：{e}")
+
+    def generate_stream(self, query: str, notes: List[Note], history: str = "",
+                        prompt: Optional[ChatPromptTemplate] = None) -> Iterator[Union[str, Dict[str, Any]]]:
+        """
+        流式生成回答
+        逐个产出 LLM 生成的文本片段，最后产出与 generate 相同格式的结果字典
 
+        Args:
+            query: 用户查询语句
+            notes: 检索到的相关笔记
+            history: 历史对话字符串
+            prompt: 由 prepare_prompt 预先填好历史对话的提示模板，为空时使用默认模板
+
+        Yields:
+            文本片段（str），最后一项为包含回答和引用信息的字典
+        """
+        logger.info(f"开始流式生成回答，查询：{query}，相关笔记数：{len(notes)}")
+        try:
+            if not notes:
+                logger.info("未检索到相关笔记")
+                result = self._no_notes_result(getattr(notes, "degraded", False))
+                yield result["answer"]
+                yield result
+                return
+
+            semantic_cache = get_semantic_cache("answers") if not history.strip() else None
+            if semantic_cache is not None:
+                cached = semantic_cache.lookup(query, self._answer_fingerprint(notes))
+                if cached is not None:
+                    yield cached["answer"]
+                    yield dict(cached)
+                    return
+
+            decision = self._decide(query, notes, history)
+            if decision.serve:
+                result = self._direct_result(notes)
+                yield result["answer"]
+                yield result
+                return
+
+            produce = partial(self._answer_stream, query, notes, history, prompt, semantic_cache, decision)
+            flight = get_single_flight("generate")
+            if flight is None:
+                yield from produce()
+            else:
+                yield from flight.stream(make_key(query, "stream", notes_hash(notes), history), produce)
+
+        except RateLimitError:
+            raise
         except Exception as e:
             logger.error(f"生成回答时发生错误：{e}")
             raise Exception(f"生成回答时发生错误：{e}")
 
-    def _build_context(self, notes: List[Dict[str, Any]]) -> str:
+    def _answer(self, query: str, notes: List[Note], history: str,
+                semantic_cache: Optional[SemanticCache], decision: Optional[GateDecision] = None) -> Dict[str, Any]:
+        """
+        构建提示并调用 LLM 生成回答（generate 未命中缓存时的实际执行部分）
+        """
+        # 构建上下文
+        with span("prompt.build", notes=len(notes)):
+            context = self._build_context(notes, query)
+            inputs = {"query": query, "context": context, "history": history}
+            prompt_tokens = self.layout.count_tokens(self.prompt_template.format_messages(**inputs))
+        answer_cache, answer_key, cached = self._cached_answer(query, context, history)
+        if cached is not None:
+            return self._build_result(cached["answer"], notes, answered_by="cache")
+        record_tokens("prompt", prompt_tokens)
+        limiter = self._acquire(prompt_tokens)
+
+        # 生成回答
+        start = time.perf_counter()
+        with span("llm.call", model=self.model_name, **self._prefix_attrs(context)):
+            result = self._call(lambda: self.chain.invoke(inputs))
+        if decision is not None:
+            self.gate.record_llm(decision, time.perf_counter() - start)
+        completion_tokens = count_tokens(result)
+        record_tokens("completion", completion_tokens)
+        limiter.charge(tokens=completion_tokens)
+
+        logger.info("回答生成完成")
+        response = self._build_result(result, notes)
+        self._store_answer(answer_cache, answer_key, response)
+        if semantic_cache is not None:
+            semantic_cache.store(query, response, time.perf_counter() - start, self._answer_fingerprint(notes))
+        return response
+
+    def _answer_stream(self, query: str, notes: List[Note], history: str,
+                       prompt: Optional[ChatPromptTemplate], semantic_cache: Optional[SemanticCache],
+                       decision: Optional[GateDecision] = None) -> Iterator[Union[str, Dict[str, Any]]]:
+        """
+        generate_stream 未命中缓存时的实际执行部分
+        """
+        with span("prompt.build", notes=len(notes)):
+            context = self._build_context(notes, query)
+            if prompt is not None:
+                chain = prompt | self.llm | StrOutputParser()
+                inputs = {"query": query, "context": context}
+            else:
+                prompt = self.prompt_template
+                chain = self.chain
+                inputs = {"query": query, "context": context, "history": history}
+            prompt_tokens = self.layout.count_tokens(prompt.format_messages(**inputs))
+        answer_cache, answer_key, cached = self._cached_answer(query, context, history)
+        if cached is not None:
+            yield cached["answer"]
+            yield self._build_result(cached["answer"], notes, answered_by="cache")
+            return
+        record_tokens("prompt", prompt_tokens)
+        limiter = self._acquire(prompt_tokens)
+
+        start = time.perf_counter()
+        first_token_latency = None
+        chunks = []
+        # 耗时为产出全部片段的时间；未启用请求合并时还包含调用方消费片段的时间，即用户实际感受到的生成时间
+        with span("llm.call", model=self.model_name, stream=True, **self._prefix_attrs(context)):
+            for chunk in self._stream(lambda: chain.stream(inputs)):
+                if not chunk:
+                    continue
+                if first_token_latency is None:
+                    first_token_latency = time.perf_counter() - start
+                    logger.info(f"首个 token 延迟：{first_token_latency:.3f} 秒")
+                    record_span("llm.first_token", first_token_latency, start)
+                chunks.append(chunk)
+                yield chunk
+        if decision is not None:
+            self.gate.record_llm(decision, time.perf_counter() - start)
+        completion_tokens = count_tokens("".join(chunks))
+        record_tokens("completion", completion_tokens)
+        limiter.charge(tokens=completion_tokens)
+
+        logger.info(f"流式回答生成完成，总耗时：{time.perf_counter() - start:.3f} 秒")
+        response = self._build_result("".join(chunks), notes)
+        self._store_answer(answer_cache, answer_key, response)
+        if semantic_cache is not None:
+            semantic_cache.store(query, response, time.perf_counter() - start, self._answer_fingerprint(notes))
+        yield response
+
+    def summarize(self, summary: str, lines: List[str], max_chars: int = 300) -> str:
+        """
+        将移出窗口的历史对话合并进已有摘要，供对话记忆在后台调用
+
+        Args:
+            summary: 已有摘要
+            lines: 新移出窗口的对话行
+            max_chars: 摘要的最大字数
+        Returns:
+            新摘要
+        """
+        prompt = PromptTemplate(
+            input_variables=["summary", "dialogue", "max_chars"],
+            template=(
+                "请把已有摘要和新增对话合并为一段简短的摘要，保留用户关心的问题、关键事实和结论，"
+                "不超过{max_chars}字，只输出摘要。\n\n已有摘要：{summary}\n\n新增对话：\n{dialogue}\n摘要："
+            ),
+        )
+        chain = prompt | self.llm | StrOutputParser()
+        inputs = {"summary": summary or "无", "dialogue": "".join(lines), "max_chars": max_chars}
+        # 后台摘要不影响当前回答，与批量任务一样让交互式生成优先使用配额
+        with priority_lane("batch"):
+            limiter = self._acquire(count_tokens(inputs["summary"]) + count_tokens(inputs["dialogue"]))
+            result = self._call(lambda: chain.invoke(inputs))
+        limiter.charge(tokens=count_tokens(result))
+        return result
+
+    def prepare_prompt(self, history: str) -> ChatPromptTemplate:
+        """
+        预先填入历史对话，得到只剩问题和笔记两个变量的提示模板
+        可以在检索进行的同时准备好
+
+        Args:
+            history: 历史对话字符串
+        Returns:
+            部分填充的提示模板
+        """
+        return self.prompt_template.partial(history=history)
+
+    def warm_up(self, min_interval: float = 60.0) -> bool:
+        """
+        预热与 LLM 服务的连接
+        请求轻量的 /models 接口，提前完成 DNS、TCP 和 TLS 握手，连接留在连接池中供随后的生成复用
+
+        Args:
+            min_interval: 两次预热的最小间隔（秒），连接仍处于保活期内时不重复预热
+        Returns:
+            是否实际发起了预热请求
+        """
+        now = time.monotonic()
+        if now - self._last_warm_up < min_interval:
+            return False
+        self._last_warm_up = now
+        try:
+            self.http_client.get(
+                f"{self.api_base}/models",
+                headers={"Authorization": f"Bearer {self._api_key}"},
+                timeout=5.0
+            )
+            return True
+        except Exception as e:
+            # 预热失败不影响正式请求
+            logger.warning(f"预热 LLM 连接失败：{e}")
+            return False
+
+    def close(self):
+        """
+        关闭 HTTP 客户端
+        """
+        self.http_client.close()
+
+    def _no_notes_result(self, degraded: bool = False) -> Dict[str, Any]:
+        """
+        未检索到相关笔记时的结果
+
+        Args:
+            degraded: 是否因知识库服务不可用而没有笔记
+        """
+        return {
+            "answer": DEGRADED_ANSWER if degraded else NO_NOTES_ANSWER,
+            "references": [],
+            "has_relevant_notes": False,
+            "degraded": degraded
+        }
+
+    def _build_result(self, answer: str, notes: List[Note], answered_by: str = "llm") -> Dict[str, Any]:
+        """
+        组装包含回答和引用信息的结果字典
+
+        Args:
+            answered_by: 回答来源，llm、getnote（直接使用 Get 笔记 AI 综合回答）或 cache（命中回答缓存）
+        """
+        return {
+            "answer": answer,
+            "references": self._extract_references(notes),
+            "has_relevant_notes": True,
+            "degraded": getattr(notes, "degraded", False),
+            "answered_by": answered_by
+        }
+
+    def _decide(self, query: str, notes: List[Note], history: str) -> GateDecision:
+        """
+        判断是否直接使用 Get 笔记 AI 综合回答，判定结果记录为 answer.gate 阶段
+        """
+        with span("answer.gate") as attrs:
+            decision = self.gate.decide(query, notes, history)
+            attrs.update(decision.scores, serve=decision.serve, reason=decision.reason)
+            if decision.serve:
+                attrs["saved_seconds"] = round(self.gate.record_direct(decision), 3)
+        return decision
+
+    def _direct_result(self, notes: List[Note]) -> Dict[str, Any]:
+        """
+        以 Get 笔记 AI 综合回答作为最终回答，末尾注明参考的笔记
+        """
+        answer = next(note for note in as_notes(notes) if note.source == AI_ANSWER_SOURCE)
+        logger.info("Get笔记 AI 综合回答已足够，跳过 LLM 生成")
+        return self._build_result(format_direct_answer(answer.content, notes), notes, answered_by="getnote")
+
+    def _answer_fingerprint(self, notes: List[Note]) -> str:
+        """
+        语义缓存中回答的依据：检索到的笔记、模型和提示模板版本，任一不同时不复用语义相近问题的回答
+        """
+        return f"{notes_hash(notes)}:{self.model_name}:{self.layout.version}"
+
+    def _cached_answer(self, query: str, context: str, history: str) -> tuple:
+        """
+        按问题、打包后的上下文、历史对话、模型和提示模板版本查找回答缓存，查找记录为 answer.cache 阶段
+
+        Returns:
+            (回答缓存, 缓存键, 命中的结果)，未启用回答缓存时前两项为 None，未命中时结果为 None；
+            生成完成后用同一个缓存对象写入，查找之后配置变化也不会写到其他缓存
+        """
+        cache = get_answer_cache()
+        if cache is None:
+            return None, None, None
+        with span("answer.cache") as attrs:
+            key = make_answer_key(query, context, history, self.model_name, self.layout.version)
+            cached = cache.get(key)
+            attrs["hit"] = cached is not None
+        metrics.inc("rag_answer_cache_total", result="hit" if cached is not None else "miss")
+        if cached is not None:
+            logger.info("命中回答缓存，跳过 LLM 生成")
+        return cache, key, cached
+
+    def _store_answer(self, cache: Optional[QueryCache], key: Optional[str], response: Dict[str, Any]):
+        """
+        将 LLM 生成的回答写入查找时使用的回答缓存
+        只保存回答文本：上下文哈希相同说明笔记一致，命中时引用等字段按本次的检索结果重新生成
+        """
+        if cache is not None:
+            cache.set(key, {"answer": response["answer"]})
+
+    def _acquire(self, prompt_tokens: int):
+        """
+        取得一次 LLM 调用的配额（请求数和提示 token 数），回答的 token 数在生成完成后补扣
+
+        Returns:
+            使用的限流器
+        """
+        limiter = get_rate_limiter("llm")
+        limiter.acquire(timeout=self.rate_limit_timeout, requests=1, tokens=prompt_tokens)
+        return limiter
+
+    def _call(self, fn: Callable[[], Any]) -> Any:
+        """
+        调用 LLM，服务端限流（重试后仍返回 429）时暂停共享限流器并抛出 RateLimitError
+        """
+        try:
+            return fn()
+        except openai.RateLimitError as e:
+            raise self._rate_limited(e) from e
+
+    def _stream(self, fn: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """
+        _call 的流式版本，429 在取第一个片段时才会抛出
+        """
+        try:
+            yield from fn()
+        except openai.RateLimitError as e:
+            raise self._rate_limited(e) from e
+
+    def _rate_limited(self, e: "openai.RateLimitError") -> RateLimitError:
+        try:
+            retry_after = float(e.response.headers.get("Retry-After", "0"))
+        except (AttributeError, ValueError):
+            retry_after = 0.0
+        get_rate_limiter("llm").pause(max(retry_after, 0.0))
+        logger.error(f"LLM 服务限流：{e}")
+        return RateLimitError(f"生成回答时被限流（429）：{e}")
+
+    def _prefix_attrs(self, context: str) -> Dict[str, str]:
+        """
+        提示前缀的哈希，记录到 llm.call 追踪中，用于统计前缀缓存的命中情况
+        """
+        return {"prefix_hash": self.layout.prefix_hash, "context_hash": self.layout.stable_hash(context)}
+
+    def _build_context(self, notes: List[Note], query: str = "") -> str:
         """
         构建上下文
+        超出 CONTEXT_TOKEN_BUDGET 时按与问题的相关度挑选句子，节省的 token 数记录到追踪和指标中
         
         Args:
             notes: 检索到的相关笔记
+            query: 用户查询语句，用于挑选相关的句子
             
         Returns:
             上下文字符串
         """
-        context_parts = []
-        for i, note in enumerate(notes, 1):
-            context_part = f"""
-【笔记{i}】
-标题：{note.get('title')}
-内容：{note.get('content')}
-"""
-            context_parts.append(context_part)
-        return '\n'.join(context_parts)
+        packed = self.context_packer.pack(query, notes)
+        if packed.saved_tokens:
+            logger.info(f"上下文超出预算，{packed.original_tokens} -> {packed.tokens} tokens，"
+                        f"保留 {packed.notes_used}/{len(notes)} 条笔记")
+            record_tokens("context_saved", packed.saved_tokens)
+        return packed.text
 
-    def _extract_references(self, notes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _extract_references(self, notes: List[Note]) -> List[Reference]:
         """
         提取引用信息
         
@@ -137,15 +493,14 @@ class AnswerGenerator:
             notes: 检索到的相关笔记
             
         Returns:
-            引用信息列表
-        """
-        references = []
-        for i, note in enumerate(notes, 1):
-            reference = {
-                "id": note.get('id'),
-                "title": note.get('title'),
-                "relevance_score": note.get('relevance_score'),
-                "reference_id": f"笔记{i}"
-            }
-            references.append(reference)
-        return references
+            引用信息列表，reference_id 与回答中的 [笔记X] 对应
+        """
+        return [Reference.from_note(note, i) for i, note in enumerate(as_notes(notes), 1)]
+
+
+def get_answer_generator() -> AnswerGenerator:
+    """
+    获取进程级共享的 AnswerGenerator
+    复用 ChatOpenAI 及其 HTTP 连接池、提示模板和调用链，避免每次提问都重新构建
+    """
+    return get_resource("answer_generator", AnswerGenerator, GENERATOR_ENV_KEYS)
@@ -0,0 +1,230 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from src.utils.logger import get_logger
+from src.utils.resources import get_resource
+from src.utils.tokens import count_tokens
+from src.utils.tracing import span
+
+# 初始化日志
+logger = get_logger(__name__)
+
+# 影响对话记忆的环境变量，变化时重新创建
+MEMORY_ENV_KEYS = ("HISTORY_TOKEN_BUDGET", "HISTORY_SUMMARY_TOKENS", "HISTORY_MAX_SESSIONS", "HISTORY_SUMMARY_LLM")
+
+# summarizer(已有摘要, 新移出窗口的对话行) -> 新摘要
+Summarizer = Callable[[str, List[str]], str]
+
+
+def format_message(message: Dict[str, str]) -> str:
+    """
+    将一条聊天消息格式化为历史对话中的一行
+    """
+    role = "用户" if message["role"] == "user" else "助手"
+    return f"{role}: {message['content']}\n"
+
+
+def extractive_summary(summary: str, lines: List[str], max_tokens: int = 200) -> str:
+    """
+    不调用 LLM 的摘要：保留每行的第一句，整体截断到 max_tokens
+    用作 LLM 摘要失败时的兜底
+    """
+    parts = [summary] if summary else []
+    for line in lines:
+        first = line.strip().split("。", 1)[0]
+        parts.append(first if first.endswith("。") else first + "。")
+    text = "".join(parts)
+    while count_tokens(text) > max_tokens and len(parts) > 1:
+        # 优先丢弃最早的内容
+        parts.pop(0)
+        text = "".join(parts)
+    return text
+
+
+class ConversationMemory:
+    """
+    单个会话的对话记忆
+    最近的对话原样保留在按 token 计算的窗口内，超出窗口的较早对话在后台线程中滚动压缩为摘要。
+    格式化后的历史对话被缓存，每轮只追加新增的消息，不会重新格式化和统计整段历史
+    """
+
+    def __init__(self, summarizer: Optional[Summarizer] = None, window_tokens: int = 800,
+                 summary_tokens: int = 200, executor: Optional[ThreadPoolExecutor] = None):
+        """
+        Args:
+            summarizer: 摘要函数，默认使用不调用 LLM 的 extractive_summary
+            window_tokens: 原样保留的最近对话的 token 上限
+            summary_tokens: 摘要的 token 上限（传给兜底摘要）
+            executor: 执行摘要的线程池，为空时在调用线程中同步摘要
+        """
+        self.summarizer = summarizer
+        self.window_tokens = window_tokens
+        self.summary_tokens = summary_tokens
+        self.executor = executor
+        self.summary = ""
+        # 窗口内的对话：(格式化后的行, token 数)
+        self._window: List[Tuple[str, int]] = []
+        self._window_size = 0
+        # 已移出窗口、正在摘要的对话行；摘要完成前仍原样放入历史，不丢失上下文
+        self._pending: List[str] = []
+        self._future: Optional[Future] = None
+        self._seen = 0
+        self._cached: Optional[str] = None
+        self._lock = threading.RLock()
+
+    def update(self, messages: List[Dict[str, str]]) -> str:
+        """
+        同步聊天记录并返回格式化后的历史对话
+        只处理上次调用之后新增的消息；聊天记录被清空或回退时重新开始
+
+        Args:
+            messages: 之前的聊天记录，不含当前问题
+        Returns:
+            历史对话字符串
+        """
+        with self._lock:
+            if len(messages) < self._seen:
+                self._reset()
+            for message in messages[self._seen:]:
+                line = format_message(message)
+                self._window.append((line, count_tokens(line)))
+                self._window_size += self._window[-1][1]
+                self._cached = None
+            self._seen = len(messages)
+            self._evict()
+            return self._format()
+
+    def _reset(self):
+        self.summary = ""
+        self._window = []
+        self._window_size = 0
+        self._pending = []
+        self._future = None
+        self._seen = 0
+        self._cached = None
+
+    def _evict(self):
+        """
+        把超出窗口的最早对话移出窗口并提交摘要（调用方持有锁）
+        """
+        evicted = []
+        # 至少保留最近一条消息
+        while self._window_size > self.window_tokens and len(self._window) > 1:
+            line, tokens = self._window.pop(0)
+            self._window_size -= tokens
+            evicted.append(line)
+        if not evicted:
+            return
+        self._pending.extend(evicted)
+        self._cached = None
+        if self._future is None or self._future.done():
+            self._submit()
+
+    def _submit(self):
+        """
+        提交一次摘要：把当前所有待摘要的行合并进摘要（调用方持有锁）
+        """
+        lines = list(self._pending)
+        summary = self.summary
+        if self.executor is None:
+            self._apply(lines, self._summarize(summary, lines))
+            return
+        future = self.executor.submit(self._summarize, summary, lines)
+        self._future = future
+        # 摘要已完成时回调会立即在当前线程中执行，因此使用可重入锁
+        future.add_done_callback(lambda done: self._on_done(lines, done))
+
+    def _summarize(self, summary: str, lines: List[str]) -> str:
+        with span("history.summarize", lines=len(lines)):
+            if self.summarizer is not None:
+                try:
+                    return self.summarizer(summary, lines)
+                except Exception as e:
+                    logger.warning(f"对话摘要失败，改用截取首句：{e}")
+            return extractive_summary(summary, lines, self.summary_tokens)
+
+    def _on_done(self, lines: List[str], future: Future):
+        with self._lock:
+            if future is not self._future:
+                # 会话已重置
+                return
+            self._apply(lines, future.result())
+            # 摘要期间又有对话移出窗口，继续摘要
+            if self._pending and self.executor is not None:
+                self._submit()
+
+    def _apply(self, lines: List[str], summary: str):
+        self.summary = summary.strip()
+        del self._pending[:len(lines)]
+        self._cached = None
+
+    def _format(self) -> str:
+        if self._cached is None:
+            parts = []
+            if self.summary:
+                parts.append(f"（更早对话的摘要）{self.summary}\n")
+            parts.extend(self._pending)
+            parts.extend(line for line, _ in self._window)
+            self._cached = "".join(parts)
+        return self._cached
+
+    def wait(self, timeout: Optional[float] = None):
+        """
+        等待正在进行的摘要完成（主要用于测试和退出前）
+        """
+        future = self._future
+        if future is not None:
+            future.result(timeout)
+
+
+class ConversationMemoryStore:
+    """
+    按会话 ID 保存对话记忆，超过 max_sessions 个会话时淘汰最久未使用的
+    """
+
+    def __init__(self, summarizer: Optional[Summarizer] = None, window_tokens: int = 800,
+                 summary_tokens: int = 200, max_sessions: int = 1000):
+        self.summarizer = summarizer
+        self.window_tokens = window_tokens
+        self.summary_tokens = summary_tokens
+        self.max_sessions = max_sessions
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-summary")
+        self._sessions: "OrderedDict[str, ConversationMemory]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> ConversationMemory:
+        with self._lock:
+            memory = self._sessions.get(session_id)
+            if memory is None:
+                memory = ConversationMemory(self.summarizer, self.window_tokens, self.summary_tokens, self.executor)
+                self._sessions[session_id] = memory
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            return memory
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def get_memory_store(summarizer: Optional[Summarizer] = None) -> ConversationMemoryStore:
+    """
+    获取进程级共享的对话记忆存储
+
+    Args:
+        summarizer: 首次创建时使用的摘要函数；HISTORY_SUMMARY_LLM 关闭时不使用，只截取首句
+    """
+    use_llm = os.getenv("HISTORY_SUMMARY_LLM", "true").strip().lower() in ("1", "true", "yes", "on")
+    return get_resource(
+        "conversation_memory",
+        lambda: ConversationMemoryStore(
+            summarizer if use_llm else None,
+            window_tokens=int(os.getenv("HISTORY_TOKEN_BUDGET", "800")),
+            summary_tokens=int(os.getenv("HISTORY_SUMMARY_TOKENS", "200")),
+            max_sessions=int(os.getenv("HISTORY_MAX_SESSIONS", "1000")),
+        ),
+        MEMORY_ENV_KEYS,
+    )
@@ -0,0 +1,70 @@
+import hashlib
+from typing import List
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+from src.utils.tokens import count_tokens
+
+# 回答要求：所有请求都相同，作为系统消息放在最前面
+INSTRUCTIONS = """你是一个基于Get笔记内容的问答助手，需要严格基于提供的笔记内容回答用户问题。
+
+请按照以下要求回答：
+1. 严格基于提供的笔记内容，不要添加任何笔记中没有的信息
+2. 明确标注引用来源，格式为：[笔记X]，其中X是笔记的编号
+3. 对引用的内容进行高亮显示
+4. 当检索不到相关笔记时，明确提示并建议调整问题
+5. 如果用户提供了历史对话，请结合上下文理解当前问题。"""
+
+# 可变部分：按稳定程度从高到低排列，问题放在最后
+TURN_TEMPLATE = """相关笔记：
+{context}
+
+历史对话：
+{history}
+
+用户问题：{query}
+
+请生成回答："""
+
+
+def prefix_hash(text: str) -> str:
+    """
+    提示前缀的短哈希，用于在追踪和日志中比对前缀是否一致（可以命中服务端的前缀缓存）
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class PromptLayout:
+    """
+    面向服务端前缀缓存（KV cache）的提示布局
+    LLM 服务只能复用与之前请求逐字相同的前缀，因此提示按“静态要求 → 笔记 → 历史对话 → 问题”排列：
+    回答要求对所有请求都相同；追问通常检索到同一批笔记，笔记之后的历史对话每轮只在末尾追加，
+    上一轮的“要求 + 笔记 + 历史对话”整体仍是本轮的前缀；每轮都不同的问题放在最后。
+    静态要求只渲染一次，它的 token 数和哈希也随之缓存
+    """
+
+    def __init__(self, instructions: str = INSTRUCTIONS, turn_template: str = TURN_TEMPLATE):
+        """
+        Args:
+            instructions: 静态回答要求（按原文发送，不做变量替换）
+            turn_template: 每轮变化部分的模板，包含 context、history、query 三个变量
+        """
+        self.instructions = instructions
+        self.system_message = SystemMessage(content=instructions)
+        self.prefix_tokens = count_tokens(instructions)
+        self.prefix_hash = prefix_hash(instructions)
+        # 提示模板版本：回答要求和模板原文的哈希，修改任一部分后回答缓存自动失效
+        self.version = prefix_hash(instructions + "\0" + turn_template)
+        self.template = ChatPromptTemplate.from_messages([self.system_message, ("human", turn_template)])
+
+    def count_tokens(self, messages: List[BaseMessage]) -> int:
+        """
+        统计渲染后提示的 token 数，静态要求使用缓存的 token 数
+        """
+        return sum(self.prefix_tokens if message.content == self.instructions else count_tokens(message.content)
+                   for message in messages)
+
+    def stable_hash(self, context: str) -> str:
+        """
+        “静态要求 + 笔记”前缀的哈希：连续两次请求的哈希相同，说明后一次至少能复用到笔记末尾
+        """
+        return prefix_hash(self.instructions + "\0" + context)
@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+from src.generation.generator import AnswerGenerator, get_answer_generator
+from src.generation.memory import ConversationMemoryStore, get_memory_store
+from src.retrieval.retrieval import retrieve_notes
+from src.utils.logger import get_logger
+from src.utils.resources import get_resource
+from src.utils.tracing import bind_context, record_span, span
+
+# 初始化日志
+logger = get_logger(__name__)
+
+
+def format_history(messages: List[Dict[str, str]], max_messages: int = 5) -> str:
+    """
+    将聊天记录格式化为提示中的历史对话
+
+    Args:
+        messages: 之前的聊天记录，不含当前问题
+        max_messages: 最多保留的消息条数，防止太长
+    Returns:
+        历史对话字符串
+    """
+    history_text = ""
+    for msg in messages[-max_messages:] if max_messages else []:
+        role = "用户" if msg["role"] == "user" else "助手"
+        history_text += f"{role}: {msg['content']}\n"
+    return history_text
+
+
+def summarize_history(summary: str, lines: List[str]) -> str:
+    """
+    使用进程级共享的回答生成器压缩历史对话
+    """
+    return get_answer_generator().summarize(summary, lines)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """
+    获取进程级共享的流水线线程池
+    只执行耗时很短的辅助阶段（提示准备、连接预热），检索在各会话自己的线程上执行，不占用线程池
+    """
+    return get_resource(
+        "pipeline_executor",
+        lambda: ThreadPoolExecutor(
+            max_workers=int(os.getenv("PIPELINE_MAX_WORKERS", "8")),
+            thread_name_prefix="qa-pipeline"
+        ),
+        ("PIPELINE_MAX_WORKERS",),
+    )
+
+
+class QAPipeline:
+    """
+    问答流水线
+    检索在调用线程上执行，同时在线程池中并行完成历史对话格式化、提示模板准备和 LLM 连接预热，
+    检索返回后立即进入生成阶段，并记录每个阶段的耗时
+    """
+
+    def __init__(self, generator: Optional[AnswerGenerator] = None,
+                 retrieve: Callable[..., List[Dict[str, Any]]] = retrieve_notes,
+                 executor: Optional[ThreadPoolExecutor] = None,
+                 memory_store: Optional[ConversationMemoryStore] = None):
+        """
+        初始化问答流水线
+
+        Args:
+            generator: 回答生成器，默认使用进程级共享实例
+            retrieve: 检索函数，签名与 retrieve_notes 相同
+            executor: 辅助阶段使用的线程池，默认使用进程级共享线程池
+            memory_store: 按会话保存的对话记忆，默认使用进程级共享实例
+        """
+        self._generator = generator
+        self.retrieve = retrieve
+        self._executor = executor
+        self._memory_store = memory_store
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        return self._executor or _get_executor()
+
+    @property
+    def memory_store(self) -> ConversationMemoryStore:
+        return self._memory_store or get_memory_store(summarize_history)
+
+    @staticmethod
+    def _submit(executor: ThreadPoolExecutor, name: str, timings: Dict[str, float], lock: threading.Lock,
+                fn: Callable, *args) -> Future:
+        """
+        提交一个阶段到线程池，并在完成时（持有 lock）记录耗时
+        任务在提交时的上下文中执行，请求 ID 和追踪信息随之传入线程池
+        """
+        def timed():
+            start = time.perf_counter()
+            try:
+                with span(f"pipeline.{name}"):
+                    return fn(*args)
+            finally:
+                elapsed = time.perf_counter() - start
+                with lock:
+                    timings[name] = elapsed
+        return executor.submit(bind_context(timed))
+
+    def run_stream(self, question: str, messages: Optional[List[Dict[str, str]]] = None,
+                   top_k: int = 3, session_id: Optional[str] = None) -> Iterator[Union[str, Dict[str, Any]]]:
+        """
+        流式执行问答流程
+
+        Args:
+            question: 用户问题
+            messages: 之前的聊天记录，不含当前问题
+            top_k: 检索返回的最大结果数
+            session_id: 会话 ID，提供时使用该会话的对话记忆（窗口 + 滚动摘要），否则只取最近几条消息
+        Yields:
+            文本片段（str），最后一项为结果字典，在 generate 的结果之外还包含 notes 和 timings
+        """
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        # 线程池中的阶段（包括不等待完成的预热）与主线程并发写入 timings，写入和读取快照时持有该锁
+        timings_lock = threading.Lock()
+        generator = self._generator or get_answer_generator()
+        executor = self.executor
+
+        def prepare_prompt():
+            stage_start = time.perf_counter()
+            if session_id is not None:
+                history_text = self.memory_store.get(session_id).update(messages or [])
+            else:
+                history_text = format_history(messages or [])
+            history_seconds = time.perf_counter() - stage_start
+            stage_start = time.perf_counter()
+            prompt_template = generator.prepare_prompt(history_text)
+            with timings_lock:
+                timings["history"] = history_seconds
+                timings["prompt_prefix"] = time.perf_counter() - stage_start
+            return history_text, prompt_template
+
+        # 辅助阶段先提交到线程池，在检索期间并行完成
+        prepared = executor.submit(bind_context(prepare_prompt))
+        if os.getenv("LLM_WARMUP_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on"):
+            # 预热只是为了建立连接，不等待其完成
+            self._submit(executor, "warmup", timings, timings_lock, generator.warm_up)
+
+        # 检索可能阻塞到请求截止时间，在调用线程上执行，避免多个会话的检索在共享线程池中互相排队
+        retrieval_start = time.perf_counter()
+        with span("pipeline.retrieval"):
+            notes = self.retrieve(question, top_k)
+        with timings_lock:
+            timings["retrieval"] = time.perf_counter() - retrieval_start
+
+        if not notes:
+            # “无相关笔记”（或检索降级时的服务不可用提示）是固定回答，无需进入生成阶段
+            result = dict(generator.generate(question, notes))
+            yield result["answer"]
+        else:
+            result = {}
+            generation_start = time.perf_counter()
+            first_token = None
+            history_text, prompt_template = prepared.result()
+            for item in generator.generate_stream(question, notes, history_text, prompt=prompt_template):
+                if isinstance(item, dict):
+                    result = dict(item)
+                    continue
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                    with timings_lock:
+                        timings["first_token"] = first_token
+                    record_span("pipeline.first_token", first_token, start)
+                yield item
+            with timings_lock:
+                timings["generation"] = time.perf_counter() - generation_start
+
+        with timings_lock:
+            timings["total"] = time.perf_counter() - start
+            snapshot = dict(timings)
+        logger.info("流水线各阶段耗时：" + "，".join(f"{name}={value:.3f}s" for name, value in snapshot.items()))
+        result["notes"] = notes
+        result["timings"] = snapshot
+        yield result
+
+    def run(self, question: str, messages: Optional[List[Dict[str, str]]] = None, top_k: int = 3,
+            session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        执行问答流程并返回最终结果字典
+        """
+        result: Dict[str, Any] = {}
+        for item in self.run_stream(question, messages, top_k, session_id):
+            if isinstance(item, dict):
+                result = item
+        return result
+
+
+def get_pipeline() -> QAPipeline:
+    """
+    获取进程级共享的问答流水线
+    """
+    return get_resource("qa_pipeline", QAPipeline)
@@ -0,0 +1,206 @@
+import copy
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+# 连续的中日韩汉字切成相邻二元组；连续的字母数字作为一个词
+_TERM_PATTERN = re.compile(r"[一-鿿㐀-䶿]+|[a-z0-9]+")
+_CJK = re.compile(r"[一-鿿㐀-䶿]")
+
+
+def analyze(text: str) -> List[str]:
+    """
+    将文本切分为索引词：汉字按相邻二元组切分（单个汉字保留为单字），字母数字按整词
+
+    Args:
+        text: 输入文本
+    Returns:
+        索引词列表（含重复）
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    terms: List[str] = []
+    for run in _TERM_PATTERN.findall(text):
+        if len(run) > 1 and _CJK.match(run):
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return terms
+
+
+class BM25Index:
+    """
+    不可变的 BM25 倒排索引段
+    倒排表以 CSR 形式存放在 NumPy 数组中：词 t 的倒排为 postings[offsets[t]:offsets[t+1]]，
+    可以保存为 .npy 文件并以内存映射方式加载；检索时按查询词向量化累加得分
+    """
+
+    def __init__(self, keys: List[str], terms: List[str], offsets: np.ndarray, post_docs: np.ndarray,
+                 post_tf: np.ndarray, doc_len: np.ndarray):
+        self.keys = keys
+        self.terms = terms
+        self.vocab: Dict[str, int] = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets
+        self.post_docs = post_docs
+        self.post_tf = post_tf
+        self.doc_len = doc_len
+        self.total_len = int(doc_len.sum()) if len(doc_len) else 0
+        # 被后续更新覆盖或删除的文档在检索时屏蔽
+        self.live = np.ones(len(keys), dtype=bool)
+        self._key_index: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def build(cls, docs: Iterable[Tuple[str, str]]) -> "BM25Index":
+        """
+        从 (文档键, 文本) 构建索引段
+        """
+        keys: List[str] = []
+        vocab: Dict[str, int] = {}
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        tfs: List[int] = []
+        lengths: List[int] = []
+        for key, text in docs:
+            doc = len(keys)
+            keys.append(key)
+            terms = analyze(text)
+            lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                term_id = vocab.get(term)
+                if term_id is None:
+                    term_id = vocab[term] = len(vocab)
+                term_ids.append(term_id)
+                doc_ids.append(doc)
+                tfs.append(tf)
+
+        term_array = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_array, kind="stable")
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_array, minlength=len(vocab)), out=offsets[1:])
+        terms = [""] * len(vocab)
+        for term, term_id in vocab.items():
+            terms[term_id] = term
+        return cls(
+            keys, terms, offsets,
+            np.asarray(doc_ids, dtype=np.int32)[order],
+            np.asarray(tfs, dtype=np.float32)[order],
+            np.asarray(lengths, dtype=np.int32),
+        )
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def df(self, term: str) -> int:
+        term_id = self.vocab.get(term)
+        return 0 if term_id is None else int(self.offsets[term_id + 1] - self.offsets[term_id])
+
+    def index_of(self, key: str) -> Optional[int]:
+        if self._key_index is None:
+            self._key_index = {k: i for i, k in enumerate(self.keys)}
+        return self._key_index.get(key)
+
+    def mask(self, keys: Iterable[str]):
+        """
+        屏蔽指定文档（已被更新或删除）
+        """
+        for key in keys:
+            index = self.index_of(key)
+            if index is not None:
+                self.live[index] = False
+
+    def masked(self, keys: Iterable[str]) -> "BM25Index":
+        """
+        返回只屏蔽指定文档的新索引段，与本段共享倒排数组；本段可能正被检索使用，不做修改
+        """
+        segment = copy.copy(self)
+        segment.live = np.ones(len(self.keys), dtype=bool)
+        segment.mask(keys)
+        return segment
+
+    def search(self, query_terms: Sequence[str], top_k: int, n_docs: int, avg_len: float,
+               df: Dict[str, int], k1: float = 1.5, b: float = 0.75) -> List[Tuple[str, float, float]]:
+        """
+        在本段中检索
+
+        Args:
+            query_terms: 去重后的查询词
+            top_k: 返回的最大结果数
+            n_docs: 所有段的文档总数（用于计算 IDF）
+            avg_len: 所有段的平均文档长度
+            df: 查询词在所有段中的文档频率
+        Returns:
+            [(文档键, BM25 得分, 命中查询词的比例)]，按得分降序
+        """
+        if not len(self.keys) or not query_terms:
+            return []
+        scores = np.zeros(len(self.keys), dtype=np.float32)
+        hits = np.zeros(len(self.keys), dtype=np.int16)
+        norm = k1 * (1 - b + b * self.doc_len / max(avg_len, 1e-9))
+        for term in query_terms:
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.post_docs[start:end]
+            tf = self.post_tf[start:end]
+            idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+            scores[docs] += idf * tf * (k1 + 1) / (tf + norm[docs])
+            hits[docs] += 1
+        scores *= self.live
+        candidates = np.flatnonzero(scores)
+        if not len(candidates):
+            return []
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.keys[i], float(scores[i]), hits[i] / len(query_terms)) for i in candidates]
+
+    def save(self, directory: str):
+        """
+        保存为 .npy 数组和 JSON 词表
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in ("offsets", "post_docs", "post_tf", "doc_len"):
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, "keys.json"), "w", encoding="utf-8") as f:
+            json.dump(self.keys, f, ensure_ascii=False)
+        with open(os.path.join(directory, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump(self.terms, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str) -> "BM25Index":
+        """
+        加载索引段，倒排数组以内存映射方式打开
+        """
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                  for name in ("offsets", "post_docs", "post_tf", "doc_len")}
+        with open(os.path.join(directory, "keys.json"), encoding="utf-8") as f:
+            keys = json.load(f)
+        with open(os.path.join(directory, "terms.json"), encoding="utf-8") as f:
+            terms = json.load(f)
+        return cls(keys, terms, **arrays)
+
+
+def search_segments(segments: Sequence[BM25Index], query: str, top_k: int) -> List[Tuple[str, float, float]]:
+    """
+    在多个索引段中检索并合并结果，IDF 和平均长度按所有段合计计算
+    （被屏蔽的文档仍计入统计，只影响极少量的得分精度）
+
+    Returns:
+        [(文档键, BM25 得分, 命中查询词的比例)]，按得分降序
+    """
+    query_terms = list(dict.fromkeys(analyze(query)))
+    n_docs = sum(len(segment) for segment in segments)
+    if not n_docs or not query_terms:
+        return []
+    avg_len = sum(segment.total_len for segment in segments) / n_docs
+    df = {term: sum(segment.df(term) for segment in segments) for term in query_terms}
+    results = []
+    for segment in segments:
+        results.extend(segment.search(query_terms, top_k, n_docs, avg_len, df))
+    results.sort(key=lambda item: item[1], reverse=True)
+    return results[:top_k]
@@ -0,0 +1,99 @@
+import os
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from src.api.models import Note, as_note
+from src.utils.embedding import HashingVectorizer, hamming_distance, simhash
+from src.utils.logger import get_logger
+
+# 初始化日志
+logger = get_logger(__name__)
+
+_vectorizer = HashingVectorizer()
+
+
+def query_coverage(query: str, text: str) -> float:
+    """
+    查询中的实词特征在文本中出现的比例（0~1），与本地向量检索的相似度口径一致
+    """
+    query_vector = _vectorizer.presence(query).astype(np.float32)
+    norm = float(query_vector @ query_vector)
+    if not norm:
+        return 0.0
+    score = float(query_vector @ _vectorizer.presence(text).astype(np.float32)) / norm
+    return min(max(score, 0.0), 1.0)
+
+
+def _note_text(note: Note) -> str:
+    return f"{note.title or ''}\n{note.content or ''}"
+
+
+def fuse(rankings: Sequence[List[Dict[str, Any]]], query: str, top_k: int, k: Optional[int] = None,
+         weights: Optional[Sequence[float]] = None, max_distance: Optional[int] = None) -> List[Note]:
+    """
+    用倒数排名融合（RRF）合并多路检索结果
+    每路结果中排第 r 名（从 1 开始）的笔记得分 weight / (k + r)，同一笔记在多路中出现时得分相加。
+    同一笔记按 id 识别；没有 id 的远程引用片段按 SimHash 指纹识别，指纹汉明距离不超过
+    max_distance 的近似重复片段合并为一条（保留排名靠前的一条）。
+    没有 relevance_score 的笔记按查询实词覆盖比例补上
+
+    Args:
+        rankings: 多路检索结果，每路按相关度降序
+        query: 用户查询语句
+        top_k: 返回的最大笔记数
+        k: RRF 平滑常数，默认读取 FUSION_RRF_K
+        weights: 每路结果的权重，默认均为 1
+        max_distance: 判定为近似重复的最大汉明距离，默认读取 FUSION_DEDUPE_DISTANCE
+    Returns:
+        按融合得分（fusion_score）降序的 Note 列表（输入笔记的副本），至多 top_k 条
+    """
+    if k is None:
+        k = int(os.getenv("FUSION_RRF_K", "60"))
+    if max_distance is None:
+        max_distance = int(os.getenv("FUSION_DEDUPE_DISTANCE", "4"))
+    weights = weights or [1.0] * len(rankings)
+
+    fused: List[Note] = []
+    scores: List[float] = []
+    by_id: Dict[str, int] = {}
+    fingerprints: List[int] = []
+    duplicates = 0
+    # 按名次交错遍历各路结果，近似重复时保留名次更靠前的一条
+    for rank in range(max((len(ranking) for ranking in rankings), default=0)):
+        for ranking, weight in zip(rankings, weights):
+            if rank >= len(ranking):
+                continue
+            note = as_note(ranking[rank])
+            score = weight / (k + rank + 1)
+            fingerprint = simhash(_note_text(note))
+            index = by_id.get(note.id) if note.id is not None else None
+            if index is None:
+                index = next((i for i, existing in enumerate(fingerprints)
+                              if hamming_distance(existing, fingerprint) <= max_distance), None)
+            if index is None:
+                index = len(fused)
+                fused.append(note.copy())
+                scores.append(0.0)
+                fingerprints.append(fingerprint)
+            else:
+                duplicates += 1
+                existing = fused[index]
+                # 合并时补全缺少的字段（如远程引用缺少 id），相关度取较高者
+                for key, value in note.items():
+                    existing.setdefault(key, value)
+                if note.relevance_score is not None:
+                    existing.relevance_score = max(existing.relevance_score or 0.0, note.relevance_score)
+            if fused[index].id is not None:
+                by_id[fused[index].id] = index
+            scores[index] += score
+
+    order = sorted(range(len(fused)), key=lambda i: scores[i], reverse=True)[:top_k]
+    results = []
+    for i in order:
+        note = fused[i]
+        note.fusion_score = round(scores[i], 6)
+        if note.relevance_score is None:
+            note.relevance_score = round(query_coverage(query, _note_text(note)), 4)
+        results.append(note)
+    if duplicates:
+        logger.info(f"融合检索结果时合并了 {duplicates} 条重复笔记")
+    return results
@@ -0,0 +1,459 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from src.api.models import Note
+from src.retrieval.bm25 import BM25Index, search_segments
+from src.retrieval.fusion import fuse
+from src.retrieval.vector_index import VectorIndex, search_vector_segments
+from src.utils.logger import get_logger
+from src.utils.resources import get_resource
+from src.utils.tracing import span
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 初始化日志
+logger = get_logger(__name__)
+
+# 影响本地镜像的环境变量，变化时重新加载
+MIRROR_ENV_KEYS = (
+    "KB_ID", "LOCAL_INDEX_ENABLED", "LOCAL_INDEX_DIR", "LOCAL_INDEX_SYNC_INTERVAL", "LOCAL_INDEX_PAGE_SIZE",
+    "LOCAL_VECTOR_ENABLED",
+)
+
+
+class NoteStore:
+    """
+    本地笔记存储（SQLite）
+    每次内容变化（新增、更新、删除）都分配一个递增的 seq，索引据此判断哪些笔记需要重新索引
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS notes ("
+            "id TEXT PRIMARY KEY, title TEXT NOT NULL, content TEXT NOT NULL, "
+            "updated_at REAL NOT NULL, deleted INTEGER NOT NULL DEFAULT 0, seq INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_notes_seq ON notes(seq)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def get_meta(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else default
+
+    def set_meta(self, key: str, value: Any):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def update_meta(self, values: Dict[str, Any]):
+        """
+        在一个事务中写入多个 meta 值，其他进程不会读到只更新了一部分的记录
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                   [(key, json.dumps(value)) for key, value in values.items()])
+            self._conn.execute("COMMIT")
+
+    @property
+    def seq(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM notes").fetchone()[0]
+
+    def upsert(self, notes: List[Dict[str, Any]]) -> int:
+        """
+        写入一页笔记，内容未变化的笔记不会分配新的 seq
+
+        Returns:
+            实际发生变化的笔记数
+        """
+        if not notes:
+            return 0
+        with self._lock:
+            seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM notes").fetchone()[0]
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO notes (id, title, content, updated_at, deleted, seq) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET title = excluded.title, content = excluded.content, "
+                "updated_at = excluded.updated_at, deleted = excluded.deleted, seq = excluded.seq "
+                "WHERE notes.updated_at != excluded.updated_at OR notes.deleted != excluded.deleted "
+                "OR notes.content != excluded.content OR notes.title != excluded.title",
+                [(note["id"], note["title"], note["content"], note["updated_at"], int(note["deleted"]), seq + i + 1)
+                 for i, note in enumerate(notes)],
+            )
+            self._conn.execute("COMMIT")
+            return self._conn.total_changes - before
+
+    def mark_deleted_except(self, keep_ids: Iterable[str]) -> int:
+        """
+        全量同步后，将本次没有出现的笔记标记为已删除
+
+        Returns:
+            标记为删除的笔记数
+        """
+        keep = set(keep_ids)
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM notes WHERE deleted = 0").fetchall()
+            missing = [row[0] for row in rows if row[0] not in keep]
+            seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM notes").fetchone()[0]
+            self._conn.execute("BEGIN")
+            self._conn.executemany("UPDATE notes SET deleted = 1, seq = ? WHERE id = ?",
+                                   [(seq + i + 1, note_id) for i, note_id in enumerate(missing)])
+            self._conn.execute("COMMIT")
+        return len(missing)
+
+    def changed_since(self, seq: int) -> List[tuple]:
+        """
+        返回 seq 之后变化的笔记：[(id, title, content, deleted)]
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, title, content, deleted FROM notes WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+
+    def iter_live(self, batch_size: int = 5000) -> Iterable[tuple]:
+        """
+        逐批遍历未删除的笔记：(id, title, content)
+        """
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, title, content FROM notes WHERE deleted = 0 AND id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+
+    def get_many(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, title, content, updated_at FROM notes WHERE deleted = 0 AND id IN ({placeholders})", ids
+            ).fetchall()
+        return {row[0]: {"id": row[0], "title": row[1], "content": row[2], "updated_at": row[3]} for row in rows}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM notes WHERE deleted = 0").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _index_text(title: str, content: str) -> str:
+    return f"{title}\n{content}"
+
+
+class NoteMirror:
+    """
+    知识库本地镜像
+    通过笔记列表接口把 KB_ID 对应知识库的笔记增量同步到本地 SQLite，并维护 BM25 索引和向量索引：
+    基础段保存在磁盘上（内存映射加载），同步后变化的笔记放入内存中的增量段，同时在基础段中屏蔽旧版本；
+    增量段超过一定规模时合并重建基础段
+    """
+
+    def __init__(self, directory: str, api: Optional[Any] = None, page_size: int = 500,
+                 compact_ratio: float = 0.1, compact_min: int = 1000, vectors: bool = True):
+        """
+        Args:
+            directory: 镜像目录，保存 notes.sqlite3 和索引文件
+            api: 提供 list_notes 的 API 客户端，默认使用进程级共享的 GetNoteAPI
+            page_size: 同步时每页拉取的笔记数
+            compact_ratio: 增量段超过基础段该比例时重建基础段
+            compact_min: 增量段达到该条数前不重建
+            vectors: 是否同时维护向量索引
+        """
+        self.directory = directory
+        self._api = api
+        self.page_size = page_size
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+        self.vectors = vectors
+        self.store = NoteStore(os.path.join(directory, "notes.sqlite3"))
+        self._index_lock = threading.Lock()
+        # (BM25 段列表, 向量段列表)，整体替换，检索时无需加锁
+        self._indexes: Tuple[List[BM25Index], List[VectorIndex]] = ([], [])
+        self._stop = threading.Event()
+        self._sync_thread: Optional[threading.Thread] = None
+        self._load_index()
+
+    @property
+    def api(self) -> Any:
+        if self._api is None:
+            from src.api.get_api import get_client
+            self._api = get_client()
+        return self._api
+
+    @property
+    def _index_dir(self) -> str:
+        return os.path.join(self.directory, "index")
+
+    def _version_dir(self, version: Optional[str]) -> str:
+        """
+        索引版本所在的目录；没有版本记录时为旧版本直接写在 index 目录下的索引
+        """
+        return os.path.join(self._index_dir, version) if version else self._index_dir
+
+    def __len__(self) -> int:
+        return sum(int(segment.live.sum()) for segment in self._indexes[0])
+
+    def sync(self, full: bool = False) -> Dict[str, int]:
+        """
+        从 API 同步笔记并更新索引
+
+        Args:
+            full: 是否全量同步（同时清理服务端已不存在的笔记），默认从上次同步的时间点增量同步
+        Returns:
+            同步统计：fetched（拉取条数）、changed（发生变化的条数）、pages（请求页数）
+        """
+        start = time.perf_counter()
+        watermark = None if full else self.store.get_meta("updated_after")
+        cursor = None
+        fetched = changed = pages = 0
+        max_updated = watermark or 0.0
+        seen: List[str] = []
+        while True:
+            page = self.api.list_notes(updated_after=watermark, cursor=cursor, limit=self.page_size)
+            pages += 1
+            notes = page["notes"]
+            fetched += len(notes)
+            changed += self.store.upsert(notes)
+            if notes:
+                max_updated = max(max_updated, max(note["updated_at"] for note in notes))
+            if full:
+                seen.extend(note["id"] for note in notes if not note["deleted"])
+            if not page["has_more"]:
+                break
+            cursor = page["next_cursor"]
+        if full:
+            changed += self.store.mark_deleted_except(seen)
+        # 下次从最新的更新时间（含）开始增量同步，重复拉到的笔记内容不变时不会重新索引
+        self.store.set_meta("updated_after", max_updated)
+        if changed or not self._indexes[0]:
+            self.refresh_index()
+        logger.info(f"本地镜像同步完成：拉取 {fetched} 条，变化 {changed} 条，{pages} 页，"
+                    f"耗时 {time.perf_counter() - start:.2f} 秒")
+        return {"fetched": fetched, "changed": changed, "pages": pages}
+
+    def refresh_index(self):
+        """
+        根据存储中的变化更新索引：变化较少时只重建增量段，否则重建基础段
+        """
+        with self._index_lock:
+            lexical, dense = self._indexes
+            base = lexical[0] if lexical else None
+            base_seq = self.store.get_meta("index_seq", 0) if base is not None else 0
+            changed = self.store.changed_since(base_seq) if base is not None else []
+            if base is None or len(changed) > max(self.compact_min, self.compact_ratio * len(base)):
+                self._rebuild_base()
+            else:
+                self._indexes = self._with_delta(base, dense[0] if dense else None, changed)
+
+    def _rebuild_base(self):
+        start = time.perf_counter()
+        seq = self.store.seq
+        base = BM25Index.build((note_id, _index_text(title, content))
+                               for note_id, title, content in self.store.iter_live())
+        vector_base = VectorIndex.build(self.store.iter_live()) if self.vectors else None
+        # 每次重建写入新的版本目录，写完后再在 meta 中切换当前版本；其他进程在切换前仍加载旧版本，
+        # 不会看到写了一半或暂时不存在的索引
+        previous = self.store.get_meta("index_version")
+        version = f"v{seq}-{time.time_ns()}"
+        version_dir = self._version_dir(version)
+        base.save(os.path.join(version_dir, "bm25"))
+        if vector_base is not None:
+            vector_base.save(os.path.join(version_dir, "vectors"))
+        self.store.update_meta({"index_version": version, "index_seq": seq})
+        self._indexes = ([base], [vector_base] if vector_base is not None else [])
+        self._prune_versions(keep=(version, previous))
+        logger.info(f"本地索引已重建：{len(base)} 篇笔记，{len(base.terms)} 个词，"
+                    f"{len(vector_base) if vector_base is not None else 0} 个向量片段，"
+                    f"耗时 {time.perf_counter() - start:.2f} 秒")
+
+    def _prune_versions(self, keep: Iterable[Optional[str]]):
+        """
+        删除不再使用的旧索引版本
+        保留当前版本和上一个版本：正在进行的检索和其他进程可能仍在使用上一个版本（内存映射打开），
+        它在下一次重建时才删除；删除失败（如 Windows 下文件仍被映射）时跳过，下次重建再试
+        """
+        keep = {version for version in keep if version}
+        for name in os.listdir(self._index_dir):
+            path = os.path.join(self._index_dir, name)
+            if name in keep or not os.path.isdir(path):
+                continue
+            try:
+                shutil.rmtree(path)
+            except OSError as e:
+                logger.info(f"旧索引版本 {name} 仍在使用，稍后删除：{e}")
+
+    def _with_delta(self, base: BM25Index, vector_base: Optional[VectorIndex],
+                    changed: List[tuple]) -> Tuple[List[BM25Index], List[VectorIndex]]:
+        changed_ids = [row[0] for row in changed]
+        live = [(note_id, title, content) for note_id, title, content, deleted in changed if not deleted]
+        # 在副本上屏蔽旧版本，正在检索的线程仍使用原来的段，随后整体替换 self._indexes
+        lexical = [base.masked(changed_ids)]
+        if live:
+            lexical.append(BM25Index.build((note_id, _index_text(title, content)) for note_id, title, content in live))
+        dense: List[VectorIndex] = []
+        if vector_base is not None:
+            dense.append(vector_base.masked(changed_ids))
+            if live:
+                dense.append(VectorIndex.build(live))
+        return lexical, dense
+
+    def _load_index(self):
+        version_dir = self._version_dir(self.store.get_meta("index_version"))
+        if not os.path.exists(os.path.join(version_dir, "bm25", "keys.json")):
+            return
+        try:
+            base = BM25Index.load(os.path.join(version_dir, "bm25"))
+            vector_dir = os.path.join(version_dir, "vectors")
+            vector_base = VectorIndex.load(vector_dir) if self.vectors and os.path.exists(vector_dir) else None
+        except Exception as e:
+            logger.warning(f"加载本地索引失败，将在下次同步时重建：{e}")
+            return
+        if self.vectors and vector_base is None:
+            # 之前未启用向量索引，下次同步时重建
+            return
+        with self._index_lock:
+            changed = self.store.changed_since(self.store.get_meta("index_seq", 0))
+            self._indexes = self._with_delta(base, vector_base, changed)
+        logger.info(f"已加载本地索引：{len(self)} 篇笔记")
+
+    def _to_notes(self, hits: List[tuple]) -> List[Note]:
+        """
+        将 [(笔记键, 附加字段)] 转换为带正文的笔记列表
+        """
+        notes = self.store.get_many([key for key, _ in hits])
+        results = []
+        for key, fields in hits:
+            row = notes.get(key)
+            if row is None:
+                continue
+            note = Note.from_dict(row)
+            note.update(fields, source="本地镜像")
+            results.append(note)
+        return results
+
+    def search_lexical(self, query: str, top_k: int = 3) -> List[Note]:
+        """
+        BM25 检索
+
+        Returns:
+            笔记列表，按 BM25 得分（bm25_score）降序；relevance_score 为命中的查询词比例（0~1）
+        """
+        hits = search_segments(self._indexes[0], query, top_k)
+        return self._to_notes([(key, {"bm25_score": round(score, 4), "relevance_score": round(coverage, 4)})
+                               for key, score, coverage in hits])
+
+    def search_dense(self, query: str, top_k: int = 3) -> List[Note]:
+        """
+        向量检索
+
+        Returns:
+            笔记列表，按 relevance_score（查询实词特征在最佳片段中的覆盖比例，0~1）降序
+        """
+        hits = search_vector_segments(self._indexes[1], query, top_k)
+        return self._to_notes([(key, {"relevance_score": round(score, 4)}) for key, score in hits])
+
+    def search(self, query: str, top_k: int = 3) -> List[Note]:
+        """
+        在本地索引中检索：用倒数排名融合合并 BM25 和向量检索结果
+
+        Args:
+            query: 用户查询语句
+            top_k: 返回的最大结果数
+        Returns:
+            笔记列表，按融合得分降序
+        """
+        with span("local.search", top_k=top_k) as attrs:
+            results = fuse([self.search_lexical(query, top_k), self.search_dense(query, top_k)], query, top_k)
+            attrs["notes"] = len(results)
+        return results
+
+    def start_background_sync(self, interval: float):
+        """
+        启动后台线程，每隔 interval 秒增量同步一次
+        笔记列表接口不存在（404）时记录一次警告并停止后台同步，已有的本地镜像仍可检索
+        """
+        from src.api.get_api import NotesEndpointNotFoundError
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.sync()
+                except NotesEndpointNotFoundError as e:
+                    logger.warning(f"{e}，已停止本地镜像后台同步")
+                    return
+                except Exception as e:
+                    logger.warning(f"本地镜像后台同步失败：{e}")
+
+        self._sync_thread = threading.Thread(target=run, name="note-mirror-sync", daemon=True)
+        self._sync_thread.start()
+
+    def close(self):
+        self._stop.set()
+        self.store.close()
+
+
+def get_note_mirror() -> Optional[NoteMirror]:
+    """
+    获取进程级共享的本地镜像，LOCAL_INDEX_ENABLED 未开启时返回 None
+    """
+    if os.getenv("LOCAL_INDEX_ENABLED", "false").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+
+    def create() -> NoteMirror:
+        mirror = NoteMirror(
+            os.getenv("LOCAL_INDEX_DIR") or os.path.join("cache", "mirror", os.getenv("KB_ID") or "default"),
+            page_size=int(os.getenv("LOCAL_INDEX_PAGE_SIZE", "500")),
+            vectors=os.getenv("LOCAL_VECTOR_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on"),
+        )
+        interval = float(os.getenv("LOCAL_INDEX_SYNC_INTERVAL", "0"))
+        if interval > 0:
+            mirror.start_background_sync(interval)
+        return mirror
+    return get_resource("note_mirror", create, MIRROR_ENV_KEYS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Get笔记知识库本地镜像")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    sync_parser = subparsers.add_parser("sync", help="同步笔记并更新本地索引")
+    sync_parser.add_argument("--full", action="store_true", help="全量同步")
+    search_parser = subparsers.add_parser("search", help="在本地索引中检索")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ["LOCAL_INDEX_ENABLED"] = "true"
+    mirror = get_note_mirror()
+    if args.command == "sync":
+        print(mirror.sync(full=args.full))
+    else:
+        for note in mirror.search(args.query, args.top_k):
+            print(f"{note['relevance_score']:8.3f}  {note['title']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,254 @@
-from typing import List, Dict, Any
-from src.api.get_api import GetNoteAPI
+import asyncio
+import os
+import time
+from typing import List, Dict, Any, Optional
+from src.api.circuit_breaker import CircuitOpenError
+from src.api.get_api import AI_ANSWER_SOURCE, get_client, get_async_client
+from src.api.models import Note, as_note
+from src.cache.semantic_cache import get_semantic_cache
+from src.cache.single_flight import get_single_flight, make_key
+from src.retrieval.fusion import fuse
+from src.retrieval.mirror import get_note_mirror
+from src.retrieval.router import get_mode_router, get_retrieval_mode
 from src.utils.logger import get_logger
+from src.utils.tracing import span
 
 # 初始化日志
 logger = get_logger(__name__)
 
-def retrieve_notes(query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+
+class RetrievedNotes(list):
+    """
+    检索结果列表（元素为 Note）
+    与普通列表用法相同，额外携带 degraded 标记：为 True 表示知识库服务不可用（熔断或请求失败），
+    结果为空并不代表知识库中没有相关笔记
+    """
+
+    def __init__(self, notes: Optional[List[Note]] = None, degraded: bool = False, reason: str = ""):
+        super().__init__(notes or [])
+        self.degraded = degraded
+        self.reason = reason
+
+
+def select_notes(notes: List[Dict[str, Any]], top_k: int, threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    按 top_k 和相似度阈值筛选检索结果
+    带 relevance_score 的笔记低于阈值时丢弃，没有得分的笔记保留；
+    Get 笔记 AI 综合回答不是笔记，不占用 top_k 名额
+
+    Args:
+        notes: 检索结果
+        top_k: 保留的最大笔记数
+        threshold: 最低相关度，默认读取 SIMILARITY_THRESHOLD
+    Returns:
+        筛选后的列表，保持原有顺序
+    """
+    if threshold is None:
+        threshold = float(os.getenv("SIMILARITY_THRESHOLD", "0.7"))
+    selected = []
+    kept = 0
+    for note in notes:
+        if note.get("source") == AI_ANSWER_SOURCE:
+            selected.append(note)
+            continue
+        score = note.get("relevance_score")
+        if score is not None and score < threshold:
+            continue
+        if kept < top_k:
+            selected.append(note)
+            kept += 1
+    return selected
+
+
+def _search_local(query: str, top_k: int) -> List[List[Note]]:
+    """
+    在本地镜像中分别进行 BM25 和向量检索，未开启本地镜像或检索出错时返回空列表
+    """
+    mirror = get_note_mirror()
+    if mirror is None:
+        return []
+    try:
+        with span("local.search", top_k=top_k):
+            return [mirror.search_lexical(query, top_k), mirror.search_dense(query, top_k)]
+    except Exception as e:
+        logger.warning(f"本地镜像检索失败：{e}")
+        return []
+
+
+def _local_hit(query: str, top_k: int, local_rankings: List[List[Note]]):
+    """
+    按相似度阈值筛选本地各路检索结果
+
+    Returns:
+        (relevant, notes)：relevant 为筛选后的各路结果，用于与远程结果融合；
+        达到阈值的笔记不少于 LOCAL_INDEX_MIN_HITS（默认 top_k）时 notes 为融合后的本地结果，否则为 None
+    """
+    relevant = [select_notes(ranking, top_k) for ranking in local_rankings]
+    local_notes = fuse(relevant, query, top_k)
+    min_hits = int(os.getenv("LOCAL_INDEX_MIN_HITS") or top_k)
+    if local_notes and len(local_notes) >= min_hits:
+        logger.info(f"本地镜像命中，找到 {len(local_notes)} 个相关笔记")
+        return relevant, local_notes
+    return relevant, None
+
+
+def merge_results(query: str, remote_notes: List[Note], local_rankings: List[List[Note]],
+                  top_k: int) -> List[Note]:
+    """
+    融合远程检索结果和本地检索结果
+    Get 笔记 AI 综合回答保持在最前面；远程引用片段按 API 返回的顺序与本地各路结果做倒数排名融合、
+    去除近似重复并补上 relevance_score，最后截取 top_k 条笔记
     """
-    检索相关笔记的核心函数
+    answers = [as_note(note) for note in remote_notes if note.get("source") == AI_ANSWER_SOURCE]
+    refs = [note for note in remote_notes if note.get("source") != AI_ANSWER_SOURCE]
+    return answers + fuse([refs] + local_rankings, query, top_k)
+
+
+def _encode_notes(notes: RetrievedNotes) -> Dict[str, Any]:
+    return {"notes": [dict(note) for note in notes], "degraded": notes.degraded, "reason": notes.reason}
+
+
+def _decode_notes(value: Dict[str, Any]) -> RetrievedNotes:
+    return RetrievedNotes([as_note(note) for note in value["notes"]], degraded=value["degraded"], reason=value["reason"])
+
+
+def retrieve_notes(query: str, top_k: int = 3, mode: Optional[str] = None) -> List[Note]:
+    """
+    检索相关笔记的核心函数，耗时记录为 retrieve 阶段
     Args:
         query: 用户查询语句
         top_k: 返回的最大结果数
+        mode: 检索模式 fast / balanced / deep，默认读取 RETRIEVAL_MODE
     Returns:
-        包含相关笔记信息的列表
+        包含相关笔记信息的列表（RetrievedNotes），服务不可用时为空且 degraded 为 True
+    """
+    mode = get_retrieval_mode(mode)
+    with span("retrieve", top_k=top_k, mode=mode) as attrs:
+        # 多个会话同时提出同一问题时只检索一次，其余请求等待并共享结果
+        flight = get_single_flight("retrieve", _encode_notes, _decode_notes)
+        if flight is not None:
+            notes = flight.do(make_key(query, top_k, os.getenv("KB_ID"), mode),
+                              lambda: _retrieve_notes(query, top_k, mode))
+        else:
+            notes = _retrieve_notes(query, top_k, mode)
+        attrs["notes"] = len(notes)
+        attrs["degraded"] = notes.degraded
+        return notes
+
+
+def _retrieve_notes(query: str, top_k: int, mode: str = "deep") -> RetrievedNotes:
+    """
+    retrieve_notes 的实现
     """
     logger.info(f"开始检索笔记，查询：{query}")
+    local_rankings: List[List[Note]] = []
     
     try:
-        # 初始化 API 客户端
-        api = GetNoteAPI()
+        # 语义相近的问题直接复用之前的检索结果（top_k 和检索模式相同时）
+        semantic_cache = get_semantic_cache(f"notes:{os.getenv('KB_ID')}")
+        fingerprint = f"{top_k}:{mode}"
+        if semantic_cache is not None:
+            cached = semantic_cache.lookup(query, fingerprint)
+            if cached is not None:
+                return RetrievedNotes(cached)
+
+        # 本地镜像中达到相似度阈值的笔记足够多时直接返回，不再请求 API
+        local_rankings = _search_local(query, top_k)
+        relevant, local_notes = _local_hit(query, top_k, local_rankings)
+        if local_notes is not None:
+            return RetrievedNotes(local_notes)
+
+        # 获取进程级共享的 API 客户端（复用连接池）
+        api = get_client()
         
-        # 调用 API 进行搜索
-        notes = api.search_notes(query, top_k)
+        # 按检索模式调用 API（balanced 先快速检索，按接口原始结果判断不足时再深度检索），并与本地结果融合
+        start = time.perf_counter()
+        notes = get_mode_router().search(
+            mode, lambda api_mode: api.search_notes(query, top_k, mode=api_mode), top_k,
+            merge=lambda remote_notes: merge_results(query, remote_notes, relevant, top_k))
         
         logger.info(f"检索完成，找到 {len(notes)} 个相关笔记/回答")
+
+        if semantic_cache is not None and notes:
+            semantic_cache.store(query, notes, time.perf_counter() - start, fingerprint)
         
-        # ✅ 关键：直接返回所有结果，不做任何过滤
-        return notes
-        
+        return RetrievedNotes(notes)
+
+    except CircuitOpenError as e:
+        # 熔断期间立即返回（缓存已在 search_notes 中查过），由调用方提示服务降级
+        # 有本地镜像时返回本地检索结果（服务不可用时尽力而为，不按相似度阈值过滤）
+        logger.warning(f"知识库服务熔断中，降级返回：{e}")
+        return RetrievedNotes(fuse(local_rankings, query, top_k), degraded=True, reason=str(e))
     except Exception as e:
         logger.error(f"检索笔记时发生异常：{e}")
-        # 发生错误时返回空列表，避免程序崩溃
-        return []
\ No newline at end of file
+        # 发生错误时返回带降级标记的本地结果（或空列表），避免程序崩溃，也不会被误当作“没有相关笔记”
+        return RetrievedNotes(fuse(local_rankings, query, top_k), degraded=True, reason=str(e))
+
+
+async def retrieve_notes_async(query: str, top_k: int = 3, deadline: Optional[float] = None,
+                               mode: Optional[str] = None) -> List[Note]:
+    """
+    检索相关笔记的异步版本，适合在同一进程中并发发起大量检索
+    Args:
+        query: 用户查询语句
+        top_k: 返回的最大结果数
+        deadline: 每次请求的截止时间（秒），默认读取 GETNOTE_REQUEST_DEADLINE；balanced 升级时两次请求分别计算
+        mode: 检索模式 fast / balanced / deep，默认读取 RETRIEVAL_MODE
+    Returns:
+        包含相关笔记信息的列表（RetrievedNotes），服务不可用时为空且 degraded 为 True
+    """
+    mode = get_retrieval_mode(mode)
+    with span("retrieve", top_k=top_k, mode=mode) as attrs:
+        notes = await _retrieve_notes_async(query, top_k, deadline, mode)
+        attrs["notes"] = len(notes)
+        attrs["degraded"] = notes.degraded
+        return notes
+
+
+async def _retrieve_notes_async(query: str, top_k: int, deadline: Optional[float],
+                                mode: str = "deep") -> RetrievedNotes:
+    """
+    retrieve_notes_async 的实现
+    语义缓存、本地镜像检索和融合、服务不可用时的本地降级与同步版本相同（本地检索在线程中执行，不阻塞事件循环）；
+    唯一的区别是不经过 single-flight：它通过线程等待和文件锁合并请求，会阻塞事件循环，
+    重复的 API 请求仍由 search_notes 中的检索缓存去重
+    """
+    logger.info(f"开始异步检索笔记，查询：{query}")
+    local_rankings: List[List[Note]] = []
+
+    try:
+        semantic_cache = get_semantic_cache(f"notes:{os.getenv('KB_ID')}")
+        fingerprint = f"{top_k}:{mode}"
+        if semantic_cache is not None:
+            cached = semantic_cache.lookup(query, fingerprint)
+            if cached is not None:
+                return RetrievedNotes(cached)
+
+        local_rankings = await asyncio.to_thread(_search_local, query, top_k)
+        relevant, local_notes = _local_hit(query, top_k, local_rankings)
+        if local_notes is not None:
+            return RetrievedNotes(local_notes)
+
+        api = get_async_client()
+
+        async def search(api_mode: str) -> List[Note]:
+            return await api.search_notes(query, top_k, deadline=deadline, mode=api_mode)
+
+        start = time.perf_counter()
+        notes = await get_mode_router().asearch(
+            mode, search, top_k, merge=lambda remote_notes: merge_results(query, remote_notes, relevant, top_k))
+
+        logger.info(f"异步检索完成，找到 {len(notes)} 个相关笔记/回答")
+
+        if semantic_cache is not None and notes:
+            semantic_cache.store(query, notes, time.perf_counter() - start, fingerprint)
+
+        return RetrievedNotes(notes)
+
+    except CircuitOpenError as e:
+        logger.warning(f"知识库服务熔断中，降级返回：{e}")
+        return RetrievedNotes(fuse(local_rankings, query, top_k), degraded=True, reason=str(e))
+    except Exception as e:
+        # 取消（CancelledError）不属于 Exception，会继续向上传播
+        logger.error(f"异步检索笔记时发生异常：{e}")
+        return RetrievedNotes(fuse(local_rankings, query, top_k), degraded=True, reason=str(e))
@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from src.api.get_api import AI_ANSWER_SOURCE, SEARCH_MODES
+from src.api.models import Note
+from src.api.retry import LatencyTracker
+from src.utils.logger import get_logger
+from src.utils.resources import get_resource
+from src.utils.tracing import metrics, span
+
+# 初始化日志
+logger = get_logger(__name__)
+
+# 可选的检索模式：fast、deep 直接对应接口参数，balanced 先用 fast 检索，结果为空或置信度不足时升级为 deep
+RETRIEVAL_MODES = ("fast", "balanced", "deep")
+
+# 影响路由策略的环境变量，变化时重新创建路由器
+ROUTER_ENV_KEYS = ("RETRIEVAL_ESCALATE_MIN_HITS", "SIMILARITY_THRESHOLD")
+
+
+def get_retrieval_mode(mode: Optional[str] = None) -> str:
+    """
+    获取检索模式：参数优先，否则读取 RETRIEVAL_MODE，默认 deep
+
+    Raises:
+        ValueError: 未知的检索模式
+    """
+    mode = (mode or os.getenv("RETRIEVAL_MODE") or "deep").strip().lower()
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"未知的检索模式：{mode}，可选 {', '.join(RETRIEVAL_MODES)}")
+    return mode
+
+
+class ModeStats:
+    """
+    单个接口模式（fast / deep）的调用统计
+    """
+
+    def __init__(self, window: int = 500):
+        self.calls = 0
+        self.empty = 0
+        self.low_confidence = 0
+        self.escalations = 0
+        self.total_seconds = 0.0
+        self.latency = LatencyTracker(window, min_samples=1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "mean": round(self.total_seconds / self.calls, 4) if self.calls else None,
+            "p50": self.latency.quantile(0.5),
+            "p95": self.latency.quantile(0.95),
+            "empty": self.empty,
+            "low_confidence": self.low_confidence,
+            "escalations": self.escalations,
+        }
+
+
+class ModeRouter:
+    """
+    检索模式路由
+    balanced 模式先发 fast 请求（不开启深度思考），检索结果为空或达到相似度阈值的笔记不足时
+    再发 deep 请求；各模式的耗时、结果不足次数和升级次数记录在 snapshot() 以及
+    rag_search_mode_seconds、rag_search_mode_total、rag_search_escalations_total 指标中，
+    用于根据实际数据调整 RETRIEVAL_ESCALATE_MIN_HITS 和默认模式。
+    是否升级按接口返回的原始结果判断：融合会把没有得分的引用片段补上查询实词覆盖比例，
+    改写较多的正常回答覆盖比例往往达不到阈值，不能用来衡量接口结果的置信度
+    """
+
+    def __init__(self, min_hits: int = 1, threshold: float = 0.7, window: int = 500):
+        """
+        Args:
+            min_hits: fast 结果中至少有多少条笔记达到相似度阈值才不升级（不超过 top_k）
+            threshold: 相似度阈值，与 select_notes 一致
+            window: 每个模式保留的延迟样本数
+        """
+        self.min_hits = min_hits
+        self.threshold = threshold
+        self._stats = {mode: ModeStats(window) for mode in SEARCH_MODES}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ModeRouter":
+        return cls(
+            min_hits=int(os.getenv("RETRIEVAL_ESCALATE_MIN_HITS", "1")),
+            threshold=float(os.getenv("SIMILARITY_THRESHOLD", "0.7")),
+        )
+
+    def assess(self, notes: List[Note], top_k: int) -> Optional[str]:
+        """
+        判断检索结果是否足够
+
+        Returns:
+            不足时返回原因（empty：没有笔记，low_confidence：达到阈值的笔记太少），足够时返回 None
+        """
+        refs = [note for note in notes if note.get("source") != AI_ANSWER_SOURCE]
+        if not refs:
+            return "empty"
+        # 没有得分的笔记与 select_notes 一样视为相关
+        confident = sum(1 for note in refs
+                        if note.get("relevance_score") is None or note.get("relevance_score") >= self.threshold)
+        if confident < min(self.min_hits, top_k or self.min_hits):
+            return "low_confidence"
+        return None
+
+    def search(self, mode: str, search: Callable[[str], List[Note]], top_k: int,
+               merge: Optional[Callable[[List[Note]], List[Note]]] = None) -> List[Note]:
+        """
+        按检索模式调用 search（参数为接口模式 fast / deep，返回接口的原始结果）
+
+        Args:
+            mode: fast、balanced 或 deep
+            search: 检索函数
+            top_k: 返回的最大笔记数
+            merge: 对最终采用的原始结果做后处理（如与本地结果融合），默认原样返回
+        Returns:
+            检索结果；balanced 升级后 deep 请求失败时返回 fast 的结果（fast 没有结果时抛出异常）
+        """
+        merge = merge or (lambda notes: notes)
+        if mode != "balanced":
+            return merge(self._run(mode, search, top_k)[0])
+        notes, reason = self._run("fast", search, top_k)
+        if reason is None:
+            return merge(notes)
+        self._escalate(reason)
+        try:
+            return merge(self._run("deep", search, top_k)[0])
+        except Exception as e:
+            if not notes:
+                raise
+            logger.warning(f"升级为深度检索失败，返回快速检索的结果：{e}")
+            return merge(notes)
+
+    async def asearch(self, mode: str, search: Callable[[str], Awaitable[List[Note]]], top_k: int,
+                      merge: Optional[Callable[[List[Note]], List[Note]]] = None) -> List[Note]:
+        """
+        search 的异步版本
+        """
+        merge = merge or (lambda notes: notes)
+        if mode != "balanced":
+            return merge((await self._arun(mode, search, top_k))[0])
+        notes, reason = await self._arun("fast", search, top_k)
+        if reason is None:
+            return merge(notes)
+        self._escalate(reason)
+        try:
+            return merge((await self._arun("deep", search, top_k))[0])
+        except Exception as e:
+            if not notes:
+                raise
+            logger.warning(f"升级为深度检索失败，返回快速检索的结果：{e}")
+            return merge(notes)
+
+    def _run(self, mode: str, search: Callable[[str], List[Note]], top_k: int) -> tuple:
+        with span("retrieve.mode", mode=mode) as attrs:
+            start = time.perf_counter()
+            notes = search(mode)
+            return notes, self._observe(mode, time.perf_counter() - start, notes, top_k, attrs)
+
+    async def _arun(self, mode: str, search: Callable[[str], Awaitable[List[Note]]], top_k: int) -> tuple:
+        with span("retrieve.mode", mode=mode) as attrs:
+            start = time.perf_counter()
+            notes = await search(mode)
+            return notes, self._observe(mode, time.perf_counter() - start, notes, top_k, attrs)
+
+    def _observe(self, mode: str, seconds: float, notes: List[Note], top_k: int,
+                 attrs: Dict[str, Any]) -> Optional[str]:
+        """
+        记录一次成功调用的耗时和结果是否足够
+        """
+        reason = self.assess(notes, top_k)
+        attrs["notes"] = len(notes)
+        attrs["outcome"] = reason or "ok"
+        stats = self._stats[mode]
+        with self._lock:
+            stats.calls += 1
+            stats.total_seconds += seconds
+            if reason == "empty":
+                stats.empty += 1
+            elif reason == "low_confidence":
+                stats.low_confidence += 1
+        stats.latency.record(seconds)
+        metrics.observe("rag_search_mode_seconds", seconds, mode=mode)
+        metrics.inc("rag_search_mode_total", mode=mode, outcome=reason or "ok")
+        return reason
+
+    def _escalate(self, reason: str):
+        logger.info(f"快速检索结果不足（{reason}），升级为深度检索")
+        with self._lock:
+            self._stats["fast"].escalations += 1
+        metrics.inc("rag_search_escalations_total", reason=reason)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        各接口模式的统计：调用次数、平均/p50/p95 耗时（秒）、结果为空和置信度不足的次数、升级次数
+        """
+        with self._lock:
+            return {mode: stats.to_dict() for mode, stats in self._stats.items()}
+
+    def summary(self) -> str:
+        """
+        统计的文本形式，没有调用时返回空字符串
+        """
+        lines = []
+        for mode, stats in self.snapshot().items():
+            if stats["calls"]:
+                lines.append(f"检索模式 {mode:<5} 调用 {stats['calls']} 次  p50={stats['p50']:7.3f}s  "
+                             f"p95={stats['p95']:7.3f}s  结果为空 {stats['empty']}  置信度不足 "
+                             f"{stats['low_confidence']}  升级 {stats['escalations']}")
+        return "\n".join(lines)
+
+
+def get_mode_router() -> ModeRouter:
+    """
+    获取进程级共享的检索模式路由器（统计在所有会话之间共享）
+    """
+    return get_resource("mode_router", ModeRouter.from_env, ROUTER_ENV_KEYS)
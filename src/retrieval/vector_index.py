@@ -0,0 +1,156 @@
+import copy
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from src.utils.embedding import HashingVectorizer
+
+
+def chunk_text(title: str, content: str, chunk_chars: int = 128, overlap: int = 32) -> List[str]:
+    """
+    将笔记切分为带重叠的定长片段，每个片段都带上标题
+
+    Args:
+        title: 笔记标题
+        content: 笔记正文
+        chunk_chars: 每个片段的正文字符数
+        overlap: 相邻片段重叠的字符数
+    Returns:
+        片段文本列表（至少包含一个片段）
+    """
+    content = content or ""
+    step = max(chunk_chars - overlap, 1)
+    starts = range(0, max(len(content) - overlap, 1), step)
+    return [f"{title}\n{content[start:start + chunk_chars]}" for start in starts]
+
+
+class VectorIndex:
+    """
+    不可变的稠密向量索引段
+    每个片段的实词特征哈希为带符号的 int8 向量（HashingVectorizer.presence），矩阵按列存放片段
+    （形状为 (dim, 片段数)），可以保存为 .npy 并以内存映射方式加载，进程启动时无需读入整个文件。
+    查询向量只有几十个非零维，检索时只读取这些维对应的行，再用 argpartition 取 top-k
+    """
+
+    def __init__(self, keys: List[str], matrix: np.ndarray, vectorizer: Optional[HashingVectorizer] = None):
+        """
+        Args:
+            keys: 每个片段所属的笔记键（同一笔记的多个片段键相同）
+            matrix: 形状为 (dim, 片段数) 的 int8 矩阵
+        """
+        self.keys = keys
+        self.matrix = matrix
+        self.vectorizer = vectorizer or HashingVectorizer(matrix.shape[0])
+        # 被后续更新覆盖或删除的笔记在检索时屏蔽
+        self.live = np.ones(len(keys), dtype=bool)
+        self._key_rows: Optional[Dict[str, List[int]]] = None
+
+    @classmethod
+    def build(cls, docs: Iterable[Tuple[str, str, str]], vectorizer: Optional[HashingVectorizer] = None,
+              chunk_chars: int = 128, overlap: int = 32) -> "VectorIndex":
+        """
+        从 (笔记键, 标题, 正文) 构建索引段
+        """
+        vectorizer = vectorizer or HashingVectorizer()
+        keys: List[str] = []
+        rows: List[int] = []
+        signs: List[int] = []
+        cols: List[int] = []
+        for key, title, content in docs:
+            for chunk in chunk_text(title, content, chunk_chars, overlap):
+                column = len(keys)
+                keys.append(key)
+                for index, sign in vectorizer.feature_buckets(chunk):
+                    rows.append(index)
+                    signs.append(int(sign))
+                    cols.append(column)
+        matrix = np.zeros((vectorizer.dim, len(keys)), dtype=np.int16)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)),
+                  np.asarray(signs, dtype=np.int16))
+        return cls(keys, np.clip(matrix, -127, 127).astype(np.int8), vectorizer)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def mask(self, keys: Iterable[str]):
+        """
+        屏蔽指定笔记的所有片段（已被更新或删除）
+        """
+        if self._key_rows is None:
+            self._key_rows = {}
+            for i, key in enumerate(self.keys):
+                self._key_rows.setdefault(key, []).append(i)
+        for key in keys:
+            self.live[self._key_rows.get(key, [])] = False
+
+    def masked(self, keys: Iterable[str]) -> "VectorIndex":
+        """
+        返回只屏蔽指定笔记的新索引段，与本段共享向量矩阵；本段可能正被检索使用，不做修改
+        """
+        segment = copy.copy(self)
+        segment.live = np.ones(len(self.keys), dtype=bool)
+        segment.mask(keys)
+        return segment
+
+    def search(self, query_vector: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        """
+        在本段中检索
+
+        Args:
+            query_vector: HashingVectorizer.presence 生成的查询向量
+            top_k: 返回的最大笔记数
+        Returns:
+            [(笔记键, 相似度)]，相似度为查询特征在片段中的覆盖比例（0~1），同一笔记取最高的片段，按相似度降序
+        """
+        dims = np.flatnonzero(query_vector)
+        if not len(self.keys) or not len(dims):
+            return []
+        weights = query_vector[dims].astype(np.float32)
+        scores = weights @ self.matrix[dims].astype(np.float32) / float(weights @ weights)
+        scores[~self.live] = -np.inf
+        # 同一笔记可能有多个片段命中，多取一些片段再按笔记去重
+        limit = min(len(scores), top_k * 4)
+        candidates = np.argpartition(-scores, limit - 1)[:limit] if limit < len(scores) else np.arange(len(scores))
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        results: Dict[str, float] = {}
+        for i in candidates:
+            if scores[i] <= 0 or len(results) >= top_k:
+                break
+            results.setdefault(self.keys[i], float(min(scores[i], 1.0)))
+        return list(results.items())
+
+    def save(self, directory: str):
+        """
+        保存为 .npy 矩阵和 JSON 键表
+        """
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "vectors.npy"), self.matrix)
+        with open(os.path.join(directory, "keys.json"), "w", encoding="utf-8") as f:
+            json.dump(self.keys, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str) -> "VectorIndex":
+        """
+        加载索引段，矩阵以内存映射方式打开
+        """
+        matrix = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "keys.json"), encoding="utf-8") as f:
+            keys = json.load(f)
+        return cls(keys, matrix)
+
+
+def search_vector_segments(segments: List[VectorIndex], query: str, top_k: int) -> List[Tuple[str, float]]:
+    """
+    在多个向量索引段中检索并合并结果
+
+    Returns:
+        [(笔记键, 相似度)]，按相似度降序
+    """
+    if not segments:
+        return []
+    query_vector = segments[0].vectorizer.presence(query)
+    results: List[Tuple[str, float]] = []
+    for segment in segments:
+        results.extend(segment.search(query_vector, top_k))
+    results.sort(key=lambda item: item[1], reverse=True)
+    return results[:top_k]
@@ -0,0 +1,142 @@
+import functools
+import hashlib
+import re
+import unicodedata
+from typing import Iterable, List
+import numpy as np
+
+# 需要保留的字符：中日韩汉字、字母和数字，其余（标点、空白）在切分时丢弃
+_TOKEN_PATTERN = re.compile(r"[一-鿿㐀-䶿]|[a-z0-9]+")
+
+# 疑问词、代词、助词等虚词，改写问题时经常增删替换，不影响问题的实际含义
+FUNCTION_CHARS = frozenset("如何怎样么用通过把被将的地得了吗呢吧啊呀哦请问我你您他她它们是在有和与及或能可以会要该应什哪为啥些个种下一这那就都还也")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    将文本切分为基本单元：每个汉字单独成词，连续的字母数字成词
+
+    Args:
+        text: 输入文本
+    Returns:
+        词列表
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _TOKEN_PATTERN.findall(text)
+
+
+def char_ngrams(text: str) -> List[str]:
+    """
+    生成单字和相邻二元组特征，适用于不做分词的中文检索
+    """
+    tokens = tokenize(text)
+    return tokens + [tokens[i] + tokens[i + 1] for i in range(len(tokens) - 1)]
+
+
+def content_ngrams(text: str) -> List[str]:
+    """
+    生成去掉虚词的单字和二元组特征（两个字都是虚词的二元组同样去掉），
+    用于衡量查询中的实词在文档中被覆盖的程度
+    """
+    tokens = tokenize(text)
+    grams = [token for token in tokens if token not in FUNCTION_CHARS]
+    grams += [a + b for a, b in zip(tokens, tokens[1:]) if a not in FUNCTION_CHARS or b not in FUNCTION_CHARS]
+    return grams
+
+
+@functools.lru_cache(maxsize=1 << 18)
+def feature_hash(feature: str) -> int:
+    """
+    特征的 64 位稳定哈希（不受 PYTHONHASHSEED 影响）
+    """
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _bucket(feature: str, dim: int) -> tuple:
+    """
+    计算特征的桶位和符号
+    """
+    value = feature_hash(feature)
+    return value % dim, 1.0 if (value >> 63) & 1 else -1.0
+
+
+def simhash(text: str) -> int:
+    """
+    计算文本的 64 位 SimHash 指纹，内容相近的文本指纹的汉明距离较小
+
+    Args:
+        text: 输入文本
+    Returns:
+        64 位整数指纹
+    """
+    features = set(char_ngrams(text))
+    if not features:
+        return 0
+    hashes = np.fromiter((feature_hash(feature) for feature in features), dtype=np.uint64, count=len(features))
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    weights = bits.sum(axis=0, dtype=np.int64) * 2 - len(features)
+    return int.from_bytes(np.packbits(weights > 0, bitorder="little").tobytes(), "little")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class HashingVectorizer:
+    """
+    基于特征哈希的轻量级文本向量化器
+    无需模型文件，纯 CPU 计算，输出 L2 归一化的向量，可直接用点积计算余弦相似度
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def embed(self, text: str) -> np.ndarray:
+        """
+        将单条文本转换为向量
+
+        Args:
+            text: 输入文本
+        Returns:
+            形状为 (dim,) 的 float32 向量
+        """
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in char_ngrams(text):
+            index, sign = _bucket(feature, self.dim)
+            vector[index] += sign
+        norm = float(np.linalg.norm(vector))
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def embed_many(self, texts: Iterable[str]) -> np.ndarray:
+        """
+        批量向量化
+
+        Returns:
+            形状为 (n, dim) 的 float32 矩阵
+        """
+        texts = list(texts)
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            matrix[i] = self.embed(text)
+        return matrix
+
+    def feature_buckets(self, text: str) -> List[tuple]:
+        """
+        返回文本中每个不同实词特征（content_ngrams）的 (桶位, 符号)
+        """
+        return [_bucket(feature, self.dim) for feature in set(content_ngrams(text))]
+
+    def presence(self, text: str) -> np.ndarray:
+        """
+        将文本的实词特征按出现与否哈希为带符号的 int8 向量
+        两个向量的点积约等于共有特征数，q·d / q·q 即查询特征在文档中的覆盖比例
+
+        Returns:
+            形状为 (dim,) 的 int8 向量
+        """
+        vector = np.zeros(self.dim, dtype=np.int16)
+        for index, sign in self.feature_buckets(text):
+            vector[index] += int(sign)
+        return np.clip(vector, -127, 127).astype(np.int8)
@@ -1,5 +1,13 @@
+import atexit
+import contextvars
+import hashlib
+import json
 import logging
 import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -7,40 +15,134 @@ load_dotenv()
 
 # 配置日志
 log_level = os.getenv('LOG_LEVEL', 'INFO')
-log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+log_format = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+
+# 当前请求 ID，由 src.utils.tracing.start_trace 设置，不在请求范围内时为 "-"
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    为每条日志附加当前请求 ID，便于按请求串联日志
+    """
+
+    def filter(self, record):
+        # 异步写入时已在调用线程中附加，后台线程中不再覆盖
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return True
+
+
+class LazyPayload:
+    """
+    延迟格式化的大对象
+    只有日志真正输出时才序列化；超过 max_chars 时截断，并附上总长度和哈希，便于比对同一响应
+    """
+
+    __slots__ = ("value", "max_chars")
+
+    def __init__(self, value: Any, max_chars: int = 1024):
+        self.value = value
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        if isinstance(self.value, str):
+            text = self.value
+        else:
+            text = json.dumps(self.value, ensure_ascii=False, default=str)
+        if len(text) <= self.max_chars:
+            return text
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+        return f"{text[:self.max_chars]}…（共 {len(text)} 字符，blake2b={digest}）"
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    只把日志记录放入队列的处理器
+    同一进程内的队列不需要序列化，消息格式化（包括 LazyPayload）推迟到后台线程完成
+    """
+
+    def prepare(self, record):
+        return record
+
 
 # 创建日志目录
 log_dir = 'logs'
 if not os.path.exists(log_dir):
     os.makedirs(log_dir)
 
-# 配置文件日志
-file_handler = logging.FileHandler(os.path.join(log_dir, 'app.log'), encoding='utf-8')
+# 配置文件日志，按大小轮转
+file_handler = RotatingFileHandler(
+    os.path.join(log_dir, 'app.log'),
+    maxBytes=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+    backupCount=int(os.getenv('LOG_BACKUP_COUNT', '5')),
+    encoding='utf-8'
+)
 file_handler.setLevel(log_level)
 file_handler.setFormatter(logging.Formatter(log_format))
+file_handler.addFilter(RequestIdFilter())
 
 # 配置控制台日志
 console_handler = logging.StreamHandler()
 console_handler.setLevel(log_level)
 console_handler.setFormatter(logging.Formatter(log_format))
+console_handler.addFilter(RequestIdFilter())
+
+# 默认由后台线程写文件和控制台，请求线程只负责入队；LOG_ASYNC=false 时同步写入
+if os.getenv('LOG_ASYNC', 'true').strip().lower() in ('1', 'true', 'yes', 'on'):
+    log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.setLevel(log_level)
+    queue_handler.addFilter(RequestIdFilter())
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    # 退出时写完队列中剩余的日志
+    atexit.register(listener.stop)
+    handlers = [queue_handler]
+else:
+    listener = None
+    handlers = [file_handler, console_handler]
+
+# 大对象日志的截断长度和以 INFO 级别输出的采样率
+payload_max_chars = int(os.getenv('LOG_PAYLOAD_MAX_CHARS', '1024'))
+payload_sample_rate = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '0'))
+
 
 # 创建日志记录器
 def get_logger(name):
     """
     获取日志记录器
-    
+
     Args:
         name: 日志记录器名称
-        
+
     Returns:
         日志记录器对象
     """
     logger = logging.getLogger(name)
     logger.setLevel(log_level)
-    
+
     # 避免重复添加处理器
     if not logger.handlers:
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
-    
+        for handler in handlers:
+            logger.addHandler(handler)
+
     return logger
+
+
+def log_payload(logger: logging.Logger, message: str, payload: Any, level: int = logging.DEBUG):
+    """
+    记录 API 响应等大对象
+    默认以 DEBUG 级别记录，INFO 级别下不做任何格式化；按 LOG_PAYLOAD_SAMPLE_RATE 抽样以 INFO 级别输出。
+    输出时截断到 LOG_PAYLOAD_MAX_CHARS 个字符
+
+    Args:
+        logger: 日志记录器
+        message: 消息前缀
+        payload: 要记录的对象
+        level: 未被抽中时使用的日志级别
+    """
+    if payload_sample_rate and random.random() < payload_sample_rate:
+        level = max(level, logging.INFO)
+    if logger.isEnabledFor(level):
+        logger.log(level, "%s%s", message, LazyPayload(payload, payload_max_chars))
@@ -0,0 +1,92 @@
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+from src.utils.logger import get_logger
+
+# 初始化日志
+logger = get_logger(__name__)
+
+# 资源名 -> (环境变量指纹, 资源对象)
+_registry: Dict[str, tuple] = {}
+_lock = threading.RLock()
+
+
+def _fingerprint(env_keys: Iterable[str]) -> tuple:
+    return tuple(os.getenv(key) for key in env_keys)
+
+
+def _close(name: str, resource: Any):
+    """
+    释放被替换或失效的资源（如果它提供 close 方法）
+    """
+    close = getattr(resource, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception as e:
+            logger.warning(f"关闭资源 {name} 时发生错误：{e}")
+
+
+def _retire(name: str, resource: Any):
+    """
+    延迟关闭被替换或失效的资源
+    其他线程可能仍在使用旧对象（如正在流式生成的 HTTP 客户端、正在检索的 SQLite 连接），
+    因此等待 RESOURCE_CLOSE_GRACE 秒（默认 60）后再关闭，为 0 时立即关闭
+    """
+    if not callable(getattr(resource, "close", None)):
+        return
+    grace = float(os.getenv("RESOURCE_CLOSE_GRACE", "60"))
+    if grace <= 0:
+        _close(name, resource)
+        return
+    timer = threading.Timer(grace, _close, args=(name, resource))
+    timer.daemon = True
+    timer.start()
+
+
+def get_resource(name: str, factory: Callable[[], Any], env_keys: Iterable[str] = ()) -> Any:
+    """
+    获取进程级共享的资源对象
+    同一进程内的所有 Streamlit 会话和重跑都复用同一个对象；
+    env_keys 中任一环境变量发生变化时重新创建，旧对象在宽限期后关闭（见 _retire）
+
+    Args:
+        name: 资源名称
+        factory: 创建资源的无参函数
+        env_keys: 影响资源配置的环境变量名
+    Returns:
+        资源对象
+    """
+    env_keys = tuple(env_keys)
+    fingerprint = _fingerprint(env_keys)
+    entry = _registry.get(name)
+    if entry is not None and entry[0] == fingerprint:
+        return entry[1]
+
+    with _lock:
+        entry = _registry.get(name)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+        resource = factory()
+        _registry[name] = (fingerprint, resource)
+        if entry is not None:
+            logger.info(f"配置已变化，重新创建资源：{name}")
+            _retire(name, entry[1])
+        else:
+            logger.info(f"已创建共享资源：{name}")
+        return resource
+
+
+def invalidate(name: Optional[str] = None):
+    """
+    使资源失效，下次获取时重新创建，旧对象在宽限期后关闭
+
+    Args:
+        name: 资源名称，为空时使所有资源失效
+    """
+    with _lock:
+        names = [name] if name is not None else list(_registry)
+        for key in names:
+            entry = _registry.pop(key, None)
+            if entry is not None:
+                _retire(key, entry[1])
@@ -0,0 +1,49 @@
+import os
+import re
+from functools import lru_cache
+from typing import Any, Optional
+from src.utils.logger import get_logger
+
+# 初始化日志
+logger = get_logger(__name__)
+
+# 中日韩字符基本各占一个 token；其余按单词/标点切分
+_CJK = r"぀-ヿ㐀-䶿一-鿿가-힯豈-﫿"
+_TOKEN_PATTERN = re.compile(rf"[{_CJK}]|[^\W{_CJK}]+|[^\s\w]")
+
+
+@lru_cache(maxsize=4)
+def _load_encoding(name: str) -> Optional[Any]:
+    """
+    加载 tiktoken 编码，未安装或无法下载词表时返回 None（只尝试一次）
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(f"无法加载分词器 {name}，改用估算的 token 数：{e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    统计文本的 token 数
+    设置 TOKENIZER_ENCODING（如 cl100k_base）且安装了 tiktoken 时精确计数，
+    否则按中日韩字符每字一个 token、其他单词每 4 个字符一个 token 估算（对中文略偏高，用于预算时更安全）
+
+    Args:
+        text: 文本
+    Returns:
+        token 数
+    """
+    if not text:
+        return 0
+    encoding_name = os.getenv("TOKENIZER_ENCODING", "").strip()
+    encoding = _load_encoding(encoding_name) if encoding_name else None
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    count = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        piece = match.group()
+        count += (len(piece) + 3) // 4 if piece[0].isalnum() and len(piece) > 1 else 1
+    return count
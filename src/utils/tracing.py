@@ -0,0 +1,350 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from src.utils.logger import get_logger, request_id_var
+from src.utils.resources import get_resource
+
+# 初始化日志
+logger = get_logger(__name__)
+
+# 当前请求的追踪对象，随 contextvars 在调用链中传递
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+
+# 耗时直方图的分桶（秒），覆盖毫秒级缓存命中到两分钟的深度检索
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class MetricsRegistry:
+    """
+    进程内指标
+    支持计数器和直方图，可渲染为 Prometheus 文本格式
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help: Dict[str, str] = {}
+        self._counters: Dict[str, Dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+        # 直方图：名称 -> 标签 -> [各桶计数..., 总和, 总数]
+        self._histograms: Dict[str, Dict[tuple, List[float]]] = defaultdict(dict)
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._counters[name][key] += value
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms[name].get(key)
+            if series is None:
+                series = self._histograms[name][key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(tuple(sorted(labels.items())), 0.0)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """
+        渲染为 Prometheus 文本格式
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                self._header(lines, name, "counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+            for name, series in sorted(self._histograms.items()):
+                self._header(lines, name, "histogram")
+                for labels, values in sorted(series.items()):
+                    for bound, count in zip(self.buckets, values):
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {_number(count)}")
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {_number(values[-1])}")
+                    lines.append(f"{name}_sum{_labels(labels)} {values[-2]:.6f}")
+                    lines.append(f"{name}_count{_labels(labels)} {_number(values[-1])}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: List[str], name: str, kind: str):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# 进程级指标
+metrics = MetricsRegistry()
+metrics.describe("rag_requests_total", "问答请求数")
+metrics.describe("rag_request_duration_seconds", "问答请求总耗时")
+metrics.describe("rag_span_duration_seconds", "各阶段耗时")
+metrics.describe("rag_tokens_total", "提示与回答的 token 数，以及上下文裁剪节省的 token 数")
+metrics.describe("getnote_breaker_events_total", "Get笔记 API 熔断器事件数")
+metrics.describe("rag_rate_limit_wait_seconds", "按优先级通道统计的限流排队等待时间")
+metrics.describe("rag_rate_limited_total", "限流排队超时和服务端 429 次数")
+metrics.describe("rag_coalesced_total", "合并到其他在途请求的调用次数")
+metrics.describe("rag_search_mode_seconds", "按接口模式（fast/deep）统计的知识库检索耗时")
+metrics.describe("rag_search_mode_total", "按接口模式和结果（ok/empty/low_confidence）统计的知识库检索次数")
+metrics.describe("rag_search_escalations_total", "balanced 模式从快速检索升级为深度检索的次数")
+metrics.describe("rag_answer_gate_total", "按判定结果（direct/llm）和原因统计的回答次数")
+metrics.describe("rag_llm_saved_seconds_total", "直接使用 Get笔记 AI 综合回答估算节省的 LLM 生成时间")
+metrics.describe("rag_answer_cache_total", "按结果（hit/miss）统计的回答缓存查找次数")
+
+
+class Trace:
+    """
+    单个问答请求的追踪记录
+    """
+
+    def __init__(self, request_id: Optional[str] = None, name: str = "qa", **attrs):
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs: Dict[str, Any] = dict(attrs)
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.status = "ok"
+        self.spans: List[Dict[str, Any]] = []
+        self.tokens: Dict[str, int] = defaultdict(int)
+        # 检索阶段在线程池中执行，多个线程会同时写入
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, duration: float, attrs: Optional[Dict[str, Any]] = None):
+        span = {"name": name, "start": round(start - self._start, 6), "duration": round(duration, 6)}
+        if attrs:
+            span["attrs"] = attrs
+        with self._lock:
+            self.spans.append(span)
+
+    def add_tokens(self, kind: str, count: int):
+        with self._lock:
+            self.tokens[kind] += count
+
+    def finish(self, status: str = "ok"):
+        self.status = status
+        self.duration = time.perf_counter() - self._start
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "request_id": self.request_id,
+                "name": self.name,
+                "start_time": self.start_time,
+                "duration": round(self.duration, 6) if self.duration is not None else None,
+                "status": self.status,
+                "attrs": self.attrs,
+                "tokens": dict(self.tokens),
+                "spans": sorted(self.spans, key=lambda span: span["start"]),
+            }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def get_request_id() -> Optional[str]:
+    """
+    当前请求的 ID，不在追踪范围内时返回 None
+    """
+    trace = _current_trace.get()
+    return trace.request_id if trace is not None else None
+
+
+_export_lock = threading.Lock()
+
+
+def export_trace(trace: Trace):
+    """
+    以 JSON lines 格式追加到 TRACE_EXPORT_PATH（默认 logs/traces.jsonl），设为空字符串时不导出
+    """
+    path = os.getenv("TRACE_EXPORT_PATH", os.path.join("logs", "traces.jsonl"))
+    if not path:
+        return
+    line = json.dumps(trace.to_dict(), ensure_ascii=False)
+    try:
+        with _export_lock:
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except OSError as e:
+        logger.warning(f"导出追踪记录失败：{e}")
+
+
+@contextmanager
+def start_trace(request_id: Optional[str] = None, name: str = "qa", **attrs) -> Iterator[Trace]:
+    """
+    开始追踪一个请求
+    范围内（包括通过 bind_context 提交到线程池的任务）的 span、token 数和日志都会带上同一个请求 ID，
+    结束时导出为 JSON lines 并更新请求指标
+
+    Args:
+        request_id: 请求 ID，默认随机生成
+        name: 请求类型
+        attrs: 附加属性
+    Yields:
+        追踪对象
+    """
+    trace = Trace(request_id, name, **attrs)
+    trace_token = _current_trace.set(trace)
+    request_id_token = request_id_var.set(trace.request_id)
+    status = "ok"
+    try:
+        yield trace
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _current_trace.reset(trace_token)
+        request_id_var.reset(request_id_token)
+        trace.finish(status)
+        metrics.inc("rag_requests_total", request=name, status=status)
+        metrics.observe("rag_request_duration_seconds", trace.duration, request=name)
+        if os.getenv("TRACING_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on"):
+            export_trace(trace)
+
+
+def record_span(name: str, duration: float, start: Optional[float] = None, **attrs):
+    """
+    记录一个已经结束的阶段
+
+    Args:
+        name: 阶段名称
+        duration: 耗时（秒）
+        start: 开始时间（perf_counter），默认按当前时间减去耗时
+        attrs: 附加属性
+    """
+    metrics.observe("rag_span_duration_seconds", duration, span=name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, start if start is not None else time.perf_counter() - duration, duration, attrs)
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Dict[str, Any]]:
+    """
+    记录一个阶段的耗时
+
+    Args:
+        name: 阶段名称，如 getnote.request、llm.call
+        attrs: 附加属性，可在范围内继续向返回的字典中添加
+    Yields:
+        属性字典
+    """
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        record_span(name, time.perf_counter() - start, start, **attrs)
+
+
+def record_tokens(kind: str, count: int):
+    """
+    记录 token 数
+
+    Args:
+        kind: prompt、completion 或 context_saved（上下文裁剪节省的 token 数）
+        count: token 数
+    """
+    metrics.inc("rag_tokens_total", count, kind=kind)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_tokens(kind, count)
+
+
+def bind_context(fn: Callable) -> Callable:
+    """
+    让提交到线程池的函数在当前上下文（请求 ID、追踪对象）中执行
+    每次调用使用上下文的副本，同一个函数可以在多个线程中同时执行（如对冲请求）
+    """
+    context = contextvars.copy_context()
+
+    def bound(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return bound
+
+
+class MetricsServer:
+    """
+    在后台线程中提供 Prometheus 文本格式的 /metrics 接口
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9464, registry: MetricsRegistry = metrics):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        logger.info(f"指标接口已启动：http://{host}:{self.port}/metrics")
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_metrics_server() -> Optional[MetricsServer]:
+    """
+    按 METRICS_PORT / METRICS_HOST 启动进程级共享的指标接口，未设置 METRICS_PORT 时不启动
+    """
+    def create() -> Optional[MetricsServer]:
+        port = os.getenv("METRICS_PORT", "").strip()
+        if not port:
+            return None
+        try:
+            return MetricsServer(os.getenv("METRICS_HOST", "127.0.0.1"), int(port))
+        except OSError as e:
+            # 多个进程共用同一端口时只有一个能启动成功
+            logger.warning(f"指标接口启动失败：{e}")
+            return None
+    return get_resource("metrics_server", create, ("METRICS_PORT", "METRICS_HOST"))
@@ -0,0 +1,260 @@
+import bisect
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+
+def make_search_response(answer: str = "这是一个测试回答", refs: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    构造与 Get 笔记 knowledge/search 接口格式一致的响应体
+    """
+    if refs is None:
+        refs = [{"title": "测试笔记1", "content": "测试内容1"}]
+    return {"h": {"c": 0, "e": ""}, "c": {"answers": answer, "refs": refs}}
+
+
+class SyntheticNotes:
+    """
+    合成笔记库，模拟 knowledge/notes 分页列表接口
+
+    笔记按 (updated_at, id) 排序分页，游标为上一页最后一条的排序键；
+    支持 updated_after 过滤，删除的笔记以 deleted=true 保留，便于测试增量同步。
+    """
+
+    def __init__(self, count: int = 0, seed: int = 0, words: int = 12):
+        self._rng = random.Random(seed)
+        # 由常用汉字随机组合出的词表，每篇笔记由若干个词拼成
+        chars = [chr(code) for code in range(0x4E00, 0x4E00 + 3000)]
+        self.vocabulary = ["".join(self._rng.sample(chars, 2)) for _ in range(2000)]
+        self.words = words
+        self.notes: Dict[str, Dict[str, Any]] = {}
+        self.clock = 1_700_000_000.0
+        self._order: Optional[List[tuple]] = None
+        self._lock = threading.Lock()
+        for i in range(count):
+            self.add(f"n{i:06d}")
+
+    def _tick(self) -> float:
+        self.clock += 1.0
+        return self.clock
+
+    def add(self, note_id: str, title: Optional[str] = None, content: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            words = self._rng.choices(self.vocabulary, k=self.words)
+            note = {
+                "id": note_id,
+                "title": title if title is not None else "".join(words[:2]),
+                "content": content if content is not None else "，".join(words[2:]),
+                "updated_at": self._tick(),
+                "deleted": False,
+            }
+            self.notes[note_id] = note
+            self._order = None
+            return note
+
+    def update(self, note_id: str, **fields):
+        with self._lock:
+            self.notes[note_id].update(fields, updated_at=self._tick())
+            self._order = None
+
+    def delete(self, note_id: str):
+        self.update(note_id, deleted=True)
+
+    def page(self, updated_after: Optional[float], cursor: Optional[str], limit: int) -> Dict[str, Any]:
+        with self._lock:
+            if self._order is None:
+                self._order = sorted((note["updated_at"], note_id) for note_id, note in self.notes.items())
+            order = self._order
+            if cursor:
+                updated_at, note_id = cursor.split("|", 1)
+                start = bisect.bisect_right(order, (float(updated_at), note_id))
+            elif updated_after is not None:
+                start = bisect.bisect_left(order, (updated_after, ""))
+            else:
+                start = 0
+            keys = order[start:start + limit]
+            has_more = start + limit < len(order)
+            return {
+                "notes": [dict(self.notes[note_id]) for _, note_id in keys],
+                "next_cursor": f"{keys[-1][0]}|{keys[-1][1]}" if keys and has_more else None,
+                "has_more": has_more,
+            }
+
+    def handler(self, request_handler, body: bytes):
+        """
+        StubServer 路由处理函数：GET /getnote/openapi/knowledge/notes
+        """
+        params = {key: values[0] for key, values in parse_qs(urlsplit(request_handler.path).query).items()}
+        updated_after = float(params["updated_after"]) if "updated_after" in params else None
+        page = self.page(updated_after, params.get("cursor"), int(params.get("limit", 500)))
+        return 200, {"h": {"c": 0, "e": ""}, "c": page}, {}, 0.0
+
+
+class FakeChatCompletions:
+    """
+    模拟 OpenAI 兼容的 /chat/completions 接口
+
+    按请求中的 stream 参数返回普通 JSON 或 SSE 流，记录每次请求的消息和请求体字节数，
+    便于统计每轮发送的提示字节数以及与之前请求相同的前缀长度。
+    """
+
+    def __init__(self, answer: str = "这是一个测试回答[笔记1]"):
+        self.answer = answer
+        self.requests: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def handler(self, request_handler, body: bytes):
+        """
+        StubServer 路由处理函数：POST /v1/chat/completions
+        """
+        payload = json.loads(body or b"{}")
+        with self._lock:
+            self.requests.append({"messages": payload.get("messages", []), "bytes": len(body)})
+        model = payload.get("model", "fake")
+        if not payload.get("stream"):
+            message = {"role": "assistant", "content": self.answer}
+            return 200, {"id": "fake", "object": "chat.completion", "created": 0, "model": model,
+                         "choices": [{"index": 0, "message": message, "finish_reason": "stop"}]}, {}, 0.0
+        events = []
+        for i, piece in enumerate([self.answer[:len(self.answer) // 2], self.answer[len(self.answer) // 2:], None]):
+            delta = {"content": piece} if piece is not None else {}
+            chunk = {"id": "fake", "object": "chat.completion.chunk", "created": 0, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": None if piece is not None else "stop"}]}
+            events.append(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+        events.append("data: [DONE]\n\n")
+        return 200, "".join(events), {"Content-Type": "text/event-stream"}, 0.0
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """
+    桩服务请求处理器，行为由所属的 StubServer 决定
+    """
+    protocol_version = "HTTP/1.1"
+    # 关闭 Nagle 算法，避免长连接下响应头与响应体分包触发延迟确认
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.stub.connections += 1
+
+    def log_message(self, format, *args):
+        # 保持测试输出干净
+        pass
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        elif isinstance(body, str):
+            body = body.encode("utf-8")
+        headers = {"Content-Type": "application/json; charset=utf-8", **(headers or {})}
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def _dispatch(self, method: str):
+        stub = self.server.stub
+        body = self._read_body()
+        stub.record(method, self.path, self.headers, body)
+        route = stub.route_for(method, self.path)
+        if route is None:
+            self._send(404, {"error": "not found"})
+            return
+        status, payload, headers, delay = route(self, body)
+        if delay:
+            time.sleep(delay)
+        self._send(status, payload, headers)
+
+
+class StubServer:
+    """
+    本地 Get 笔记 API 桩服务
+
+    用于在没有真实 API 的环境下进行测试和基准测试。
+    默认在 /getnote/openapi/knowledge/search 返回固定回答，
+    可通过 enqueue 注入一次性的慢响应或错误响应，通过 add_route 添加其他接口。
+    """
+
+    def __init__(self, response: Optional[Dict[str, Any]] = None, delay: float = 0.0):
+        self.response = response if response is not None else make_search_response()
+        self.delay = delay
+        self.connections = 0
+        self.requests: List[Dict[str, Any]] = []
+        self._queue: List[tuple] = []
+        self._routes: Dict[tuple, Callable] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread: Optional[threading.Thread] = None
+        self.add_route("POST", "/getnote/openapi/knowledge/search", self._search)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/getnote/openapi"
+
+    @property
+    def root_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add_route(self, method: str, path: str, handler: Callable):
+        """
+        注册接口处理函数，handler(request_handler, body) -> (status, payload, headers, delay)
+        """
+        self._routes[(method, path)] = handler
+
+    def route_for(self, method: str, path: str) -> Optional[Callable]:
+        return self._routes.get((method, path.split("?", 1)[0]))
+
+    def enqueue(self, status: int = 200, body: Any = None, delay: float = 0.0, headers: Optional[Dict[str, str]] = None):
+        """
+        注入一次性响应，按先进先出顺序被后续的搜索请求消费
+        """
+        with self._lock:
+            self._queue.append((status, body if body is not None else self.response, headers or {}, delay))
+
+    def record(self, method: str, path: str, headers, body: bytes):
+        with self._lock:
+            self.requests.append({"method": method, "path": path, "headers": dict(headers), "body": body})
+
+    def _search(self, handler, body: bytes):
+        with self._lock:
+            if self._queue:
+                return self._queue.pop(0)
+        return 200, self.response, {}, self.delay
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
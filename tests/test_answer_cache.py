@@ -0,0 +1,138 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from src.api.models import Reference
+from src.cache.answer_cache import get_answer_cache, make_answer_key
+from src.cache.query_cache import create_query_cache
+from src.utils.resources import invalidate
+from src.utils.tracing import metrics
+
+QUESTION = "高血压患者能喝咖啡吗？"
+NOTES = [{"title": "咖啡与血压", "content": "咖啡因会使血压短暂升高，高血压患者每天不宜超过一杯。"}]
+
+
+class TestAnswerKey(unittest.TestCase):
+    """
+    测试回答缓存键的组成
+    """
+
+    def key(self, query=QUESTION, context="上下文", history="", model="model-a", version="v1"):
+        return make_answer_key(query, context, history, model, version)
+
+    def test_normalized_query(self):
+        self.assertEqual(self.key(), self.key(query="  高血压患者能喝咖啡吗？ "))
+
+    def test_key_changes(self):
+        base = self.key()
+        for changed in (self.key(context="另一段上下文"), self.key(history="用户: 我有糖尿病\n"),
+                        self.key(model="model-b"), self.key(version="v2")):
+            self.assertNotEqual(base, changed)
+
+
+class TestAnswerCacheBackends(unittest.TestCase):
+    """
+    测试回答缓存的持久化和容量上限
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "answers.sqlite3")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def create(self, backend, max_bytes=4096):
+        return create_query_cache(backend, 60, max_bytes, self.path, "", label="回答缓存")
+
+    def test_from_env(self):
+        invalidate("answer_cache")
+        self.addCleanup(invalidate, "answer_cache")
+        with patch.dict(os.environ):
+            os.environ.pop("ANSWER_CACHE_BACKEND", None)
+            # 默认关闭
+            self.assertIsNone(get_answer_cache())
+        with patch.dict(os.environ, {"ANSWER_CACHE_BACKEND": "sqlite", "ANSWER_CACHE_PATH": self.path}):
+            cache = get_answer_cache()
+            self.assertEqual((cache.label, cache.ttl), ("回答缓存", 86400))
+            cache.close()
+        with self.assertRaises(ValueError):
+            self.create("disk")
+
+    def test_sqlite_persists_and_evicts(self):
+        cache = self.create("sqlite")
+        cache.set("a", {"answer": "回答", "references": []})
+        cache.backend.close()
+        # 重新打开后仍然命中
+        cache = self.create("sqlite")
+        self.assertEqual(cache.get("a")["answer"], "回答")
+        for i in range(20):
+            cache.set(f"k{i}", {"answer": "长回答" * 100, "references": []})
+        self.assertIsNone(cache.get("a"))
+        cache.backend.close()
+
+
+class TestGeneratorAnswerCache(unittest.TestCase):
+    """
+    测试 AnswerGenerator 命中回答缓存时跳过 LLM
+    """
+
+    def setUp(self):
+        self.env = patch.dict(os.environ, {"SILICONFLOW_API_KEY": "test-key", "SEMANTIC_CACHE_ENABLED": "false",
+                                           "SINGLE_FLIGHT_ENABLED": "false", "ANSWER_CACHE_BACKEND": "memory"})
+        self.env.start()
+        self.llm = FakeListChatModel(responses=["少量饮用一般没有问题[笔记1]", "第二个回答"])
+        patcher = patch("src.generation.generator.ChatOpenAI", return_value=self.llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        from src.generation.generator import AnswerGenerator
+        # 每个测试使用新的内存缓存
+        invalidate("answer_cache")
+        self.addCleanup(invalidate, "answer_cache")
+        self.generator = AnswerGenerator()
+
+    def tearDown(self):
+        self.generator.close()
+        self.env.stop()
+
+    def test_hit_skips_llm(self):
+        first = self.generator.generate(QUESTION, NOTES)
+        before = metrics.counter_value("rag_answer_cache_total", result="hit")
+        with patch.object(self.generator, "chain") as chain:
+            second = self.generator.generate(QUESTION + " ", NOTES)
+            streamed = list(self.generator.generate_stream(QUESTION, NOTES))
+        chain.invoke.assert_not_called()
+        chain.stream.assert_not_called()
+        self.assertEqual(second["answer"], first["answer"])
+        self.assertEqual((second["answered_by"], second["degraded"]), ("cache", False))
+        self.assertIsInstance(second["references"][0], Reference)
+        self.assertEqual(second["references"][0]["title"], "咖啡与血压")
+        self.assertEqual(streamed, [first["answer"], second])
+        self.assertEqual(metrics.counter_value("rag_answer_cache_total", result="hit"), before + 2)
+
+    def test_changed_context_or_template_misses(self):
+        self.generator.generate(QUESTION, NOTES)
+        other = self.generator.generate(QUESTION, [dict(NOTES[0], content="咖啡对血压的影响因人而异。")])
+        self.assertEqual(other["answer"], "第二个回答")
+        self.generator.layout.version = "changed"
+        with patch.object(self.generator, "chain") as chain:
+            chain.invoke.return_value = "新模板的回答"
+            self.assertEqual(self.generator.generate(QUESTION, NOTES)["answer"], "新模板的回答")
+
+    def test_store_uses_looked_up_cache(self):
+        cache = get_answer_cache()
+
+        def invoke(inputs):
+            # 生成期间关闭回答缓存
+            os.environ["ANSWER_CACHE_BACKEND"] = "none"
+            return "生成期间配置变化"
+
+        with patch.object(self.generator, "chain") as chain:
+            chain.invoke.side_effect = invoke
+            self.assertEqual(self.generator.generate(QUESTION, NOTES)["answer"], "生成期间配置变化")
+        self.assertEqual(len(cache.backend), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
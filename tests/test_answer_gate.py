@@ -0,0 +1,104 @@
+import os
+import unittest
+from unittest.mock import patch
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from src.api.get_api import normalize_search_result
+from src.generation.answer_gate import AnswerGate, format_direct_answer
+from src.utils.tracing import metrics
+
+QUESTION = "如何通过饮食改善高血压？"
+ANSWER = ("通过饮食改善高血压，可以从以下几方面入手：1. 减少盐的摄入，每天不超过5克；2. 多吃新鲜蔬菜水果补充钾；"
+          "3. 参考DASH饮食，选择全谷物和低脂奶制品；4. 限制饮酒并控制体重。")
+REFS = [
+    {"title": "高血压饮食笔记", "content": "高血压患者应减少盐的摄入，每天不超过5克；多吃新鲜蔬菜水果，补充钾；限制饮酒，控制体重。"},
+    {"title": "DASH饮食", "content": "DASH饮食强调全谷物、低脂奶制品、蔬菜水果，有助于降低血压。"},
+]
+
+
+def search_result(answer=ANSWER, refs=REFS):
+    return normalize_search_result({"c": {"answers": answer, "refs": refs}})
+
+
+class TestAnswerGate(unittest.TestCase):
+    """
+    测试 Get 笔记 AI 综合回答是否足够的判定规则
+    """
+
+    def setUp(self):
+        self.gate = AnswerGate()
+
+    def reason(self, notes, question=QUESTION, history=""):
+        return self.gate.decide(question, notes, history).reason
+
+    def test_sufficient(self):
+        decision = self.gate.decide(QUESTION, search_result())
+        self.assertTrue(decision.serve)
+        self.assertEqual(decision.scores["refs"], 2)
+
+    def test_insufficient(self):
+        self.assertEqual(self.reason(search_result(), history="用户: 我有糖尿病\n"), "history")
+        self.assertEqual(self.reason(search_result(refs=[])), "few_refs")
+        self.assertEqual(self.reason(search_result(answer="少吃盐。")), "too_short")
+        self.assertEqual(self.reason(search_result(answer="抱歉，知识库中没有找到与该问题相关的内容，建议换一种问法或补充关键词后再试。")),
+                         "refusal")
+        self.assertEqual(self.reason(search_result(), question="高血压患者能喝咖啡吗"), "off_topic")
+        unrelated = "糖尿病患者需要定期监测血糖，按医嘱使用胰岛素，并保持规律运动和合理作息，避免低血糖发生。如何通过饮食改善高血压"
+        self.assertEqual(self.reason(search_result(answer=unrelated)), "ungrounded")
+        self.assertEqual(self.reason([{"title": "笔记", "content": "内容"}]), "no_answer")
+        self.assertEqual(AnswerGate(enabled=False).decide(QUESTION, search_result()).reason, "disabled")
+
+    def test_format_direct_answer(self):
+        text = format_direct_answer(ANSWER, search_result())
+        self.assertTrue(text.startswith(ANSWER))
+        self.assertIn("[笔记2]高血压饮食笔记、[笔记3]DASH饮食", text)
+
+
+class TestGeneratorSkipsLLM(unittest.TestCase):
+    """
+    测试 AnswerGenerator 在综合回答足够时跳过 LLM
+    """
+
+    def setUp(self):
+        self.env = patch.dict(os.environ, {"SILICONFLOW_API_KEY": "test-key", "SEMANTIC_CACHE_ENABLED": "false",
+                                           "SINGLE_FLIGHT_ENABLED": "false"})
+        self.env.start()
+        self.llm = FakeListChatModel(responses=["LLM 回答[笔记2]"])
+        patcher = patch("src.generation.generator.ChatOpenAI", return_value=self.llm)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        from src.generation.generator import AnswerGenerator
+        self.generator = AnswerGenerator()
+
+    def tearDown(self):
+        self.generator.close()
+        self.env.stop()
+
+    def test_direct_answer_after_llm(self):
+        notes = search_result()
+        # 追问需要结合历史对话，仍然调用 LLM
+        first = self.generator.generate(QUESTION, notes, history="用户: 我有糖尿病\n")
+        self.assertEqual((first["answer"], first["answered_by"]), ("LLM 回答[笔记2]", "llm"))
+
+        before = metrics.counter_value("rag_answer_gate_total", decision="direct", reason="sufficient")
+        with patch.object(self.generator, "chain") as chain:
+            second = self.generator.generate(QUESTION, notes)
+        chain.invoke.assert_not_called()
+        self.assertEqual(second["answered_by"], "getnote")
+        self.assertTrue(second["answer"].startswith(ANSWER))
+        self.assertEqual([reference["reference_id"] for reference in second["references"]], ["笔记1", "笔记2", "笔记3"])
+        self.assertEqual(metrics.counter_value("rag_answer_gate_total", decision="direct", reason="sufficient"),
+                         before + 1)
+        stats = self.generator.gate.snapshot()
+        self.assertEqual((stats["direct"], stats["llm"], stats["skip_rate"]), (1, 1, 0.5))
+        # 节省的时间按之前 LLM 生成的耗时估算
+        self.assertGreater(stats["saved_seconds"], 0)
+
+    def test_stream(self):
+        items = list(self.generator.generate_stream(QUESTION, search_result()))
+        self.assertEqual(len(items), 2)
+        self.assertEqual(items[0], items[1]["answer"])
+        self.assertEqual(items[1]["answered_by"], "getnote")
+
+
+if __name__ == '__main__':
+    unittest.main()
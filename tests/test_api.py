@@ -1,6 +1,13 @@
+import asyncio
+import json
+import os
 import unittest
 from unittest.mock import Mock, patch
-from src.api.get_api import GetNoteAPI
+import httpx
+from src.api.get_api import AsyncGetNoteAPI, GetNoteAPI, build_session
+from tests.stub_server import StubServer
+
+TEST_ENV = {"API_KEY": "test-key", "KB_ID": "test-kb", "QUERY_CACHE_BACKEND": "none"}
 
 class TestGetNoteAPI(unittest.TestCase):
     """
@@ -86,5 +93,179 @@ class TestGetNoteAPI(unittest.TestCase):
         self.assertEqual(result['id'], '1')
         self.assertEqual(result['title'], '测试笔记')
 
+
+class TestGetNoteAPISession(unittest.TestCase):
+    """
+    测试共享连接池会话
+    """
+
+    def setUp(self):
+        self.server = StubServer().start()
+        self.env = patch.dict(os.environ, dict(TEST_ENV, GETNOTE_BASE_URL=self.server.base_url))
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.server.stop()
+
+    def test_session_reuses_connection(self):
+        """
+        测试多次搜索复用同一条长连接
+        """
+        api = GetNoteAPI(session=build_session())
+        for _ in range(5):
+            result = api.search_notes('测试查询')
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(result[0]['content'], '这是一个测试回答')
+        self.assertEqual(result[1]['title'], '测试笔记1')
+
+    def test_keep_alive_disabled(self):
+        """
+        测试关闭长连接后每次请求新建连接
+        """
+        with patch.dict(os.environ, {"GETNOTE_KEEP_ALIVE": "false"}):
+            api = GetNoteAPI(session=build_session())
+        for _ in range(3):
+            api.search_notes('测试查询')
+        self.assertEqual(self.server.connections, 3)
+
+    def test_split_timeouts(self):
+        """
+        测试连接超时与读取超时分别从环境变量读取
+        """
+        with patch.dict(os.environ, {"GETNOTE_CONNECT_TIMEOUT": "2", "GETNOTE_READ_TIMEOUT": "30"}):
+            api = GetNoteAPI(session=Mock())
+        api.session.post.return_value.json.return_value = {}
+        api.search_notes('测试查询')
+        self.assertEqual(api.session.post.call_args.kwargs['timeout'], (2.0, 30.0))
+
+class TestAsyncGetNoteAPI(unittest.IsolatedAsyncioTestCase):
+    """
+    测试异步 Get 笔记 API 连接模块
+    """
+
+    def setUp(self):
+        self.env = patch.dict(os.environ, TEST_ENV)
+        self.env.start()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.delay = 0.0
+
+    def tearDown(self):
+        self.env.stop()
+
+    async def _handler(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        payload = json.loads(request.content)
+        return httpx.Response(200, json={
+            'c': {'answers': f"回答：{payload['question']}", 'refs': [{'title': '测试笔记1', 'content': '测试内容1'}]}
+        })
+
+    def _api(self, max_concurrency=10):
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self._handler))
+        return AsyncGetNoteAPI(client=client, max_concurrency=max_concurrency)
+
+    async def test_search_notes_same_normalization(self):
+        """
+        测试异步客户端与同步客户端的响应解析一致
+        """
+        api = self._api()
+        result = await api.search_notes('测试查询')
+        self.assertEqual(result[0]['title'], 'AI 综合回答')
+        self.assertEqual(result[0]['content'], '回答：测试查询')
+        self.assertEqual(result[1]['source'], '原始笔记片段')
+
+    async def test_concurrency_limit(self):
+        """
+        测试信号量限制同时在途的请求数
+        """
+        self.delay = 0.01
+        api = self._api(max_concurrency=5)
+        results = await asyncio.gather(*(api.search_notes(f'查询{i}') for i in range(50)))
+        self.assertEqual(len(results), 50)
+        self.assertEqual(self.max_in_flight, 5)
+
+    async def test_deadline(self):
+        """
+        测试超过截止时间时抛出 RuntimeError
+        """
+        self.delay = 1.0
+        api = self._api()
+        with self.assertRaises(RuntimeError) as context:
+            await api.search_notes('测试查询', deadline=0.05)
+        self.assertIn('截止时间', str(context.exception))
+
+    async def test_cancellation_releases_slot(self):
+        """
+        测试取消请求后并发名额被释放
+        """
+        self.delay = 1.0
+        api = self._api(max_concurrency=1)
+        task = asyncio.ensure_future(api.search_notes('测试查询'))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.delay = 0.0
+        result = await api.search_notes('测试查询', deadline=1.0)
+        self.assertEqual(len(result), 2)
+
+class TestAsyncClientPerLoop(unittest.TestCase):
+    """
+    测试异步客户端按事件循环复用并在事件循环结束时关闭
+    """
+
+    def setUp(self):
+        self.env = patch.dict(os.environ, TEST_ENV)
+        self.env.start()
+        self.clients = []
+
+    def tearDown(self):
+        self.env.stop()
+
+    def _create_client(self):
+        handler = lambda request: httpx.Response(200, json={'c': {'answers': '回答', 'refs': []}})
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        self.clients.append(client)
+        return client
+
+    def test_client_closed_with_loop(self):
+        api = AsyncGetNoteAPI()
+        api._create_client = self._create_client
+
+        async def run():
+            await api.search_notes('查询1')
+            await api.search_notes('查询2')
+            self.assertFalse(self.clients[-1].is_closed)
+
+        asyncio.run(run())
+        asyncio.run(run())
+        # 同一事件循环内复用一个客户端，每个事件循环结束时关闭自己的客户端
+        self.assertEqual(len(self.clients), 2)
+        self.assertTrue(all(client.is_closed for client in self.clients))
+        self.assertEqual(len(api._loop_resources), 0)
+
+    def test_aclose(self):
+        api = AsyncGetNoteAPI()
+        api._create_client = self._create_client
+
+        async def run():
+            async with api:
+                await api.search_notes('查询')
+            self.assertTrue(self.clients[0].is_closed)
+            # 关闭后再次使用时重新创建
+            await api.search_notes('查询')
+            self.assertEqual(len(self.clients), 2)
+
+        asyncio.run(run())
+        self.assertTrue(self.clients[1].is_closed)
+
+
 if __name__ == '__main__':
     unittest.main()
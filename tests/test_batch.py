@@ -0,0 +1,122 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import Mock, patch
+from src.api.rate_limiter import current_lane
+from src.batch import load_checkpoint, read_questions, run_batch
+
+TEST_ENV = {"TRACING_ENABLED": "false"}
+
+
+def write_lines(path, lines):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def read_records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@patch.dict(os.environ, TEST_ENV)
+class TestBatch(unittest.TestCase):
+    """
+    测试批量问答
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input = os.path.join(self.directory, "questions.jsonl")
+        self.output = os.path.join(self.directory, "out", "answers.jsonl")
+        self.generator = Mock()
+        self.generator.generate.side_effect = lambda question, notes: {
+            "answer": f"回答：{question}", "references": [], "has_relevant_notes": True, "degraded": False}
+        self.retrieve = Mock(return_value=[{"title": "笔记", "content": "内容"}])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _run(self, **kwargs):
+        kwargs.setdefault("concurrency", 4)
+        return run_batch(read_questions(self.input), self.output, generator=self.generator,
+                         retrieve=self.retrieve, top_k=3, **kwargs)
+
+    def test_read_questions(self):
+        write_lines(self.input, ['{"id": "a", "question": "问题一"}', '', 'not json', '{"query": "问题二"}',
+                                 '{"id": 3}'])
+        items = list(read_questions(self.input))
+        self.assertEqual([(item["id"], item["question"]) for item in items], [("a", "问题一"), ("4", "问题二")])
+
+    def test_answers_written_incrementally(self):
+        write_lines(self.input, [json.dumps({"id": f"q{i}", "question": f"问题{i}"}) for i in range(20)])
+        report = self._run()
+        records = read_records(self.output)
+        self.assertEqual(sorted(record["id"] for record in records), sorted(f"q{i}" for i in range(20)))
+        self.assertTrue(all(record["answer"] == f"回答：{record['question']}" for record in records))
+        self.assertEqual(set(records[0]["timings"]), {"retrieval", "generation", "total"})
+        self.assertEqual(report.succeeded, 20)
+        self.assertGreater(report.questions_per_minute, 0)
+        self.assertIn("问题/分钟", report.summary())
+        self.retrieve.assert_called_with(unittest.mock.ANY, 3)
+
+    def test_resume_skips_answered_and_retries_failed(self):
+        write_lines(self.input, [json.dumps({"id": f"q{i}", "question": f"问题{i}"}) for i in range(5)])
+
+        def generate(question, notes):
+            if question == "问题3":
+                raise Exception("LLM 超时")
+            return {"answer": "回答", "references": []}
+
+        self.generator.generate.side_effect = generate
+        report = self._run()
+        self.assertEqual((report.succeeded, report.failed), (4, 1))
+        self.assertEqual(load_checkpoint(self.output), {"q0", "q1", "q2", "q4"})
+
+        # 模拟中断：最后一行没有写完
+        with open(self.output, "a", encoding="utf-8") as f:
+            f.write('{"id": "q9", "answ')
+        self.generator.generate.side_effect = None
+        self.generator.generate.return_value = {"answer": "回答", "references": []}
+        report = self._run()
+        self.assertEqual((report.succeeded, report.failed, report.skipped), (1, 0, 4))
+        self.assertEqual(load_checkpoint(self.output), {f"q{i}" for i in range(5)})
+
+    def test_concurrency_limit(self):
+        write_lines(self.input, [json.dumps({"question": f"问题{i}"}) for i in range(12)])
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def slow_retrieve(question, top_k):
+            with lock:
+                active.append(question)
+                peak.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.remove(question)
+            return [{"title": "笔记", "content": "内容"}]
+
+        self.retrieve = slow_retrieve
+        report = self._run(concurrency=3)
+        self.assertEqual(report.succeeded, 12)
+        self.assertLessEqual(max(peak), 3)
+        self.assertGreater(max(peak), 1)
+
+    def test_rate_limit_and_batch_lane(self):
+        write_lines(self.input, [json.dumps({"question": f"问题{i}"}) for i in range(6)])
+        lanes = []
+        self.retrieve = lambda question, top_k: lanes.append(current_lane()) or []
+        start = time.monotonic()
+        report = self._run(rate=50)
+        # 第一个问题立即开始，之后每个间隔 20ms
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        self.assertEqual(report.succeeded, 6)
+        self.assertEqual(set(lanes), {"batch"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import os
+import time
+import unittest
+from unittest.mock import Mock, patch
+from src.api.circuit_breaker import CircuitBreaker, CircuitOpenError
+from src.api.get_api import GetNoteAPI, build_session
+from src.api.retry import RetryPolicy, is_service_failure
+from src.retrieval.retrieval import RetrievedNotes, retrieve_notes
+from tests.stub_server import StubServer
+
+TEST_ENV = {"API_KEY": "test-key", "KB_ID": "test-kb", "QUERY_CACHE_BACKEND": "none"}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fail():
+    raise RuntimeError("服务异常")
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """
+    测试熔断器状态转换
+    """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(window=4, min_calls=4, failure_rate=0.5, slow_call_seconds=1.0,
+                                      slow_call_rate=0.75, open_duration=10.0, clock=self.clock)
+
+    def _fail(self, times):
+        for _ in range(times):
+            with self.assertRaises(RuntimeError):
+                self.breaker.call(fail)
+
+    def test_opens_on_failure_rate(self):
+        self.breaker.call(lambda: 'ok')
+        self.breaker.call(lambda: 'ok')
+        self._fail(1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self._fail(1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        func = Mock()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(func)
+        func.assert_not_called()
+
+    def test_opens_on_slow_calls(self):
+        for _ in range(3):
+            self.breaker.record(2.0)
+        self.breaker.record(0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_half_open_probe(self):
+        self._fail(4)
+        self.clock.now = 10.0
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+        # 半开状态只放行一个探测请求
+        self.breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.record(0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_failure_reopens(self):
+        self._fail(4)
+        self.clock.now = 10.0
+        self._fail(1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_ignored_errors(self):
+        self.breaker.is_failure = lambda exc: False
+        self._fail(4)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_metrics_listener(self):
+        events = []
+        self.breaker.add_listener(lambda event, data: events.append((event, data['state'])))
+        self._fail(4)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(fail)
+        names = [event for event, _ in events]
+        self.assertEqual(names.count('failure'), 4)
+        self.assertIn(('state_change', CircuitBreaker.OPEN), events)
+        self.assertEqual(names[-1], 'rejected')
+
+    def test_disabled(self):
+        breaker = CircuitBreaker(min_calls=1, enabled=False)
+        for _ in range(3):
+            with self.assertRaises(RuntimeError):
+                breaker.call(fail)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+class TestGetNoteAPIBreaker(unittest.TestCase):
+    """
+    测试服务持续异常时检索快速失败
+    """
+
+    def setUp(self):
+        self.server = StubServer().start()
+        self.env = patch.dict(os.environ, dict(TEST_ENV, GETNOTE_BASE_URL=self.server.base_url))
+        self.env.start()
+        self.api = GetNoteAPI(session=build_session(),
+                              retry_policy=RetryPolicy(max_attempts=1, deadline=5.0),
+                              breaker=CircuitBreaker(min_calls=2, failure_rate=0.5, is_failure=is_service_failure))
+
+    def tearDown(self):
+        self.env.stop()
+        self.server.stop()
+
+    def test_fast_fail_when_open(self):
+        for _ in range(2):
+            self.server.enqueue(status=503, body={'error': 'busy'})
+            with self.assertRaises(RuntimeError):
+                self.api.search_notes('测试查询')
+
+        start = time.monotonic()
+        with self.assertRaises(CircuitOpenError):
+            self.api.search_notes('测试查询')
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_client_errors_do_not_open(self):
+        for _ in range(3):
+            self.server.enqueue(status=400, body={'error': 'bad request'})
+            with self.assertRaises(RuntimeError) as ctx:
+                self.api.search_notes('测试查询')
+            self.assertNotIsInstance(ctx.exception, CircuitOpenError)
+        self.assertEqual(self.api.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_shared_breaker_not_modified(self):
+        breaker = CircuitBreaker()
+        is_failure = breaker.is_failure
+        GetNoteAPI(session=build_session(), breaker=breaker)
+        self.assertIs(breaker.is_failure, is_failure)
+        # 自行创建的熔断器按服务异常判断失败
+        own = GetNoteAPI(session=build_session()).breaker
+        self.assertFalse(own.is_failure(RuntimeError("请求错误")))
+
+
+class TestDegradedRetrieval(unittest.TestCase):
+    """
+    测试检索降级标记
+    """
+
+    @patch.dict(os.environ, {"SEMANTIC_CACHE_ENABLED": "false"})
+    @patch('src.retrieval.retrieval.get_client')
+    def test_retrieve_notes_degraded(self, mock_get_client):
+        mock_get_client.return_value.search_notes.side_effect = CircuitOpenError("熔断中")
+        notes = retrieve_notes('测试查询')
+        self.assertIsInstance(notes, RetrievedNotes)
+        self.assertEqual(notes, [])
+        self.assertTrue(notes.degraded)
+
+    @patch.dict(os.environ, {"SEMANTIC_CACHE_ENABLED": "false"})
+    @patch('src.retrieval.retrieval.get_client')
+    def test_retrieve_notes_normal(self, mock_get_client):
+        mock_get_client.return_value.search_notes.return_value = [{'title': '测试笔记1'}]
+        notes = retrieve_notes('测试查询')
+        self.assertEqual(len(notes), 1)
+        self.assertFalse(notes.degraded)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from src.generation.context_packer import ContextPacker, split_sentences
+from src.utils.tokens import count_tokens
+
+NOTES = [
+    {"title": "AI 综合回答", "content": "高血压患者应当限制食盐。" * 5 + "适量运动也有帮助。" * 20},
+    {"title": "饮食建议", "content": "每天食盐不超过五克。" + "多吃新鲜蔬菜和水果。" * 30, "relevance_score": 0.9},
+    {"title": "无关笔记", "content": "周末去爬山拍照。" * 40, "relevance_score": 0.1},
+]
+
+
+class TestSplitSentences(unittest.TestCase):
+    """
+    测试句子切分
+    """
+
+    def test_split_keeps_text(self):
+        text = "第一句。第二句！第三句\n第四句"
+        self.assertEqual(split_sentences(text), ["第一句。", "第二句！", "第三句\n", "第四句"])
+
+    def test_long_sentence_is_split(self):
+        pieces = split_sentences("长" * 500, max_tokens=100)
+        self.assertEqual("".join(pieces), "长" * 500)
+        self.assertTrue(all(count_tokens(piece) <= 100 for piece in pieces))
+
+
+class TestContextPacker(unittest.TestCase):
+    """
+    测试按 token 预算构建上下文
+    """
+
+    def test_fits_budget_unchanged(self):
+        packed = ContextPacker(budget=100000).pack("高血压食盐", NOTES)
+        self.assertEqual(packed.saved_tokens, 0)
+        self.assertIn("周末去爬山拍照。" * 40, packed.text)
+
+    def test_packs_relevant_sentences_within_budget(self):
+        packed = ContextPacker(budget=120).pack("高血压患者每天吃多少食盐", NOTES)
+        self.assertLessEqual(packed.tokens, 120)
+        self.assertGreater(packed.saved_tokens, 0)
+        self.assertEqual(packed.original_tokens - packed.tokens, packed.saved_tokens)
+        self.assertIn("每天食盐不超过五克。", packed.text)
+        self.assertIn("高血压患者应当限制食盐。", packed.text)
+        self.assertNotIn("爬山", packed.text)
+        # 笔记编号与检索结果顺序一致
+        self.assertIn("【笔记2】", packed.text)
+        self.assertNotIn("【笔记3】", packed.text)
+        self.assertIn("……", packed.text)
+
+    def test_zero_budget_disables_packing(self):
+        packed = ContextPacker(budget=0).pack("高血压", NOTES)
+        self.assertEqual(packed.tokens, packed.original_tokens)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from src.retrieval.fusion import fuse, query_coverage
+from src.retrieval.retrieval import merge_results
+from src.utils.embedding import hamming_distance, simhash
+
+NOTE_A = {"title": "高血压饮食", "content": "高血压患者每天食盐摄入量不要超过五克，多吃蔬菜水果"}
+NOTE_A_DUP = {"title": "高血压饮食", "content": "高血压患者每天食盐摄入量不要超过五克，多吃蔬菜和水果"}
+NOTE_B = {"title": "糖尿病运动", "content": "糖尿病患者饭后散步三十分钟有助于控制血糖"}
+NOTE_C = {"title": "睡眠建议", "content": "成年人每天保证七到八小时睡眠"}
+
+
+class TestSimHash(unittest.TestCase):
+    """
+    测试 SimHash 指纹
+    """
+
+    def test_near_duplicates_are_close(self):
+        self.assertLessEqual(hamming_distance(simhash(NOTE_A["content"]), simhash(NOTE_A_DUP["content"])), 4)
+        self.assertGreater(hamming_distance(simhash(NOTE_A["content"]), simhash(NOTE_B["content"])), 10)
+
+
+class TestFuse(unittest.TestCase):
+    """
+    测试倒数排名融合
+    """
+
+    def test_note_in_both_rankings_ranks_first(self):
+        local = [dict(NOTE_C, id="c", relevance_score=0.8), dict(NOTE_B, id="b", relevance_score=0.9)]
+        dense = [dict(NOTE_B, id="b", relevance_score=0.95)]
+        fused = fuse([local, dense], "糖尿病运动", top_k=3)
+        self.assertEqual([note["id"] for note in fused], ["b", "c"])
+        self.assertEqual(fused[0]["relevance_score"], 0.95)
+        self.assertGreater(fused[0]["fusion_score"], fused[1]["fusion_score"])
+
+    def test_dedupe_and_fill_relevance(self):
+        remote = [dict(NOTE_A), dict(NOTE_A_DUP), dict(NOTE_B), dict(NOTE_C)]
+        fused = fuse([remote], "高血压患者的食盐", top_k=2)
+        self.assertEqual([note["title"] for note in fused], ["高血压饮食", "糖尿病运动"])
+        self.assertGreater(fused[0]["relevance_score"], 0.5)
+        self.assertLess(fused[1]["relevance_score"], fused[0]["relevance_score"])
+
+    def test_remote_ref_matches_local_note(self):
+        remote = [dict(NOTE_A_DUP)]
+        local = [dict(NOTE_A, id="a", relevance_score=0.9)]
+        fused = fuse([remote, local], "高血压", top_k=3)
+        self.assertEqual(len(fused), 1)
+        self.assertEqual(fused[0]["id"], "a")
+
+    def test_query_coverage(self):
+        self.assertGreater(query_coverage("食盐摄入", NOTE_A["content"]), 0.8)
+        self.assertLess(query_coverage("睡眠时间", NOTE_A["content"]), 0.3)
+        self.assertEqual(query_coverage("", NOTE_A["content"]), 0.0)
+
+    def test_merge_results_keeps_ai_answer(self):
+        remote = [{"title": "AI 综合回答", "content": "回答", "source": "Get 笔记 AI 生成"},
+                  dict(NOTE_A), dict(NOTE_B), dict(NOTE_C)]
+        merged = merge_results("高血压", remote, [], top_k=2)
+        self.assertEqual(merged[0]["title"], "AI 综合回答")
+        self.assertEqual(len(merged), 3)
+
+if __name__ == '__main__':
+    unittest.main()
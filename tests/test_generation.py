@@ -1,6 +1,11 @@
+import os
 import unittest
 from unittest.mock import Mock, patch
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
 from src.generation.generator import AnswerGenerator
+from src.retrieval.retrieval import RetrievedNotes
+
+TEST_ENV = {"SILICONFLOW_API_KEY": "test-key", "SEMANTIC_CACHE_ENABLED": "false"}
 
 class TestAnswerGenerator(unittest.TestCase):
     """
@@ -88,5 +93,53 @@ class TestAnswerGenerator(unittest.TestCase):
         self.assertEqual(references[0]['title'], '测试笔记1')
         self.assertEqual(references[0]['reference_id'], '笔记1')
 
+@patch.dict(os.environ, TEST_ENV)
+class TestAnswerGeneratorStream(unittest.TestCase):
+    """
+    测试流式生成
+    """
+
+    def _generator(self, response):
+        with patch('src.generation.generator.ChatOpenAI') as mock_chat:
+            mock_chat.return_value = FakeListChatModel(responses=[response])
+            return AnswerGenerator()
+
+    def test_generate_stream_tokens_then_result(self):
+        """
+        测试先逐个产出文本片段，最后产出结果字典
+        """
+        generator = self._generator('这是回答[笔记1]')
+        notes = [{'id': '1', 'title': '测试笔记1', 'content': '测试内容1'}]
+        items = list(generator.generate_stream('测试查询', notes))
+        tokens, result = items[:-1], items[-1]
+        self.assertGreater(len(tokens), 1)
+        self.assertTrue(all(isinstance(token, str) for token in tokens))
+        self.assertEqual(''.join(tokens), '这是回答[笔记1]')
+        self.assertEqual(result['answer'], '这是回答[笔记1]')
+        self.assertEqual(result['references'][0]['reference_id'], '笔记1')
+        self.assertTrue(result['has_relevant_notes'])
+
+    def test_generate_stream_no_notes(self):
+        generator = self._generator('不应被调用')
+        items = list(generator.generate_stream('测试查询', []))
+        self.assertEqual(len(items), 2)
+        self.assertIn('未检索到与您的问题相关的笔记内容', items[0])
+        self.assertFalse(items[1]['has_relevant_notes'])
+
+    def test_generate_degraded(self):
+        """
+        测试检索降级时提示服务不可用，而不是“没有相关笔记”
+        """
+        generator = self._generator('不应被调用')
+        result = generator.generate('测试查询', RetrievedNotes(degraded=True, reason='熔断中'))
+        self.assertTrue(result['degraded'])
+        self.assertIn('知识库服务暂时不可用', result['answer'])
+        self.assertFalse(result['has_relevant_notes'])
+
+    def test_generate_uses_same_chain(self):
+        generator = self._generator('完整回答')
+        result = generator.generate('测试查询', [{'title': '测试笔记1', 'content': '测试内容1'}])
+        self.assertEqual(result['answer'], '完整回答')
+
 if __name__ == '__main__':
     unittest.main()
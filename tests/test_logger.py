@@ -0,0 +1,97 @@
+import logging
+import queue
+import unittest
+from logging.handlers import QueueListener
+from unittest.mock import patch
+from src.utils.logger import DeferredQueueHandler, LazyPayload, RequestIdFilter, log_payload, request_id_var
+
+
+class CountingPayload:
+    """
+    记录被格式化次数的对象
+    """
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return 'payload'
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((self.format(record), record.request_id))
+
+
+class TestLazyPayload(unittest.TestCase):
+    """
+    测试大对象的惰性格式化
+    """
+
+    def test_truncate_with_hash(self):
+        text = str(LazyPayload({'refs': ['内容' * 500]}, max_chars=100))
+        self.assertTrue(text.startswith('{"refs": ["内容'))
+        self.assertIn('blake2b=', text)
+        self.assertLess(len(text), 200)
+
+    def test_short_payload_unchanged(self):
+        self.assertEqual(str(LazyPayload({'a': 1})), '{"a": 1}')
+
+    def test_not_formatted_below_level(self):
+        logger = logging.getLogger('test_logger.lazy')
+        logger.setLevel(logging.INFO)
+        payload = CountingPayload()
+        with patch('src.utils.logger.payload_sample_rate', 0.0):
+            log_payload(logger, '原始结果：', payload)
+        self.assertEqual(payload.formatted, 0)
+
+    def test_sampled_at_info(self):
+        logger = logging.getLogger('test_logger.sampled')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handler = ListHandler()
+        handler.addFilter(RequestIdFilter())
+        logger.addHandler(handler)
+        with patch('src.utils.logger.payload_sample_rate', 1.0):
+            log_payload(logger, '原始结果：', 'abc')
+        self.assertEqual(handler.records[0][0], '原始结果：abc')
+
+
+class TestDeferredQueueHandler(unittest.TestCase):
+    """
+    测试后台线程写日志
+    """
+
+    def test_formatting_happens_in_listener(self):
+        log_queue = queue.SimpleQueue()
+        handler = DeferredQueueHandler(log_queue)
+        handler.addFilter(RequestIdFilter())
+        target = ListHandler()
+        target.addFilter(RequestIdFilter())
+        listener = QueueListener(log_queue, target)
+
+        logger = logging.getLogger('test_logger.queue')
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        logger.addHandler(handler)
+
+        payload = CountingPayload()
+        token = request_id_var.set('req-queue')
+        try:
+            logger.info('结果：%s', payload)
+        finally:
+            request_id_var.reset(token)
+        # 调用线程只入队，不格式化
+        self.assertEqual(payload.formatted, 0)
+
+        listener.start()
+        listener.stop()
+        self.assertEqual(target.records, [('结果：payload', 'req-queue')])
+
+if __name__ == '__main__':
+    unittest.main()
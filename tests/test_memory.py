@@ -0,0 +1,103 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from src.generation.memory import ConversationMemory, ConversationMemoryStore, extractive_summary
+
+
+def make_messages(turns: int, answer: str = "回答") -> list:
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"问题{i}"})
+        messages.append({"role": "assistant", "content": f"{answer}{i}"})
+    return messages
+
+
+class TestConversationMemory(unittest.TestCase):
+    """
+    测试按会话保存的对话记忆
+    """
+
+    def test_only_new_messages_are_formatted(self):
+        memory = ConversationMemory(window_tokens=1000)
+        messages = make_messages(2)
+        history = memory.update(messages)
+        self.assertEqual(history, "用户: 问题0\n助手: 回答0\n用户: 问题1\n助手: 回答1\n")
+        with patch("src.generation.memory.format_message", wraps=lambda m: f"{m['content']}\n") as formatter:
+            memory.update(messages + [{"role": "user", "content": "问题2"}])
+        # 只格式化新增的一条
+        self.assertEqual(formatter.call_count, 1)
+
+    def test_window_is_token_bounded_and_summarized(self):
+        summarizer_calls = []
+
+        def summarizer(summary, lines):
+            summarizer_calls.append(list(lines))
+            return summary + f"[摘要{len(lines)}条]"
+
+        memory = ConversationMemory(summarizer, window_tokens=60)
+        history = memory.update(make_messages(10, answer="很长的回答内容。" * 3))
+        self.assertIn("（更早对话的摘要）", history)
+        self.assertIn("助手: " + "很长的回答内容。" * 3 + "9", history)
+        self.assertNotIn("问题0", history)
+        self.assertLessEqual(memory._window_size, 60)
+        self.assertEqual(len(summarizer_calls), 1)
+
+    def test_background_summary(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_summarizer(summary, lines):
+            started.set()
+            release.wait(5)
+            return "用户之前询问了问题0"
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            memory = ConversationMemory(slow_summarizer, window_tokens=20, executor=executor)
+            history = memory.update(make_messages(3))
+            started.wait(5)
+            # 摘要完成前，移出窗口的对话仍原样保留
+            self.assertIn("问题0", history)
+            release.set()
+            memory.wait(5)
+            history = memory.update(make_messages(3))
+            self.assertTrue(history.startswith("（更早对话的摘要）用户之前询问了问题0\n"))
+            self.assertNotIn("用户: 问题0", history)
+
+    def test_summarizer_failure_falls_back(self):
+        def failing(summary, lines):
+            raise RuntimeError("LLM 不可用")
+
+        memory = ConversationMemory(failing, window_tokens=10)
+        history = memory.update([{"role": "user", "content": "第一句。第二句"},
+                                 {"role": "assistant", "content": "回答"}])
+        self.assertIn("用户: 第一句。", history)
+        self.assertNotIn("第二句", history)
+
+    def test_reset_when_history_shrinks(self):
+        memory = ConversationMemory(window_tokens=1000)
+        memory.update(make_messages(2))
+        self.assertEqual(memory.update([]), "")
+
+    def test_extractive_summary_is_bounded(self):
+        summary = extractive_summary("", [f"用户: 问题{i}很长很长很长。后面的内容\n" for i in range(50)], max_tokens=30)
+        self.assertNotIn("后面的内容", summary)
+        self.assertIn("问题49", summary)
+
+
+class TestConversationMemoryStore(unittest.TestCase):
+    """
+    测试会话级对话记忆的保存和淘汰
+    """
+
+    def test_sessions_are_isolated_and_evicted(self):
+        store = ConversationMemoryStore(max_sessions=2)
+        self.addCleanup(store.close)
+        store.get("a").update(make_messages(1))
+        self.assertEqual(store.get("b").update([]), "")
+        store.get("c")
+        self.assertNotIn("a", store._sessions)
+        self.assertIs(store.get("b"), store.get("b"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,308 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+import numpy as np
+from src.api.get_api import GetNoteAPI, NotesEndpointNotFoundError, build_session
+from src.api.retry import RetryPolicy
+from src.retrieval.bm25 import BM25Index, analyze, search_segments
+from src.retrieval.mirror import NoteMirror
+from src.retrieval.retrieval import retrieve_notes, retrieve_notes_async, select_notes
+from src.retrieval.vector_index import VectorIndex, chunk_text, search_vector_segments
+from tests.stub_server import StubServer, SyntheticNotes
+
+TEST_ENV = {"API_KEY": "test-key", "KB_ID": "test-kb", "QUERY_CACHE_BACKEND": "none"}
+NOTES_PATH = "/getnote/openapi/knowledge/notes"
+
+
+class TestBM25(unittest.TestCase):
+    """
+    测试分词和 BM25 检索
+    """
+
+    def test_analyze(self):
+        self.assertEqual(analyze("高血压饮食 DASH"), ["高血", "血压", "压饮", "饮食", "dash"])
+        self.assertEqual(analyze("茶"), ["茶"])
+
+    def test_search_across_segments(self):
+        base = BM25Index.build([("a", "高血压患者的饮食建议"), ("b", "糖尿病的运动建议")])
+        delta = BM25Index.build([("c", "高血压与睡眠")])
+        base.mask(["b"])
+        keys = [key for key, _, _ in search_segments([base, delta], "高血压饮食", 3)]
+        self.assertEqual(keys, ["a", "c"])
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        BM25Index.build([("a", "高血压患者的饮食建议"), ("b", "糖尿病的运动建议")]).save(directory)
+        index = BM25Index.load(directory)
+        self.assertEqual(search_segments([index], "运动", 1)[0][0], "b")
+
+
+class TestVectorIndex(unittest.TestCase):
+    """
+    测试内存映射的向量索引
+    """
+
+    DOCS = [("a", "高血压", "高血压患者每天食盐不超过五克"), ("b", "糖尿病", "糖尿病患者饭后散步三十分钟")]
+
+    def test_chunk_text(self):
+        chunks = chunk_text("标题", "内容" * 100, chunk_chars=64, overlap=16)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk.startswith("标题\n") for chunk in chunks))
+        self.assertEqual(chunk_text("标题", ""), ["标题\n"])
+
+    def test_search_scores_coverage(self):
+        index = VectorIndex.build(self.DOCS)
+        hits = search_vector_segments([index], "患者每天食盐", 2)
+        self.assertEqual(hits[0][0], "a")
+        self.assertAlmostEqual(hits[0][1], 1.0, places=3)
+        # 查询中“控制”不在笔记中，覆盖比例下降
+        self.assertLess(search_vector_segments([index], "高血压患者如何控制食盐", 1)[0][1], 0.7)
+        index.mask(["a"])
+        self.assertNotIn("a", [key for key, _ in search_vector_segments([index], "高血压", 2)])
+
+    def test_load_is_memory_mapped(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        VectorIndex.build(self.DOCS).save(directory)
+        index = VectorIndex.load(directory)
+        self.assertIsInstance(index.matrix, np.memmap)
+        self.assertEqual(index.matrix.dtype, np.int8)
+        self.assertEqual(search_vector_segments([index], "饭后散步", 1)[0][0], "b")
+
+
+class TestSelectNotes(unittest.TestCase):
+    """
+    测试按 top_k 和相似度阈值筛选检索结果
+    """
+
+    def test_threshold_and_top_k(self):
+        notes = [
+            {"title": "AI 综合回答", "source": "Get 笔记 AI 生成"},
+            {"title": "1", "relevance_score": 0.9},
+            {"title": "2", "relevance_score": 0.5},
+            {"title": "3"},
+            {"title": "4", "relevance_score": 0.8},
+        ]
+        selected = select_notes(notes, top_k=2, threshold=0.7)
+        self.assertEqual([note["title"] for note in selected], ["AI 综合回答", "1", "3"])
+
+    @patch.dict(os.environ, {"SIMILARITY_THRESHOLD": "0.4"})
+    def test_threshold_from_env(self):
+        self.assertEqual(len(select_notes([{"relevance_score": 0.5}], top_k=3)), 1)
+
+
+class TestNoteMirror(unittest.TestCase):
+    """
+    基于 10 万篇合成笔记的桩服务测试本地镜像同步和检索
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = SyntheticNotes(100_000)
+        cls.corpus.add("needle-1", title="家庭血压计校准", content="电子血压计每年需要到医院校准一次")
+        cls.server = StubServer().start()
+        cls.server.add_route("GET", NOTES_PATH, cls.corpus.handler)
+        cls.env = patch.dict(os.environ, dict(TEST_ENV, GETNOTE_BASE_URL=cls.server.base_url))
+        cls.env.start()
+        cls.directory = tempfile.mkdtemp()
+        cls.mirror = NoteMirror(cls.directory, api=cls.make_api())
+        cls.stats = cls.mirror.sync()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.mirror.close()
+        cls.env.stop()
+        cls.server.stop()
+        shutil.rmtree(cls.directory)
+
+    @classmethod
+    def make_api(cls) -> GetNoteAPI:
+        return GetNoteAPI(session=build_session(), retry_policy=RetryPolicy(max_attempts=1, deadline=10.0))
+
+    def test_full_sync(self):
+        self.assertEqual(self.stats["fetched"], 100_001)
+        self.assertEqual(len(self.mirror), 100_001)
+        self.assertGreater(self.stats["pages"], 1)
+
+    def test_search_is_fast(self):
+        start = time.perf_counter()
+        notes = self.mirror.search("血压计校准", top_k=3)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(notes[0]["id"], "needle-1")
+        self.assertEqual(notes[0]["source"], "本地镜像")
+        self.assertEqual(notes[0]["relevance_score"], 1.0)
+        self.assertLess(elapsed, 0.05)
+
+    def test_dense_search(self):
+        notes = self.mirror.search_dense("如何校准家里的血压计", top_k=3)
+        self.assertEqual(notes[0]["id"], "needle-1")
+
+    def test_incremental_sync(self):
+        self.corpus.update("n000001", title="更新后的笔记", content="胰岛素泵的使用方法")
+        deleted_title = self.corpus.notes["n000002"]["title"]
+        self.corpus.delete("n000002")
+        self.corpus.add("needle-2", title="晨跑注意事项", content="晨跑前喝一杯温水")
+        requests_before = len(self.server.requests)
+        old_lexical, old_dense = self.mirror._indexes
+
+        stats = self.mirror.sync()
+        # 正在被检索使用的旧段不会被修改，屏蔽只作用于替换后的新段
+        self.assertTrue(old_lexical[0].live.all() and old_dense[0].live.all())
+        self.assertFalse(self.mirror._indexes[0][0].live.all())
+        # 只拉取水位线之后变化的笔记
+        self.assertLess(stats["fetched"], 10)
+        self.assertEqual(stats["changed"], 3)
+        self.assertTrue(all("updated_after=" in request["path"]
+                            for request in self.server.requests[requests_before:]))
+        self.assertEqual(self.mirror.search("胰岛素泵", 1)[0]["id"], "n000001")
+        self.assertEqual(self.mirror.search("晨跑温水", 1)[0]["id"], "needle-2")
+        self.assertEqual(self.mirror.search_dense("晨跑前喝温水", 1)[0]["id"], "needle-2")
+        self.assertNotIn("n000002", [note["id"] for note in self.mirror.search(deleted_title, 100)])
+        self.assertEqual(len(self.mirror), 100_001)
+
+        # 重新打开镜像：加载磁盘上的基础段并重放增量
+        reopened = NoteMirror(self.directory, api=self.make_api())
+        self.assertEqual(reopened.search("晨跑温水", 1)[0]["id"], "needle-2")
+        self.assertEqual(len(reopened), len(self.mirror))
+        reopened.close()
+
+
+class TestIndexVersions(unittest.TestCase):
+    """
+    测试重建基础段时的索引版本切换和旧版本清理
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.corpus = SyntheticNotes(50)
+        self.server = StubServer().start()
+        self.addCleanup(self.server.stop)
+        self.server.add_route("GET", NOTES_PATH, self.corpus.handler)
+        env = patch.dict(os.environ, dict(TEST_ENV, GETNOTE_BASE_URL=self.server.base_url))
+        env.start()
+        self.addCleanup(env.stop)
+
+    def test_rebuild_switches_version(self):
+        # 任何变化都重建基础段
+        mirror = NoteMirror(self.directory, api=GetNoteAPI(session=build_session()), compact_min=0, compact_ratio=0)
+        self.addCleanup(mirror.close)
+        mirror.sync()
+        versions = [mirror.store.get_meta("index_version")]
+        for i in range(2):
+            self.corpus.add(f"needle-{i}", title=f"晨跑注意事项{i}", content="晨跑前喝一杯温水")
+            mirror.sync()
+            versions.append(mirror.store.get_meta("index_version"))
+        self.assertEqual(len(set(versions)), 3)
+        # 保留当前版本和上一个版本（可能仍被检索使用），更早的版本已删除
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory, "index"))), sorted(versions[1:]))
+
+        reopened = NoteMirror(self.directory, api=GetNoteAPI(session=build_session()))
+        self.assertEqual({note["title"] for note in reopened.search("晨跑温水", 2)}, {"晨跑注意事项0", "晨跑注意事项1"})
+        self.assertEqual(len(reopened), len(mirror))
+        reopened.close()
+
+
+class TestBackgroundSync(unittest.TestCase):
+    """
+    测试笔记列表接口不存在时停止后台同步
+    """
+
+    def test_stops_on_missing_endpoint(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        server = StubServer().start()
+        self.addCleanup(server.stop)
+        with patch.dict(os.environ, dict(TEST_ENV, GETNOTE_BASE_URL=server.base_url)):
+            mirror = NoteMirror(directory, api=GetNoteAPI(session=build_session()))
+            self.addCleanup(mirror.close)
+            with self.assertRaises(NotesEndpointNotFoundError):
+                mirror.sync()
+            mirror.start_background_sync(0.01)
+            mirror._sync_thread.join(timeout=5)
+        self.assertFalse(mirror._sync_thread.is_alive())
+        # 直接同步一次、后台同步一次后不再请求
+        self.assertEqual(len(server.requests), 2)
+
+
+class TestLocalFirstRetrieval(unittest.TestCase):
+    """
+    测试本地优先检索和服务不可用时的本地降级
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        corpus = SyntheticNotes(200)
+        corpus.add("needle", title="家庭血压计校准", content="电子血压计每年需要到医院校准一次")
+        self.server = StubServer().start()
+        self.addCleanup(self.server.stop)
+        self.server.add_route("GET", NOTES_PATH, corpus.handler)
+        env = patch.dict(os.environ, dict(TEST_ENV, GETNOTE_BASE_URL=self.server.base_url,
+                                          SEMANTIC_CACHE_ENABLED="false", LOCAL_INDEX_ENABLED="true",
+                                          LOCAL_INDEX_DIR=self.directory))
+        env.start()
+        self.addCleanup(env.stop)
+        mirror = NoteMirror(self.directory, api=GetNoteAPI(session=build_session()))
+        mirror.sync(full=True)
+        self.addCleanup(mirror.close)
+        patcher = patch("src.retrieval.retrieval.get_note_mirror", return_value=mirror)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.dict(os.environ, {"LOCAL_INDEX_MIN_HITS": "1"})
+    @patch("src.retrieval.retrieval.get_client")
+    def test_local_hit_skips_api(self, mock_get_client):
+        notes = retrieve_notes("血压计校准")
+        self.assertEqual(notes[0]["id"], "needle")
+        self.assertFalse(notes.degraded)
+        mock_get_client.return_value.search_notes.assert_not_called()
+
+    @patch("src.retrieval.retrieval.get_client")
+    def test_fused_with_remote_refs(self, mock_get_client):
+        mock_get_client.return_value.search_notes.return_value = [
+            {"title": "AI 综合回答", "content": "回答", "source": "Get 笔记 AI 生成"},
+            {"title": "家庭血压计校准", "content": "电子血压计每年需要到医院校准一次", "source": "原始笔记片段"},
+            {"title": "血压计选购", "content": "上臂式电子血压计比腕式更准确", "source": "原始笔记片段"},
+        ]
+        notes = retrieve_notes("血压计校准")
+        self.assertEqual(notes[0]["title"], "AI 综合回答")
+        # 远程引用与本地笔记重复，合并为一条并带上本地笔记的 id
+        self.assertEqual([note.get("id") for note in notes[1:]], ["needle", None])
+        self.assertTrue(all(note["relevance_score"] is not None for note in notes[1:]))
+
+    @patch("src.retrieval.retrieval.get_client")
+    def test_fallback_to_local_when_api_fails(self, mock_get_client):
+        mock_get_client.return_value.search_notes.side_effect = RuntimeError("服务异常")
+        notes = retrieve_notes("血压计的价格")
+        self.assertTrue(notes.degraded)
+        self.assertEqual(notes[0]["id"], "needle")
+
+    @patch.dict(os.environ, {"LOCAL_INDEX_MIN_HITS": "1"})
+    @patch("src.retrieval.retrieval.get_async_client")
+    def test_async_local_hit_skips_api(self, mock_get_client):
+        mock_get_client.return_value.search_notes = AsyncMock()
+        notes = asyncio.run(retrieve_notes_async("血压计校准"))
+        self.assertEqual(notes[0]["id"], "needle")
+        mock_get_client.return_value.search_notes.assert_not_called()
+
+    @patch("src.retrieval.retrieval.get_async_client")
+    def test_async_fused_and_fallback(self, mock_get_client):
+        mock_get_client.return_value.search_notes = AsyncMock(return_value=[
+            {"title": "家庭血压计校准", "content": "电子血压计每年需要到医院校准一次", "source": "原始笔记片段"},
+        ])
+        notes = asyncio.run(retrieve_notes_async("血压计校准"))
+        self.assertEqual(notes[0]["id"], "needle")
+        mock_get_client.return_value.search_notes.side_effect = RuntimeError("服务异常")
+        notes = asyncio.run(retrieve_notes_async("血压计的价格"))
+        self.assertTrue(notes.degraded)
+        self.assertEqual(notes[0]["id"], "needle")
+
+
+if __name__ == '__main__':
+    unittest.main()
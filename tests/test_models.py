@@ -0,0 +1,97 @@
+import json
+import unittest
+from src.api.get_api import AI_ANSWER_SOURCE, normalize_note, normalize_search_result
+from src.api.models import Note, Reference, as_notes, json_default
+from src.cache.query_cache import MemoryBackend, QueryCache
+from src.retrieval.fusion import fuse
+from src.retrieval.retrieval import RetrievedNotes
+
+
+class TestNote(unittest.TestCase):
+    """
+    测试 Note/Reference 数据模型
+    """
+
+    def test_mapping_access(self):
+        note = Note(title="标题", content="内容", id="1")
+        self.assertEqual(note["title"], "标题")
+        self.assertIsNone(note.get("relevance_score"))
+        self.assertNotIn("relevance_score", note)
+        with self.assertRaises(KeyError):
+            note["source"]
+        note["relevance_score"] = 0.8
+        note["bm25_score"] = 1.5
+        self.assertEqual(note.relevance_score, 0.8)
+        self.assertEqual(note.extra, {"bm25_score": 1.5})
+        self.assertEqual(dict(note), {"id": "1", "title": "标题", "content": "内容", "relevance_score": 0.8,
+                                      "bm25_score": 1.5})
+        self.assertEqual(note, {"id": "1", "title": "标题", "content": "内容", "relevance_score": 0.8,
+                                "bm25_score": 1.5})
+
+    def test_slots(self):
+        note = Note(title="标题")
+        self.assertFalse(hasattr(note, "__dict__"))
+        self.assertIsNone(note.extra)
+
+    def test_copy_is_independent(self):
+        note = Note.from_dict({"id": 1, "title": "标题", "content": "内容", "updated_at": 3.0})
+        self.assertEqual(note.id, "1")
+        clone = note.copy()
+        clone["updated_at"] = 4.0
+        clone.relevance_score = 0.5
+        self.assertEqual(note["updated_at"], 3.0)
+        self.assertIsNone(note.relevance_score)
+
+    def test_reference_keeps_none_fields(self):
+        reference = Reference.from_note(Note(title="标题"), 2)
+        self.assertEqual(dict(reference), {"reference_id": "笔记2", "id": None, "title": "标题",
+                                           "relevance_score": None})
+        self.assertEqual(json.loads(json.dumps([reference], default=json_default))[0]["reference_id"], "笔记2")
+
+    def test_as_notes_zero_copy(self):
+        notes = RetrievedNotes([Note(title="标题")], degraded=True)
+        self.assertIs(as_notes(notes), notes)
+        converted = as_notes([{"title": "标题", "content": "内容"}])
+        self.assertIsInstance(converted[0], Note)
+
+
+class TestNormalize(unittest.TestCase):
+    """
+    测试检索响应的规范化
+    """
+
+    def test_search_result(self):
+        refs = [{"title": "同一篇笔记", "content": f"片段{i}", "note_id": 7, "highlight": []} for i in range(3)]
+        notes = normalize_search_result(json.loads(json.dumps({"c": {"answers": "回答", "refs": refs}})))
+        self.assertEqual(notes[0].source, AI_ANSWER_SOURCE)
+        self.assertEqual([note.content for note in notes[1:]], ["片段0", "片段1", "片段2"])
+        self.assertEqual(notes[1].id, "7")
+        # 引用片段只保留需要的字段，同一标题共享一个字符串对象
+        self.assertIsNone(notes[1].extra)
+        self.assertIs(notes[1].title, notes[2].title)
+
+    def test_data_items_keep_extra_fields(self):
+        notes = normalize_search_result({"data": {"items": [{"id": "1", "note_title": "标题", "text": "内容",
+                                                             "score": 0.9}]}})
+        self.assertEqual((notes[0].title, notes[0].content), ("标题", "内容"))
+        self.assertEqual(notes[0]["score"], 0.9)
+
+    def test_missing_title(self):
+        self.assertEqual(normalize_note({"content": "内容"}, "原始笔记片段").title, "未知标题")
+
+    def test_cache_round_trip(self):
+        cache = QueryCache(MemoryBackend(1024 * 1024), ttl=60)
+        notes = normalize_search_result({"c": {"answers": "回答", "refs": [{"title": "标题", "content": "内容"}]}})
+        cache.set("key", notes)
+        self.assertEqual(as_notes(cache.get("key")), notes)
+
+    def test_fuse_does_not_modify_input(self):
+        remote = [Note(title="标题", content="血压控制的方法", source="原始笔记片段")]
+        fused = fuse([remote], "血压", 3)
+        self.assertIsInstance(fused[0], Note)
+        self.assertIsNotNone(fused[0].fusion_score)
+        self.assertIsNone(remote[0].fusion_score)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import gzip
+import json
+import os
+import unittest
+from unittest.mock import patch
+import httpx
+from src.api import payload
+from src.api.get_api import AsyncGetNoteAPI, GetNoteAPI, build_session
+from src.api.models import Note
+from src.api.payload import PayloadLimits, SearchResponseParser, decode_json, parse_search_body
+from tests.stub_server import StubServer, make_search_response
+
+TEST_ENV = {"API_KEY": "test-key", "KB_ID": "test-kb", "QUERY_CACHE_BACKEND": "none"}
+
+
+def chunked(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def large_response(refs=200, content_chars=2000):
+    return make_search_response("综合回答", [
+        {"title": f"笔记{i % 10}", "content": "正文" * (content_chars // 2), "note_id": i, "highlight": ["]"]}
+        for i in range(refs)
+    ])
+
+
+class TestSearchResponseParser(unittest.TestCase):
+    """
+    测试 knowledge/search 响应的增量解析
+    """
+
+    def test_matches_full_parse_for_any_chunking(self):
+        document = {"h": {"c": 0}, "refs": [0],
+                    "c": {"answers": '带 "引号" 和 \\ 的回答 {[', "meta": {"refs": [1]},
+                          "refs": [{"title": f"笔记{i}", "content": '内容\\"]}' * i, "n": [1.5, None, {"x": "]"}]}
+                                   for i in range(20)],
+                          "after": True}}
+        body = json.dumps(document, ensure_ascii=False).encode("utf-8")
+        for size in (1, 3, 64, len(body)):
+            self.assertEqual(parse_search_body(chunked(body, size), PayloadLimits()), document)
+
+    def test_limits_applied_while_parsing(self):
+        body = json.dumps(large_response(refs=50, content_chars=100), ensure_ascii=False).encode("utf-8")
+        limits = PayloadLimits(max_refs=5, max_content_chars=10, max_answer_chars=2)
+        parser = SearchResponseParser(limits, on_ref=lambda ref: ref["content"])
+        for chunk in chunked(body, 128):
+            parser.feed(chunk)
+        result = parser.close()
+        self.assertEqual(result["c"]["refs"], ["正文" * 5 + "……"] * 5)
+        self.assertEqual(result["c"]["answers"], "综合……")
+        self.assertEqual(limits.truncated, 6)
+
+    def test_other_shapes(self):
+        document = {"data": {"items": [{"id": 1, "content": "内容"}]}}
+        self.assertEqual(parse_search_body([json.dumps(document).encode()], PayloadLimits()), document)
+
+    def test_truncated_body_raises(self):
+        body = json.dumps(large_response(refs=3), ensure_ascii=False).encode("utf-8")
+        with self.assertRaises(ValueError):
+            parse_search_body([body[:len(body) // 2]], PayloadLimits())
+
+    def test_stdlib_fallback(self):
+        with patch.object(payload, "orjson", None), patch.object(payload, "msgspec", None):
+            self.assertEqual(decode_json(b'{"a": [1, "\\u7b14"]}'), {"a": [1, "笔"]})
+
+
+class TestGetNoteAPIPayload(unittest.TestCase):
+    """
+    测试同步客户端的压缩协商与大响应解析
+    """
+
+    def setUp(self):
+        self.server = StubServer().start()
+        self.env = patch.dict(os.environ, dict(TEST_ENV, GETNOTE_BASE_URL=self.server.base_url,
+                                               GETNOTE_STREAM_PARSE_BYTES="4096", GETNOTE_MAX_CONTENT_CHARS="100"))
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.server.stop()
+
+    def test_gzip_response_parsed_incrementally(self):
+        body = gzip.compress(json.dumps(large_response(), ensure_ascii=False).encode("utf-8"))
+        self.server.enqueue(body=body, headers={"Content-Encoding": "gzip"})
+        # 阈值按传输大小（压缩后）计算
+        with patch.dict(os.environ, {"GETNOTE_STREAM_PARSE_BYTES": str(len(body) // 2)}):
+            api = GetNoteAPI(session=build_session())
+        with patch.object(payload, "SearchResponseParser", wraps=SearchResponseParser) as parser:
+            notes = api.search_notes("测试问题", top_k=None)
+        parser.assert_called_once()
+        self.assertIn("gzip", self.server.requests[-1]["headers"]["Accept-Encoding"])
+        self.assertEqual(len(notes), 201)
+        self.assertIsInstance(notes[1], Note)
+        self.assertEqual(notes[1].id, "0")
+        self.assertEqual(len(notes[1].content), 100 + len(payload.ELLIPSIS))
+        # 连接在读取完响应后回到连接池
+        api.search_notes("测试问题")
+        self.assertEqual(self.server.connections, 1)
+
+    def test_small_response_parsed_at_once(self):
+        api = GetNoteAPI(session=build_session())
+        with patch.object(payload, "SearchResponseParser") as parser:
+            notes = api.search_notes("测试问题")
+        parser.assert_not_called()
+        self.assertEqual(notes[1].title, "测试笔记1")
+
+    def test_accept_encoding_override(self):
+        with patch.dict(os.environ, {"GETNOTE_ACCEPT_ENCODING": "identity"}):
+            api = GetNoteAPI(session=build_session())
+        api.search_notes("测试问题")
+        self.assertEqual(self.server.requests[-1]["headers"]["Accept-Encoding"], "identity")
+
+
+class TestAsyncGetNoteAPIPayload(unittest.IsolatedAsyncioTestCase):
+    """
+    测试异步客户端的大响应解析
+    """
+
+    async def test_stream_parse(self):
+        body = json.dumps(large_response(), ensure_ascii=False).encode("utf-8")
+
+        def handler(request):
+            return httpx.Response(200, content=body)
+
+        env = dict(TEST_ENV, GETNOTE_STREAM_PARSE_BYTES="4096", GETNOTE_MAX_REFS="20")
+        with patch.dict(os.environ, env):
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            api = AsyncGetNoteAPI(client=client)
+            notes = await api.search_notes("测试问题", top_k=50)
+            await client.aclose()
+        self.assertEqual(len(notes), 21)
+        self.assertEqual(notes[0].content, "综合回答")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+from src.generation.memory import ConversationMemoryStore
+from src.pipeline import QAPipeline, format_history
+from src.retrieval.retrieval import RetrievedNotes
+
+
+class TestFormatHistory(unittest.TestCase):
+    """
+    测试历史对话格式化
+    """
+
+    def test_format_history(self):
+        messages = [{'role': 'user', 'content': f'问题{i}'} for i in range(7)]
+        history = format_history(messages)
+        self.assertNotIn('问题1\n', history)
+        self.assertIn('用户: 问题6', history)
+        self.assertEqual(history.count('\n'), 5)
+
+
+class TestQAPipeline(unittest.TestCase):
+    """
+    测试问答流水线
+    """
+
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.generator = Mock()
+        self.generator.prepare_prompt.return_value = 'prompt'
+        self.generator.generate.return_value = {
+            'answer': '无相关笔记', 'references': [], 'has_relevant_notes': False
+        }
+        self.generator.generate_stream.return_value = iter([
+            '回答', '内容', {'answer': '回答内容', 'references': [{'reference_id': '笔记1'}], 'has_relevant_notes': True}
+        ])
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_stages_overlap_retrieval(self):
+        """
+        测试预热与检索并行执行
+        """
+        def slow_retrieve(query, top_k):
+            time.sleep(0.2)
+            return [{'title': '测试笔记1', 'content': '测试内容1'}]
+
+        def slow_warm_up():
+            time.sleep(0.2)
+        self.generator.warm_up.side_effect = slow_warm_up
+
+        pipeline = QAPipeline(generator=self.generator, retrieve=slow_retrieve, executor=self.executor)
+        items = list(pipeline.run_stream('测试查询', [{'role': 'user', 'content': '上一个问题'}]))
+        result = items[-1]
+
+        self.assertEqual(items[:-1], ['回答', '内容'])
+        self.assertEqual(result['answer'], '回答内容')
+        self.assertLess(result['timings']['total'], 0.35)
+        for stage in ('retrieval', 'history', 'prompt_prefix', 'first_token', 'generation', 'total'):
+            self.assertIn(stage, result['timings'])
+        args, kwargs = self.generator.generate_stream.call_args
+        self.assertIn('用户: 上一个问题', args[2])
+        self.assertEqual(kwargs['prompt'], 'prompt')
+
+    def test_warmup_finishing_late(self):
+        """
+        测试不等待的预热在流程结束后才完成时，不影响已返回的耗时统计
+        """
+        def slow_warm_up():
+            time.sleep(0.1)
+        self.generator.warm_up.side_effect = slow_warm_up
+
+        pipeline = QAPipeline(generator=self.generator, retrieve=lambda query, top_k: [{'title': '测试笔记1'}],
+                              executor=self.executor)
+        timings = pipeline.run('测试查询')['timings']
+        time.sleep(0.2)
+        self.assertNotIn('warmup', timings)
+
+    def test_session_memory(self):
+        """
+        测试提供会话 ID 时使用该会话的对话记忆
+        """
+        store = ConversationMemoryStore(window_tokens=1000)
+        self.addCleanup(store.close)
+        pipeline = QAPipeline(generator=self.generator, retrieve=lambda query, top_k: [{'title': '测试笔记1'}],
+                              executor=self.executor, memory_store=store)
+        messages = [{'role': 'user', 'content': f'问题{i}'} for i in range(7)]
+        pipeline.run('测试查询', messages, session_id='s1')
+        args, _ = self.generator.generate_stream.call_args
+        # 窗口按 token 计算，不再只保留最近 5 条
+        self.assertIn('用户: 问题0', args[2])
+        self.generator.prepare_prompt.assert_called_with(args[2])
+
+    def test_no_notes_uses_prepared_answer(self):
+        """
+        测试检索为空时直接返回“无相关笔记”的固定回答，不调用流式生成
+        """
+        pipeline = QAPipeline(generator=self.generator, retrieve=lambda query, top_k: [], executor=self.executor)
+        result = pipeline.run('测试查询')
+        self.assertEqual(result['answer'], '无相关笔记')
+        self.assertEqual(result['notes'], [])
+        self.generator.generate_stream.assert_not_called()
+
+    def test_retrieval_not_queued_behind_pool(self):
+        """
+        测试检索在调用线程上执行，不因线程池被占满而排队
+        """
+        busy = ThreadPoolExecutor(max_workers=1)
+        release = threading.Event()
+        busy.submit(release.wait)
+        self.addCleanup(busy.shutdown)
+        self.addCleanup(release.set)
+        threads = []
+
+        def retrieve(query, top_k):
+            threads.append(threading.current_thread())
+            return []
+
+        pipeline = QAPipeline(generator=self.generator, retrieve=retrieve, executor=busy)
+        result = pipeline.run('测试查询')
+        self.assertEqual(result['answer'], '无相关笔记')
+        self.assertEqual(threads, [threading.current_thread()])
+
+    def test_degraded_retrieval(self):
+        """
+        测试检索降级时使用降级回答，不调用流式生成
+        """
+        self.generator.generate.side_effect = lambda query, notes: {
+            'answer': '服务不可用' if notes.degraded else '无相关笔记', 'references': [],
+            'has_relevant_notes': False, 'degraded': notes.degraded
+        }
+        pipeline = QAPipeline(generator=self.generator, executor=self.executor,
+                              retrieve=lambda query, top_k: RetrievedNotes(degraded=True))
+        result = pipeline.run('测试查询')
+        self.assertEqual(result['answer'], '服务不可用')
+        self.assertTrue(result['degraded'])
+        self.generator.generate_stream.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
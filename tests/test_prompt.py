@@ -0,0 +1,80 @@
+import os
+import unittest
+from unittest.mock import patch
+from src.generation.prompt import INSTRUCTIONS, PromptLayout, prefix_hash
+from src.utils.tokens import count_tokens
+from tests.stub_server import FakeChatCompletions, StubServer
+
+
+class TestPromptLayout(unittest.TestCase):
+    """
+    测试面向前缀缓存的提示布局
+    """
+
+    def setUp(self):
+        self.layout = PromptLayout()
+
+    def test_static_prefix_first_query_last(self):
+        messages = self.layout.template.format_messages(context="笔记内容", history="用户: 上一个问题\n", query="当前问题")
+        self.assertEqual(messages[0].type, "system")
+        self.assertEqual(messages[0].content, INSTRUCTIONS)
+        text = messages[1].content
+        self.assertLess(text.index("笔记内容"), text.index("上一个问题"))
+        self.assertLess(text.index("上一个问题"), text.index("当前问题"))
+
+    def test_follow_up_extends_previous_prompt(self):
+        """
+        测试笔记相同时，上一轮提示中问题之前的部分是本轮提示的前缀
+        """
+        first = self.layout.template.format_messages(context="笔记", history="", query="问题一")[1].content
+        history = "用户: 问题一\n助手: 回答一\n"
+        second = self.layout.template.format_messages(context="笔记", history=history, query="问题二")[1].content
+        stable = first[:first.index("用户问题")].rstrip()
+        self.assertTrue(second.startswith(stable))
+
+    def test_count_tokens(self):
+        messages = self.layout.template.format_messages(context="笔记", history="", query="问题")
+        expected = sum(count_tokens(message.content) for message in messages)
+        self.assertEqual(self.layout.count_tokens(messages), expected)
+
+    def test_hashes(self):
+        self.assertEqual(self.layout.prefix_hash, PromptLayout().prefix_hash)
+        self.assertNotEqual(self.layout.prefix_hash, PromptLayout(instructions="其他要求").prefix_hash)
+        self.assertEqual(self.layout.stable_hash("笔记"), self.layout.stable_hash("笔记"))
+        self.assertNotEqual(self.layout.stable_hash("笔记"), self.layout.stable_hash("其他笔记"))
+        self.assertEqual(len(prefix_hash("x")), 16)
+
+    def test_braces_in_instructions_are_literal(self):
+        layout = PromptLayout(instructions="输出 {json} 格式")
+        messages = layout.template.format_messages(context="", history="", query="问题")
+        self.assertEqual(messages[0].content, "输出 {json} 格式")
+
+
+class TestPromptOverHttp(unittest.TestCase):
+    """
+    测试通过 OpenAI 兼容接口发送的提示布局
+    """
+
+    def test_generator_sends_system_prefix(self):
+        fake = FakeChatCompletions("回答[笔记1]")
+        with StubServer() as server:
+            server.add_route("POST", "/v1/chat/completions", fake.handler)
+            env = {"SILICONFLOW_API_KEY": "test", "SILICONFLOW_API_BASE": f"{server.root_url}/v1",
+                   "SEMANTIC_CACHE_ENABLED": "false"}
+            with patch.dict(os.environ, env):
+                from src.generation.generator import AnswerGenerator
+                generator = AnswerGenerator()
+                notes = [{"id": "1", "title": "笔记", "content": "内容"}]
+                result = generator.generate("问题一", notes)
+                items = list(generator.generate_stream("问题二", notes, "用户: 问题一\n助手: 回答[笔记1]\n"))
+                generator.close()
+        self.assertEqual(result["answer"], "回答[笔记1]")
+        self.assertEqual(items[-1]["answer"], "回答[笔记1]")
+        first, second = (request["messages"] for request in fake.requests)
+        self.assertEqual(first[0], {"role": "system", "content": INSTRUCTIONS})
+        self.assertEqual(second[0], first[0])
+        self.assertTrue(second[1]["content"].startswith(first[1]["content"].split("用户问题")[0].rstrip()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock, patch
+from src.api.get_api import GetNoteAPI
+from src.cache.query_cache import (
+    MemoryBackend, QueryCache, RedisBackend, SQLiteBackend, normalize_query
+)
+
+
+class FakeRedis:
+    """
+    本地 Redis 假实现，只支持缓存后端用到的命令
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            del self.data[key]
+            return None
+        return value
+
+    def set(self, key, value, px=None):
+        self.data[key] = (value, time.time() + px / 1000.0 if px else None)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class TestNormalizeQuery(unittest.TestCase):
+    """
+    测试问题归一化
+    """
+
+    def test_normalize(self):
+        self.assertEqual(normalize_query('  如何通过饮食改善高血压？ '), '如何通过饮食改善高血压')
+        self.assertEqual(normalize_query('如何通过饮食改善高血压?'), '如何通过饮食改善高血压')
+        self.assertEqual(normalize_query('ＡＢＣ  高血压'), 'abc 高血压')
+
+
+class TestBackends(unittest.TestCase):
+    """
+    测试各缓存后端
+    """
+
+    def _check_roundtrip_and_ttl(self, backend):
+        backend.set('a', b'1', ttl=60)
+        self.assertEqual(backend.get('a'), b'1')
+        backend.set('b', b'2', ttl=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(backend.get('b'))
+        backend.delete('a')
+        self.assertIsNone(backend.get('a'))
+
+    def test_memory_backend(self):
+        self._check_roundtrip_and_ttl(MemoryBackend())
+
+    def test_memory_lru_eviction_by_bytes(self):
+        backend = MemoryBackend(max_bytes=25)
+        backend.set('k1', b'x' * 8)
+        backend.set('k2', b'x' * 8)
+        backend.get('k1')  # k1 变为最近使用
+        backend.set('k3', b'x' * 8)
+        self.assertIsNotNone(backend.get('k1'))
+        self.assertIsNone(backend.get('k2'))
+        self.assertLessEqual(backend.current_bytes, 25)
+
+    def test_sqlite_backend(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = SQLiteBackend(os.path.join(tmp, 'cache.sqlite3'))
+            self._check_roundtrip_and_ttl(backend)
+
+    def test_sqlite_eviction_and_persistence(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache.sqlite3')
+            backend = SQLiteBackend(path, max_bytes=25)
+            backend.set('k1', b'x' * 8)
+            time.sleep(0.01)
+            backend.set('k2', b'x' * 8)
+            time.sleep(0.01)
+            backend.set('k3', b'x' * 8)
+            self.assertIsNone(backend.get('k1'))
+            self.assertLessEqual(backend.current_bytes, 25)
+            reopened = SQLiteBackend(path, max_bytes=25)
+            self.assertEqual(reopened.get('k3'), b'x' * 8)
+
+    def test_redis_backend(self):
+        self._check_roundtrip_and_ttl(RedisBackend(FakeRedis()))
+
+
+class TestQueryCacheWithAPI(unittest.TestCase):
+    """
+    测试检索缓存与 GetNoteAPI 的集成
+    """
+
+    def setUp(self):
+        self.env = patch.dict(os.environ, {"API_KEY": "test-key", "KB_ID": "test-kb"})
+        self.env.start()
+        self.session = Mock()
+        self.session.post.return_value.json.return_value = {
+            'c': {'answers': '测试回答', 'refs': [{'title': '测试笔记1', 'content': '测试内容1'}]}
+        }
+
+    def tearDown(self):
+        self.env.stop()
+
+    def test_cache_hit_skips_request(self):
+        """
+        测试归一化后相同的问题只请求一次 API
+        """
+        cache = QueryCache(RedisBackend(FakeRedis()), ttl=60)
+        api = GetNoteAPI(session=self.session, cache=cache)
+        first = api.search_notes('如何通过饮食改善高血压？')
+        second = api.search_notes(' 如何通过饮食改善高血压 ')
+        self.assertEqual(first, second)
+        self.assertEqual(self.session.post.call_count, 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_key_includes_kb_and_flags(self):
+        """
+        测试缓存键区分知识库和检索开关
+        """
+        key = QueryCache.make_key('问题', 'kb1', True, True)
+        self.assertNotEqual(key, QueryCache.make_key('问题', 'kb2', True, True))
+        self.assertNotEqual(key, QueryCache.make_key('问题', 'kb1', False, True))
+        self.assertNotEqual(key, QueryCache.make_key('问题', 'kb1', True, False))
+
+    def test_empty_result_not_cached(self):
+        """
+        测试空结果不写入缓存
+        """
+        self.session.post.return_value.json.return_value = {}
+        cache = QueryCache(MemoryBackend(), ttl=60)
+        api = GetNoteAPI(session=self.session, cache=cache)
+        api.search_notes('测试查询')
+        api.search_notes('测试查询')
+        self.assertEqual(self.session.post.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from src.api.get_api import GetNoteAPI, build_session
+from src.api.rate_limiter import (
+    RateLimiter, RateLimitError, TokenBucket, current_lane, get_rate_limiter, priority_lane
+)
+from src.api.retry import RetryPolicy
+from src.utils.tracing import metrics
+from tests.stub_server import StubServer
+
+TEST_ENV = {"API_KEY": "test-key", "KB_ID": "test-kb", "QUERY_CACHE_BACKEND": "none"}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_refill_and_capacity(self):
+        clock = FakeClock()
+        bucket = TokenBucket(10, 5, clock=clock)
+        self.assertEqual(bucket.wait_time(5), 0.0)
+        bucket.take(5)
+        self.assertAlmostEqual(bucket.wait_time(1), 0.1)
+        clock.now = 10.0
+        # 最多积累到容量
+        self.assertEqual(bucket.refill(), 5)
+
+    def test_cost_above_capacity_waits_for_full_bucket(self):
+        clock = FakeClock()
+        bucket = TokenBucket(10, 5, clock=clock)
+        bucket.take(5)
+        self.assertAlmostEqual(bucket.wait_time(50), 0.5)
+
+
+class TestRateLimiter(unittest.TestCase):
+    """
+    测试限流调度器
+    """
+
+    def test_unlimited_is_free(self):
+        limiter = RateLimiter("test")
+        self.assertFalse(limiter.enabled)
+        self.assertEqual(limiter.acquire(), 0.0)
+
+    def test_requests_per_second(self):
+        limiter = RateLimiter("test", {"requests": TokenBucket(20, 1)})
+        start = time.perf_counter()
+        for _ in range(5):
+            limiter.acquire()
+        self.assertGreaterEqual(time.perf_counter() - start, 0.18)
+
+    def test_interactive_lane_goes_first(self):
+        limiter = RateLimiter("test", {"requests": TokenBucket(10, 1)})
+        limiter.acquire()
+        order = []
+
+        def worker(lane):
+            with priority_lane(lane):
+                limiter.acquire()
+            order.append(lane)
+
+        batch = [threading.Thread(target=worker, args=("batch",)) for _ in range(2)]
+        for thread in batch:
+            thread.start()
+        time.sleep(0.02)
+        interactive = threading.Thread(target=worker, args=("interactive",))
+        interactive.start()
+        for thread in batch + [interactive]:
+            thread.join()
+        self.assertEqual(order[0], "interactive")
+        self.assertIn('rag_rate_limit_wait_seconds_count{lane="batch",limiter="test"}', metrics.render())
+
+    def test_queue_timeout(self):
+        limiter = RateLimiter("test", {"requests": TokenBucket(1, 1)})
+        limiter.acquire()
+        before = metrics.counter_value("rag_rate_limited_total", limiter="test", reason="queue_timeout")
+        with self.assertRaises(RateLimitError):
+            limiter.acquire(timeout=0.05)
+        self.assertEqual(metrics.counter_value("rag_rate_limited_total", limiter="test", reason="queue_timeout"),
+                         before + 1)
+        # 超时的调用已出队，不会阻塞后续调用
+        self.assertEqual(limiter._queue, [])
+
+    def test_charge_creates_debt(self):
+        limiter = RateLimiter("test", {"tokens": TokenBucket(1000, 100)})
+        limiter.acquire(tokens=10)
+        limiter.charge(tokens=190)
+        waited = limiter.acquire(tokens=10)
+        self.assertGreaterEqual(waited, 0.09)
+
+    def test_pause_without_budgets(self):
+        limiter = RateLimiter("test")
+        limiter.pause(0.1)
+        self.assertTrue(limiter.enabled)
+        self.assertGreaterEqual(limiter.acquire(), 0.09)
+        self.assertFalse(limiter.enabled)
+
+    def test_async_acquire(self):
+        limiter = RateLimiter("test", {"requests": TokenBucket(20, 1)})
+
+        async def run():
+            start = time.perf_counter()
+            await asyncio.gather(*(limiter.acquire_async() for _ in range(4)))
+            return time.perf_counter() - start
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.14)
+
+    def test_lane_context(self):
+        self.assertEqual(current_lane(), "interactive")
+        with priority_lane("batch"):
+            self.assertEqual(current_lane(), "batch")
+        with self.assertRaises(ValueError):
+            with priority_lane("unknown"):
+                pass
+
+    @patch.dict(os.environ, {"LLM_RATE_LIMIT": "5", "LLM_TOKENS_PER_MINUTE": "6000"})
+    def test_from_env(self):
+        limiter = get_rate_limiter("llm")
+        self.assertEqual(set(limiter.buckets), {"requests", "tokens"})
+        self.assertEqual(limiter.buckets["tokens"].rate, 100)
+
+
+class TestGetNoteRateLimit(unittest.TestCase):
+    """
+    测试 Get笔记 API 的限流处理
+    """
+
+    def setUp(self):
+        self.server = StubServer().start()
+        self.env = patch.dict(os.environ, dict(TEST_ENV, GETNOTE_BASE_URL=self.server.base_url))
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.server.stop()
+
+    def test_429_raises_rate_limit_error_and_pauses(self):
+        limiter = RateLimiter("getnote-test")
+        api = GetNoteAPI(session=build_session(), retry_policy=RetryPolicy(max_attempts=1, deadline=5.0),
+                         rate_limiter=limiter)
+        self.server.enqueue(status=429, body={"error": "rate limited"}, headers={"Retry-After": "0.1"})
+        with self.assertRaises(RateLimitError):
+            api.search_notes("测试问题")
+        self.assertTrue(limiter.enabled)
+        # 暂停期过后正常放行
+        self.assertTrue(api.search_notes("测试问题"))
+
+    def test_requests_use_limiter(self):
+        limiter = RateLimiter("getnote-test", {"requests": TokenBucket(20, 1)})
+        api = GetNoteAPI(session=build_session(), retry_policy=RetryPolicy(max_attempts=1, deadline=5.0),
+                         rate_limiter=limiter)
+        start = time.perf_counter()
+        for _ in range(4):
+            api.search_notes("测试问题")
+        self.assertGreaterEqual(time.perf_counter() - start, 0.14)
+
+
+class TestLLMRateLimit(unittest.TestCase):
+    """
+    测试 LLM 调用的限流处理
+    """
+
+    def test_429_raises_rate_limit_error(self):
+        with StubServer() as server:
+            server.add_route("POST", "/v1/chat/completions", lambda handler, body: (
+                429, {"error": {"message": "rate limited", "type": "rate_limit"}}, {"retry-after-ms": "10"}, 0.0))
+            env = {"SILICONFLOW_API_KEY": "test", "SILICONFLOW_API_BASE": f"{server.root_url}/v1",
+                   "SEMANTIC_CACHE_ENABLED": "false"}
+            with patch.dict(os.environ, env):
+                from src.generation.generator import AnswerGenerator
+                generator = AnswerGenerator()
+                notes = [{"id": "1", "title": "笔记", "content": "内容"}]
+                with self.assertRaises(RateLimitError):
+                    generator.generate("问题", notes)
+                with self.assertRaises(RateLimitError):
+                    list(generator.generate_stream("问题", notes))
+                generator.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
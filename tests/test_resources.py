@@ -0,0 +1,56 @@
+import os
+import time
+import unittest
+from unittest.mock import Mock, patch
+from src.utils.resources import get_resource, invalidate
+
+
+class TestResources(unittest.TestCase):
+    """
+    测试进程级资源注册表
+    """
+
+    def tearDown(self):
+        invalidate('test_resource')
+
+    def test_reuse_same_object(self):
+        factory = Mock(side_effect=lambda: object())
+        first = get_resource('test_resource', factory)
+        second = get_resource('test_resource', factory)
+        self.assertIs(first, second)
+        self.assertEqual(factory.call_count, 1)
+
+    @patch.dict(os.environ, {'RESOURCE_CLOSE_GRACE': '0.05'})
+    def test_rebuild_on_env_change(self):
+        """
+        测试环境变量变化时重新创建，旧对象在宽限期后关闭
+        """
+        factory = Mock(side_effect=lambda: Mock())
+        with patch.dict(os.environ, {'TEST_RESOURCE_MODEL': 'a'}):
+            first = get_resource('test_resource', factory, ['TEST_RESOURCE_MODEL'])
+        with patch.dict(os.environ, {'TEST_RESOURCE_MODEL': 'b'}):
+            second = get_resource('test_resource', factory, ['TEST_RESOURCE_MODEL'])
+        self.assertIsNot(first, second)
+        # 其他线程可能仍在使用旧对象，不立即关闭
+        first.close.assert_not_called()
+        deadline = time.monotonic() + 5
+        while not first.close.called and time.monotonic() < deadline:
+            time.sleep(0.01)
+        first.close.assert_called_once()
+
+    @patch.dict(os.environ, {'RESOURCE_CLOSE_GRACE': '0'})
+    def test_invalidate(self):
+        factory = Mock(side_effect=lambda: Mock())
+        first = get_resource('test_resource', factory)
+        invalidate('test_resource')
+        second = get_resource('test_resource', factory)
+        self.assertIsNot(first, second)
+        first.close.assert_called_once()
+
+    @patch.dict(os.environ, {'SILICONFLOW_API_KEY': 'test-key'})
+    def test_answer_generator_shared(self):
+        from src.generation.generator import get_answer_generator
+        self.assertIs(get_answer_generator(), get_answer_generator())
+
+if __name__ == '__main__':
+    unittest.main()
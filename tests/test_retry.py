@@ -0,0 +1,147 @@
+import asyncio
+import os
+import time
+import unittest
+from unittest.mock import patch
+import httpx
+from src.api.get_api import AsyncGetNoteAPI, GetNoteAPI, build_session
+from src.api.retry import LatencyTracker, RetryPolicy
+from tests.stub_server import StubServer, make_search_response
+
+TEST_ENV = {"API_KEY": "test-key", "KB_ID": "test-kb", "QUERY_CACHE_BACKEND": "none"}
+
+
+class TestRetryPolicy(unittest.TestCase):
+    """
+    测试重试策略本身
+    """
+
+    def test_backoff_bounded(self):
+        policy = RetryPolicy(base_delay=0.5, max_delay=2.0)
+        for attempt in range(10):
+            self.assertLessEqual(policy.backoff(attempt), 2.0)
+
+    def test_latency_tracker_quantile(self):
+        tracker = LatencyTracker(min_samples=5)
+        self.assertIsNone(tracker.quantile(0.95))
+        for value in range(1, 101):
+            tracker.record(value / 100)
+        self.assertAlmostEqual(tracker.quantile(0.95), 0.96)
+
+
+class TestRetryAgainstStubServer(unittest.TestCase):
+    """
+    使用注入慢响应和错误响应的本地桩服务测试重试与对冲
+    """
+
+    def setUp(self):
+        self.server = StubServer().start()
+        self.env = patch.dict(os.environ, dict(TEST_ENV, GETNOTE_BASE_URL=self.server.base_url))
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.server.stop()
+
+    def _api(self, **policy):
+        policy.setdefault('base_delay', 0.01)
+        policy.setdefault('deadline', 5.0)
+        return GetNoteAPI(session=build_session(), retry_policy=RetryPolicy(**policy))
+
+    def test_retry_on_5xx(self):
+        self.server.enqueue(status=503, body={'error': 'busy'})
+        self.server.enqueue(status=502, body={'error': 'bad gateway'})
+        result = self._api().search_notes('测试查询')
+        self.assertEqual(result[0]['content'], '这是一个测试回答')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_retry_after_on_429(self):
+        self.server.enqueue(status=429, body={'error': 'rate limited'}, headers={'Retry-After': '0'})
+        self._api(base_delay=5.0).search_notes('测试查询')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_no_retry_on_4xx(self):
+        self.server.enqueue(status=400, body={'error': 'bad request'})
+        with self.assertRaises(RuntimeError):
+            self._api().search_notes('测试查询')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_attempts_exhausted(self):
+        for _ in range(3):
+            self.server.enqueue(status=500, body={'error': 'boom'})
+        with self.assertRaises(RuntimeError):
+            self._api(max_attempts=3).search_notes('测试查询')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_deadline(self):
+        """
+        测试慢响应在总截止时间内失败，而不是等满读取超时
+        """
+        self.server.enqueue(delay=2.0)
+        start = time.monotonic()
+        with self.assertRaises(RuntimeError):
+            self._api(deadline=0.3, max_attempts=1).search_notes('测试查询')
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_hedged_request(self):
+        """
+        测试首个请求过慢时对冲请求先返回
+        """
+        self.server.enqueue(delay=2.0, body=make_search_response('慢回答'))
+        self.server.enqueue(body=make_search_response('快回答'))
+        api = self._api(hedge_enabled=True, hedge_delay=0.1)
+        start = time.monotonic()
+        result = api.search_notes('测试查询')
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(result[0]['content'], '快回答')
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_no_hedge_when_fast(self):
+        api = self._api(hedge_enabled=True, hedge_delay=1.0)
+        api.search_notes('测试查询')
+        self.assertEqual(len(self.server.requests), 1)
+
+
+class TestAsyncRetry(unittest.IsolatedAsyncioTestCase):
+    """
+    测试异步客户端的重试与对冲
+    """
+
+    def setUp(self):
+        self.env = patch.dict(os.environ, TEST_ENV)
+        self.env.start()
+        self.responses = []
+        self.cancelled = 0
+
+    def tearDown(self):
+        self.env.stop()
+
+    async def _handler(self, request):
+        status, delay, answer = self.responses.pop(0) if self.responses else (200, 0, '回答')
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return httpx.Response(status, json=make_search_response(answer))
+
+    def _api(self, **policy):
+        policy.setdefault('base_delay', 0.01)
+        policy.setdefault('deadline', 5.0)
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self._handler))
+        return AsyncGetNoteAPI(client=client, retry_policy=RetryPolicy(**policy))
+
+    async def test_retry_on_5xx(self):
+        self.responses = [(503, 0, ''), (200, 0, '重试成功')]
+        result = await self._api().search_notes('测试查询')
+        self.assertEqual(result[0]['content'], '重试成功')
+
+    async def test_hedge_cancels_loser(self):
+        self.responses = [(200, 2.0, '慢回答'), (200, 0, '快回答')]
+        result = await self._api(hedge_enabled=True, hedge_delay=0.05).search_notes('测试查询')
+        self.assertEqual(result[0]['content'], '快回答')
+        await asyncio.sleep(0)
+        self.assertEqual(self.cancelled, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import json
+import os
+import unittest
+from unittest.mock import patch
+from src.api.get_api import AI_ANSWER_SOURCE, GetNoteAPI, build_search_payload, build_session
+from src.api.models import Note
+from src.cache.query_cache import MemoryBackend, QueryCache
+from src.retrieval.retrieval import retrieve_notes
+from src.retrieval.router import ModeRouter, get_retrieval_mode
+from src.utils.tracing import metrics
+from tests.stub_server import StubServer, make_search_response
+
+TEST_ENV = {"API_KEY": "test-key", "KB_ID": "test-kb", "QUERY_CACHE_BACKEND": "none",
+            "SEMANTIC_CACHE_ENABLED": "false", "SINGLE_FLIGHT_ENABLED": "false"}
+
+
+def notes(*scores):
+    return [Note(title="AI 综合回答", content="回答", source=AI_ANSWER_SOURCE)] + [
+        Note(title=f"笔记{i}", content="内容", relevance_score=score) for i, score in enumerate(scores)]
+
+
+class TestSearchModes(unittest.TestCase):
+    """
+    测试检索模式对应的请求参数
+    """
+
+    def setUp(self):
+        self.server = StubServer().start()
+        self.env = patch.dict(os.environ, dict(TEST_ENV, GETNOTE_BASE_URL=self.server.base_url))
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.server.stop()
+
+    def test_payload(self):
+        self.assertFalse(build_search_payload("问题", "kb", "fast")["deep_seek"])
+        self.assertTrue(build_search_payload("问题", "kb")["deep_seek"])
+        with self.assertRaises(ValueError):
+            build_search_payload("问题", "kb", "balanced")
+
+    def test_mode_and_top_k_sent_and_applied(self):
+        refs = [{"title": f"笔记{i}", "content": f"内容{i}"} for i in range(5)]
+        self.server.enqueue(body=make_search_response("回答", refs))
+        api = GetNoteAPI(session=build_session())
+        result = api.search_notes("测试问题", top_k=2, mode="fast")
+        self.assertEqual([note.title for note in result[1:]], ["笔记0", "笔记1"])
+        self.assertFalse(json.loads(self.server.requests[-1]["body"])["deep_seek"])
+
+    def test_cache_key_includes_mode_and_top_k(self):
+        api = GetNoteAPI(session=build_session(), cache=QueryCache(MemoryBackend(1024 * 1024), ttl=60))
+        api.search_notes("测试问题", mode="fast")
+        api.search_notes("测试问题", mode="fast")
+        api.search_notes("测试问题", mode="deep")
+        api.search_notes("测试问题", top_k=5, mode="deep")
+        self.assertEqual(len(self.server.requests), 3)
+
+
+class TestModeRouter(unittest.TestCase):
+    """
+    测试 balanced 模式的升级策略与统计
+    """
+
+    def setUp(self):
+        self.router = ModeRouter(min_hits=2, threshold=0.7)
+        self.calls = []
+
+    def search(self, results):
+        def search(mode):
+            self.calls.append(mode)
+            result = results[mode]
+            if isinstance(result, Exception):
+                raise result
+            return result
+        return search
+
+    def test_fast_result_sufficient(self):
+        result = self.router.search("balanced", self.search({"fast": notes(0.9, 0.8)}), 3)
+        self.assertEqual(len(result), 3)
+        self.assertEqual(self.calls, ["fast"])
+
+    def test_escalates_when_low_confidence(self):
+        before = metrics.counter_value("rag_search_escalations_total", reason="low_confidence")
+        deep = notes(0.9, 0.9, 0.9)
+        result = self.router.search("balanced", self.search({"fast": notes(0.9, 0.3), "deep": deep}), 3)
+        self.assertIs(result, deep)
+        self.assertEqual(self.calls, ["fast", "deep"])
+        self.assertEqual(metrics.counter_value("rag_search_escalations_total", reason="low_confidence"), before + 1)
+        stats = self.router.snapshot()
+        self.assertEqual((stats["fast"]["low_confidence"], stats["fast"]["escalations"]), (1, 1))
+        self.assertEqual(stats["deep"]["calls"], 1)
+        self.assertIsNotNone(stats["deep"]["p95"])
+
+    def test_escalates_when_empty(self):
+        self.assertEqual(self.router.assess(notes(), 3), "empty")
+        # top_k 小于 min_hits 时只要求 top_k 条
+        self.assertIsNone(self.router.assess(notes(0.9), 1))
+
+    def test_deep_failure_falls_back_to_fast(self):
+        fast = notes(0.5)
+        result = self.router.search("balanced", self.search({"fast": fast, "deep": RuntimeError("超时")}), 3)
+        self.assertIs(result, fast)
+        with self.assertRaises(RuntimeError):
+            self.router.search("balanced", self.search({"fast": [], "deep": RuntimeError("超时")}), 3)
+
+    def test_fixed_modes(self):
+        self.router.search("deep", self.search({"deep": notes()}), 3)
+        self.assertEqual(self.calls, ["deep"])
+        self.assertEqual(self.router.snapshot()["deep"]["empty"], 1)
+
+    def test_mode_from_env(self):
+        with patch.dict(os.environ, {"RETRIEVAL_MODE": "Balanced"}):
+            self.assertEqual(get_retrieval_mode(), "balanced")
+            self.assertEqual(get_retrieval_mode("fast"), "fast")
+        with self.assertRaises(ValueError):
+            get_retrieval_mode("slow")
+
+
+class TestRetrieveWithModes(unittest.TestCase):
+    """
+    测试 retrieve_notes 按检索模式调用 API
+    """
+
+    @patch.dict(os.environ, dict(TEST_ENV, RETRIEVAL_MODE="balanced", RETRIEVAL_ESCALATE_MIN_HITS="1"))
+    @patch("src.retrieval.retrieval.get_client")
+    def test_balanced_escalates(self, mock_get_client):
+        search = mock_get_client.return_value.search_notes
+        search.side_effect = lambda query, top_k, mode: [] if mode == "fast" else [
+            {"title": "家庭血压计校准", "content": "电子血压计每年需要校准一次", "source": "原始笔记片段"}]
+        result = retrieve_notes("血压计校准", 3)
+        self.assertEqual([call.kwargs["mode"] for call in search.call_args_list], ["fast", "deep"])
+        self.assertEqual(result[0]["title"], "家庭血压计校准")
+        self.assertFalse(result.degraded)
+
+    @patch.dict(os.environ, dict(TEST_ENV, RETRIEVAL_MODE="balanced", RETRIEVAL_ESCALATE_MIN_HITS="1"))
+    @patch("src.retrieval.retrieval.get_client")
+    def test_good_fast_result_not_escalated(self, mock_get_client):
+        """
+        测试接口返回的正常结果不因融合后的覆盖比例低于阈值而升级
+        """
+        search = mock_get_client.return_value.search_notes
+        search.return_value = [
+            {"title": "AI 综合回答", "content": "建议每年校准一次", "source": AI_ANSWER_SOURCE},
+            {"title": "血压测量记录", "content": "电子设备每年需要到医院检定一次", "source": "原始笔记片段"},
+        ]
+        result = retrieve_notes("家用血压计多久需要校准", 3)
+        self.assertEqual([call.kwargs["mode"] for call in search.call_args_list], ["fast"])
+        # 融合后补上的覆盖比例低于阈值，但不影响升级判断
+        self.assertLess(result[1]["relevance_score"], 0.7)
+
+
+class TestAsyncModeRouter(unittest.IsolatedAsyncioTestCase):
+    """
+    测试异步检索的模式路由
+    """
+
+    async def test_asearch(self):
+        router = ModeRouter(min_hits=1)
+        calls = []
+
+        async def search(mode):
+            calls.append(mode)
+            return notes() if mode == "fast" else notes(0.9)
+
+        result = await router.asearch("balanced", search, 3)
+        self.assertEqual(calls, ["fast", "deep"])
+        self.assertEqual(len(result), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import AsyncMock, patch
+import numpy as np
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from src.cache.semantic_cache import SemanticCache, get_semantic_cache
+from src.utils.embedding import HashingVectorizer
+
+
+class TestHashingVectorizer(unittest.TestCase):
+    """
+    测试哈希向量化器
+    """
+
+    def test_deterministic_and_normalized(self):
+        vectorizer = HashingVectorizer(dim=256)
+        a = vectorizer.embed('如何通过饮食改善高血压？')
+        b = vectorizer.embed('如何通过饮食改善高血压？')
+        self.assertTrue(np.array_equal(a, b))
+        self.assertAlmostEqual(float(np.linalg.norm(a)), 1.0, places=5)
+        self.assertEqual(vectorizer.embed_many(['a', 'b']).shape, (2, 256))
+
+
+class TestSemanticCache(unittest.TestCase):
+    """
+    测试语义缓存
+    """
+
+    def test_paraphrase_hit(self):
+        cache = SemanticCache(threshold=0.7)
+        cache.store('如何通过饮食改善高血压？', 'A', latency=2.0)
+        self.assertEqual(cache.lookup('怎样通过饮食改善高血压'), 'A')
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['saved_seconds'], 2.0)
+
+    def test_reworded_paraphrase_hit(self):
+        """
+        测试增删个别实词的改写问题仍然命中
+        """
+        cache = SemanticCache(threshold=0.7)
+        cache.store('高血压患者如何通过饮食控制血压？', 'A')
+        self.assertEqual(cache.lookup('高血压患者怎样用饮食来控制血压'), 'A')
+        self.assertEqual(cache.lookup('高血压患者如何通过日常饮食控制血压'), 'A')
+        self.assertIsNone(cache.lookup('高血压患者如何通过运动控制血压'))
+
+    def test_different_keyword_miss(self):
+        """
+        测试只差一个关键字的问题不会误命中
+        """
+        cache = SemanticCache(threshold=0.7)
+        cache.store('如何通过饮食改善高血压？', 'A')
+        self.assertIsNone(cache.lookup('如何通过饮食改善高血糖？'))
+        self.assertIsNone(cache.lookup('糖尿病患者能吃水果吗'))
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_fingerprint_mismatch_miss(self):
+        cache = SemanticCache(threshold=0.7)
+        cache.store('如何通过饮食改善高血压？', 'A', fingerprint='notes-1')
+        self.assertIsNone(cache.lookup('如何通过饮食改善高血压？', 'notes-2'))
+        self.assertIsNone(cache.lookup('如何通过饮食改善高血压？'))
+        self.assertEqual(cache.lookup('怎样通过饮食改善高血压', 'notes-1'), 'A')
+
+    def test_ring_buffer_eviction(self):
+        cache = SemanticCache(threshold=0.7, max_entries=2)
+        cache.store('高血压饮食', 'A')
+        cache.store('糖尿病运动', 'B')
+        cache.store('失眠调理', 'C')
+        self.assertIsNone(cache.lookup('高血压饮食'))
+        self.assertEqual(cache.lookup('失眠调理'), 'C')
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_disabled_by_default(self):
+        with patch.dict(os.environ, {'SEMANTIC_CACHE_ENABLED': 'false'}):
+            self.assertIsNone(get_semantic_cache('notes'))
+
+
+class TestSemanticCacheShortCircuit(unittest.TestCase):
+    """
+    测试语义缓存跳过检索和生成
+    """
+
+    def setUp(self):
+        self.env = patch.dict(os.environ, {
+            'SEMANTIC_CACHE_ENABLED': 'true', 'SIMILARITY_THRESHOLD': '0.75',
+            'SILICONFLOW_API_KEY': 'test-key', 'KB_ID': 'test-kb',
+        })
+        self.env.start()
+        get_semantic_cache('notes:test-kb').clear()
+        get_semantic_cache('answers').clear()
+
+    def tearDown(self):
+        self.env.stop()
+
+    @patch('src.retrieval.retrieval.get_client')
+    def test_retrieve_notes(self, mock_get_client):
+        from src.retrieval.retrieval import retrieve_notes
+        mock_get_client.return_value.search_notes.return_value = [{'title': '测试笔记1', 'content': '测试内容1'}]
+        first = retrieve_notes('如何通过饮食改善高血压？')
+        second = retrieve_notes('怎样通过饮食改善高血压')
+        self.assertEqual(first, second)
+        self.assertEqual(mock_get_client.return_value.search_notes.call_count, 1)
+        # top_k 或检索模式不同时不复用
+        retrieve_notes('怎样通过饮食改善高血压', top_k=10)
+        retrieve_notes('怎样通过饮食改善高血压', mode='fast')
+        self.assertEqual(mock_get_client.return_value.search_notes.call_count, 3)
+
+    @patch('src.retrieval.retrieval.get_async_client')
+    def test_retrieve_notes_async(self, mock_get_client):
+        from src.retrieval.retrieval import retrieve_notes_async
+        search = mock_get_client.return_value.search_notes = AsyncMock(
+            return_value=[{'title': '测试笔记1', 'content': '测试内容1'}])
+        first = asyncio.run(retrieve_notes_async('如何通过饮食改善高血压？'))
+        second = asyncio.run(retrieve_notes_async('怎样通过饮食改善高血压'))
+        self.assertEqual(first, second)
+        self.assertEqual(search.call_count, 1)
+
+    @patch('src.generation.generator.ChatOpenAI')
+    def test_generate(self, mock_chat):
+        from src.generation.generator import AnswerGenerator
+        llm = FakeListChatModel(responses=['回答一', '回答二', '回答三', '回答四'])
+        mock_chat.return_value = llm
+        generator = AnswerGenerator()
+        notes = [{'title': '测试笔记1', 'content': '测试内容1'}]
+        first = generator.generate('如何通过饮食改善高血压？', notes)
+        second = generator.generate('怎样通过饮食改善高血压', notes)
+        self.assertEqual(first['answer'], '回答一')
+        self.assertEqual(second['answer'], '回答一')
+        # 有历史对话的追问不复用缓存
+        third = generator.generate('怎样通过饮食改善高血压', notes, history='用户: 我有糖尿病\n')
+        self.assertEqual(third['answer'], '回答二')
+        # 检索到的笔记或提示模板不同时不复用
+        other_notes = [{'title': '测试笔记2', 'content': '测试内容2'}]
+        self.assertEqual(generator.generate('怎样通过饮食改善高血压', other_notes)['answer'], '回答三')
+        generator.layout.version = 'changed'
+        self.assertEqual(generator.generate('怎样通过饮食改善高血压', notes)['answer'], '回答四')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from src.cache.single_flight import SingleFlight, make_key, notes_hash
+from src.retrieval import retrieval
+from src.retrieval.retrieval import RetrievedNotes
+from src.utils.resources import invalidate
+from tests.stub_server import FakeChatCompletions, StubServer
+
+
+def run_concurrently(fn, count):
+    results = [None] * count
+    errors = [None] * count
+
+    def worker(i):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+class TestSingleFlight(unittest.TestCase):
+    """
+    测试在途请求合并
+    """
+
+    def setUp(self):
+        self.flight = SingleFlight("test")
+        self.calls = 0
+
+    def slow(self, value=None, delay=0.1):
+        def fn():
+            self.calls += 1
+            time.sleep(delay)
+            return value if value is not None else {"answer": "回答"}
+        return fn
+
+    def test_concurrent_calls_share_one_execution(self):
+        results, errors = run_concurrently(lambda: self.flight.do("k", self.slow()), 8)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(errors, [None] * 8)
+        self.assertTrue(all(result == {"answer": "回答"} for result in results))
+        self.assertEqual(self.flight.coalesced, 7)
+        # 等待者得到的是拷贝
+        results[1]["answer"] = "被修改"
+        self.assertEqual(sum(result["answer"] == "回答" for result in results), 7)
+
+    def test_error_shared(self):
+        def fail():
+            self.calls += 1
+            time.sleep(0.05)
+            raise RuntimeError("服务异常")
+
+        _, errors = run_concurrently(lambda: self.flight.do("k", fail), 4)
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(isinstance(error, RuntimeError) for error in errors))
+
+    def test_no_result_kept_after_completion(self):
+        self.flight.do("k", self.slow(delay=0))
+        self.flight.do("k", self.slow(delay=0))
+        self.assertEqual(self.calls, 2)
+
+    def test_different_keys_not_merged(self):
+        run_concurrently(lambda: self.flight.do(str(threading.get_ident()), self.slow(delay=0.05)), 3)
+        self.assertEqual(self.calls, 3)
+
+    def test_stream_broadcast(self):
+        def produce():
+            self.calls += 1
+            for i in range(5):
+                time.sleep(0.01)
+                yield f"片段{i}"
+            yield {"answer": "完整回答"}
+
+        leader = self.flight.stream("k", produce)
+        # 领头的调用方读到一半就放弃，不影响其他订阅者
+        self.assertEqual(next(leader), "片段0")
+        leader.close()
+        results, _ = run_concurrently(lambda: list(self.flight.stream("k", produce)), 3)
+        self.assertEqual(self.calls, 1)
+        for items in results:
+            self.assertEqual(items, [f"片段{i}" for i in range(5)] + [{"answer": "完整回答"}])
+
+    def test_stream_error(self):
+        def produce():
+            yield "片段"
+            raise RuntimeError("中断")
+
+        with self.assertRaises(RuntimeError):
+            list(self.flight.stream("k", produce))
+
+    def test_cross_process_lock(self):
+        directory = tempfile.mkdtemp()
+        try:
+            # 两个独立的合并器模拟两个进程，通过文件锁和结果文件合并
+            first = SingleFlight("test", lock_dir=directory)
+            second = SingleFlight("test", lock_dir=directory)
+            results = {}
+            thread = threading.Thread(target=lambda: results.update(first=first.do("k", self.slow([1, 2], 0.2))))
+            thread.start()
+            time.sleep(0.05)
+            results["second"] = second.do("k", self.slow([3], 0))
+            thread.join()
+            self.assertEqual(self.calls, 1)
+            self.assertEqual(results, {"first": [1, 2], "second": [1, 2]})
+            self.assertEqual(second.coalesced, 1)
+            # 之前完成的结果不会被之后的调用使用
+            self.assertEqual(second.do("k", self.slow([3], 0)), [3])
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def test_keys(self):
+        self.assertEqual(make_key("如何控制血压？", 3), make_key(" 如何控制血压", 3))
+        self.assertNotEqual(make_key("如何控制血压", 3), make_key("如何控制血压", 5))
+        notes = [{"id": "1", "title": "标题", "content": "内容"}]
+        self.assertEqual(notes_hash(notes), notes_hash([dict(notes[0], relevance_score=0.9)]))
+        self.assertNotEqual(notes_hash(notes), notes_hash([dict(notes[0], content="其他内容")]))
+
+
+class TestCoalescedCallers(unittest.TestCase):
+    """
+    测试检索和生成的请求合并
+    """
+
+    def setUp(self):
+        invalidate()
+
+    def tearDown(self):
+        invalidate()
+
+    def test_retrieve_notes(self):
+        calls = []
+
+        def slow_retrieve(query, top_k, mode):
+            calls.append(query)
+            time.sleep(0.1)
+            return RetrievedNotes([{"title": "笔记", "content": "内容"}], degraded=True, reason="本地")
+
+        with patch.object(retrieval, "_retrieve_notes", slow_retrieve), \
+                patch.dict(os.environ, {"KB_ID": "test-kb", "SINGLE_FLIGHT_ENABLED": "true"}):
+            results, _ = run_concurrently(lambda: retrieval.retrieve_notes("如何控制血压", 3), 5)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result.degraded for result in results))
+
+    def test_generate(self):
+        fake = FakeChatCompletions("回答[笔记1]")
+
+        def slow_handler(handler, body):
+            status, payload, headers, _ = fake.handler(handler, body)
+            return status, payload, headers, 0.2
+
+        with StubServer() as server:
+            server.add_route("POST", "/v1/chat/completions", slow_handler)
+            env = {"SILICONFLOW_API_KEY": "test", "SILICONFLOW_API_BASE": f"{server.root_url}/v1",
+                   "SEMANTIC_CACHE_ENABLED": "false", "SINGLE_FLIGHT_ENABLED": "true"}
+            with patch.dict(os.environ, env):
+                from src.generation.generator import AnswerGenerator
+                generator = AnswerGenerator()
+                notes = [{"id": "1", "title": "笔记", "content": "内容"}]
+                results, errors = run_concurrently(lambda: generator.generate("问题", notes), 4)
+                streams, _ = run_concurrently(lambda: list(generator.generate_stream("问题", notes)), 4)
+                generator.close()
+        self.assertEqual(errors, [None] * 4)
+        self.assertEqual(len(fake.requests), 2)
+        self.assertTrue(all(result["answer"] == "回答[笔记1]" for result in results))
+        self.assertTrue(all(items[-1]["answer"] == "回答[笔记1]" for items in streams))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from src.api.get_api import GetNoteAPI, build_session
+from src.utils.logger import RequestIdFilter
+from src.utils.tokens import count_tokens
+from src.utils.tracing import (
+    MetricsRegistry, MetricsServer, bind_context, get_request_id, record_tokens, span, start_trace
+)
+from tests.stub_server import StubServer
+
+
+class TestTracing(unittest.TestCase):
+    """
+    测试请求追踪
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'traces.jsonl')
+        self.env = patch.dict(os.environ, {"TRACE_EXPORT_PATH": self.path, "TRACING_ENABLED": "true"})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmpdir.cleanup()
+
+    def _exported(self):
+        with open(self.path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_spans_and_tokens_exported(self):
+        with start_trace(request_id='req-1') as trace:
+            with span('retrieve', top_k=3) as attrs:
+                attrs['notes'] = 2
+            record_tokens('prompt', 10)
+            record_tokens('completion', 5)
+        self.assertIsNone(get_request_id())
+
+        [record] = self._exported()
+        self.assertEqual(record['request_id'], 'req-1')
+        self.assertEqual(record['status'], 'ok')
+        self.assertEqual(record['tokens'], {'prompt': 10, 'completion': 5})
+        self.assertEqual(record['spans'][0]['name'], 'retrieve')
+        self.assertEqual(record['spans'][0]['attrs'], {'top_k': 3, 'notes': 2})
+        self.assertGreaterEqual(trace.duration, record['spans'][0]['duration'])
+
+    def test_request_id_propagates_to_threads(self):
+        with ThreadPoolExecutor(max_workers=2) as executor, start_trace() as trace:
+            def stage():
+                with span('pipeline.retrieval'):
+                    return get_request_id()
+            request_ids = [executor.submit(bind_context(stage)).result() for _ in range(2)]
+        self.assertEqual(request_ids, [trace.request_id] * 2)
+        self.assertEqual(len(self._exported()[0]['spans']), 2)
+
+    def test_error_status(self):
+        with self.assertRaises(ValueError):
+            with start_trace():
+                with span('llm.call'):
+                    raise ValueError('失败')
+        [record] = self._exported()
+        self.assertEqual(record['status'], 'error')
+        self.assertEqual(record['spans'][0]['attrs']['error'], 'ValueError')
+
+    def test_log_records_carry_request_id(self):
+        record = logging.LogRecord('test', logging.INFO, __file__, 1, 'msg', None, None)
+        with start_trace(request_id='req-log'):
+            RequestIdFilter().filter(record)
+        self.assertEqual(record.request_id, 'req-log')
+
+    def test_request_id_header(self):
+        with StubServer() as server, patch.dict(os.environ, {
+            "API_KEY": "test-key", "KB_ID": "test-kb", "QUERY_CACHE_BACKEND": "none",
+            "GETNOTE_BASE_URL": server.base_url,
+        }):
+            api = GetNoteAPI(session=build_session())
+            with start_trace(request_id='req-api'):
+                api.search_notes('测试查询')
+        self.assertEqual(server.requests[0]['headers'].get('X-Request-ID'), 'req-api')
+        names = [item['name'] for item in self._exported()[0]['spans']]
+        self.assertIn('getnote.request', names)
+        self.assertIn('getnote.parse', names)
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    测试 Prometheus 文本格式指标
+    """
+
+    def test_render(self):
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        registry.inc('rag_requests_total', status='ok')
+        registry.observe('rag_span_duration_seconds', 0.5, span='retrieve')
+        text = registry.render()
+        self.assertIn('# TYPE rag_requests_total counter', text)
+        self.assertIn('rag_requests_total{status="ok"} 1', text)
+        self.assertIn('rag_span_duration_seconds_bucket{span="retrieve",le="0.1"} 0', text)
+        self.assertIn('rag_span_duration_seconds_bucket{span="retrieve",le="1"} 1', text)
+        self.assertIn('rag_span_duration_seconds_bucket{span="retrieve",le="+Inf"} 1', text)
+        self.assertIn('rag_span_duration_seconds_count{span="retrieve"} 1', text)
+
+    def test_metrics_endpoint(self):
+        registry = MetricsRegistry()
+        registry.inc('rag_tokens_total', 42, kind='prompt')
+        server = MetricsServer(port=0, registry=registry)
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{server.port}/metrics') as response:
+                body = response.read().decode('utf-8')
+        finally:
+            server.close()
+        self.assertIn('rag_tokens_total{kind="prompt"} 42', body)
+
+
+class TestCountTokens(unittest.TestCase):
+    """
+    测试 token 估算
+    """
+
+    @patch.dict(os.environ, {"TOKENIZER_ENCODING": ""})
+    def test_estimate(self):
+        self.assertEqual(count_tokens(''), 0)
+        self.assertEqual(count_tokens('高血压'), 3)
+        self.assertEqual(count_tokens('abcdefgh 高'), 3)
+
+if __name__ == '__main__':
+    unittest.main()